@@ -3,8 +3,22 @@ from django.contrib.auth.admin import UserAdmin
 from .models import (
     User, Doctor, Patient, Service, 
     Appointment, MedicalRecord, 
-    TelegramAuthToken, DoctorAccessCode, ServiceCategory
+    TelegramAuthToken, DoctorAccessCode, ServiceCategory, TelegramMessage, DoctorDailyStats,
+    DoctorSchedule, DoctorTimeOff, ImageJob
 )
+from . import search
+
+
+class IndexedSearchMixin:
+    """Поиск в списке админки через полнотекстовый индекс вместо LIKE по полям"""
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        ids = search.object_ids(self.search_kind, search_term) if search_term else None
+        if ids is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=ids), False
+
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -21,11 +35,21 @@ class CustomUserAdmin(UserAdmin):
         }),
     )
 
+class DoctorScheduleInline(admin.TabularInline):
+    model = DoctorSchedule
+    extra = 0
+
+class DoctorTimeOffInline(admin.TabularInline):
+    model = DoctorTimeOff
+    extra = 0
+
 @admin.register(Doctor)
-class DoctorAdmin(admin.ModelAdmin):
+class DoctorAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    search_kind = search.DOCTOR
     list_display = ('full_name', 'specialization', 'room', 'is_active')
     list_filter = ('specialization', 'is_active')
     search_fields = ('user__first_name', 'user__last_name', 'specialization')
+    inlines = [DoctorScheduleInline, DoctorTimeOffInline]
     
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
@@ -33,7 +57,8 @@ class PatientAdmin(admin.ModelAdmin):
     search_fields = ('user__first_name', 'user__last_name', 'phone')
 
 @admin.register(Service)
-class ServiceAdmin(admin.ModelAdmin):
+class ServiceAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    search_kind = search.SERVICE
     list_display = ['name', 'category', 'price', 'duration', 'is_popular', 'is_active']
     list_filter = ['category', 'is_popular', 'is_active']
     search_fields = ['name', 'description']
@@ -56,6 +81,25 @@ class TelegramAuthTokenAdmin(admin.ModelAdmin):
     list_display = ('token', 'telegram_id', 'role', 'is_used', 'expires_at')
     list_filter = ('is_used', 'role')
 
+@admin.register(TelegramMessage)
+class TelegramMessageAdmin(admin.ModelAdmin):
+    list_display = ('chat_id', 'status', 'attempts', 'latency_ms', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('chat_id',)
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('source', 'model', 'object_id', 'status', 'created_at', 'processed_at')
+    list_filter = ('status', 'model')
+    search_fields = ('source',)
+
+@admin.register(DoctorDailyStats)
+class DoctorDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'day', 'total', 'pending', 'confirmed', 'completed', 'cancelled')
+    list_filter = ('day',)
+    list_select_related = ('doctor__user',)
+    readonly_fields = ('doctor', 'day', 'total', 'pending', 'confirmed', 'completed', 'cancelled')
+
 @admin.register(DoctorAccessCode)
 class DoctorAccessCodeAdmin(admin.ModelAdmin):
     list_display = ('code', 'created_by', 'is_used', 'expires_at')
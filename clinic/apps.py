@@ -4,3 +4,5 @@ class ClinicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinic'
     
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,268 @@
+"""Сборка и раздача статики
+
+С STATIC_BUILD=1 команда collectstatic собирает статику для продакшена:
+
+    - склеивает исходники страниц в бандлы BUNDLES (CSS еще и сжимается
+      minify_css(); JS только склеивается - безопасного минификатора
+      без сторонних пакетов нет)
+    - дает всем файлам имена с хэшем содержимого (ManifestStaticFilesStorage),
+      ссылки url() в CSS переписываются на них же
+    - кладет рядом сжатые копии .gz и, если установлен пакет brotli, .br
+
+Шаблоны подключают бандлы тегом {% bundle %} (templatetags/bundles.py):
+без сборки он выводит исходники по одному, так что для разработки
+collectstatic не нужен.
+
+StaticAssetMiddleware раздает STATIC_ROOT без nginx: сжатую копию
+по Accept-Encoding и файлы с хэшем в имени - с Cache-Control immutable
+на год. Список файлов читается при запуске: после collectstatic процесс
+нужно перезапустить.
+"""
+import gzip
+import logging
+import mimetypes
+import os
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Бандл -> исходники в порядке подключения. Бандлы лежат на той же глубине,
+# что и css/ и js/, поэтому относительные url() в исходниках остаются верными.
+BUNDLES = {
+    'bundles/site.css': ['css/style.css', 'css/theme.css'],
+    'bundles/site.js': ['js/main.js'],
+    'bundles/doctor_list.css': ['css/doctor_list.css'],
+    'bundles/service_list.css': ['css/service_list.css'],
+    'bundles/form.css': ['css/form_appointment.css'],
+    'bundles/patient_profile.css': ['css/patient_profile.css'],
+}
+
+# Сжатые копии делаются для текстовых файлов, если экономят хотя бы 5%
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.ico')
+MIN_COMPRESSION = 0.95
+
+# (расширение, Content-Encoding) в порядке предпочтения
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Файлы без хэша в имени (ссылки мимо {% static %}) могут поменяться при выкладке
+SHORT_CACHE = 'public, max-age=60'
+
+_CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|(\s+)''', re.S)
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*|:\s+')
+
+
+def minify_css(css):
+    """Убирает комментарии и лишние пробелы; строки и url() в кавычках не трогает"""
+    parts = []
+    plain = []
+
+    def flush():
+        text = _CSS_PUNCTUATION.sub(lambda m: m.group(1) or ':', ''.join(plain))
+        parts.append(text.replace(';}', '}'))
+        plain.clear()
+
+    position = 0
+    for match in _CSS_TOKENS.finditer(css):
+        plain.append(css[position:match.start()])
+        string, comment, space = match.groups()
+        if string:
+            flush()
+            parts.append(string)
+        elif space:
+            plain.append(' ')
+        position = match.end()
+    plain.append(css[position:])
+    flush()
+    return ''.join(parts).strip()
+
+
+def build_bundle(name, sources):
+    """Содержимое бандла из исходников: [(имя, текст), ...]"""
+    if name.endswith('.css'):
+        return '\n'.join(minify_css(text) for _, text in sources)
+    # ";" между файлами: исходник может не заканчиваться точкой с запятой
+    return ';\n'.join(text.rstrip().rstrip(';') for _, text in sources) + ';\n'
+
+
+def compress(content):
+    """Сжатые копии: {расширение: байты}, только если они заметно меньше"""
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content)
+    return {
+        extension: data for extension, data in variants.items()
+        if len(data) < len(content) * MIN_COMPRESSION
+    }
+
+
+class BuildStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage + бандлы и сжатые копии"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run=dry_run, **options)
+            return
+        for name, sources in BUNDLES.items():
+            texts = []
+            for source in sources:
+                with self.open(source) as file:
+                    texts.append((source, file.read().decode()))
+            self.delete(name)
+            self._save(name, ContentFile(build_bundle(name, texts).encode()))
+            paths[name] = (self, name)
+
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+        # Исходные и хэшированные имена; файлы из манифеста уже переписаны
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if not name.endswith(COMPRESSED_EXTENSIONS) or not self.exists(name):
+                continue
+            with self.open(name) as file:
+                content = file.read()
+            for extension, data in compress(content).items():
+                self.delete(name + extension)
+                self._save(name + extension, ContentFile(data))
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def convert(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError:
+                # Ссылка на файл, которого нет в статике (картинки фона
+                # пока не добавлены): оставляем как есть, сборка не падает
+                logger.warning('%s: нет файла для %s', name, matchobj.group(0))
+                return matchobj.group(0)
+
+        return convert
+
+
+class StaticFile:
+    """Файл STATIC_ROOT: путь, заголовки и сжатые копии"""
+
+    def __init__(self, path, name, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.cache_control = IMMUTABLE if immutable else SHORT_CACHE
+        self.version = f'{stat.st_size:x}-{int(stat.st_mtime):x}'
+        self.mtime = int(stat.st_mtime)
+        self.encodings = [
+            (encoding, path + extension) for extension, encoding in ENCODINGS
+            if os.path.exists(path + extension)
+        ]
+
+    def etag(self, encoding):
+        """ETag копии: у сжатых копий и оригинала разные байты - разные ETag"""
+        return f'"{self.version}-{encoding}"' if encoding else f'"{self.version}"'
+
+    def choose(self, accept_encoding):
+        """(путь, Content-Encoding или None) для заголовка Accept-Encoding"""
+        accepted = {
+            part.split(';')[0].strip() for part in accept_encoding.split(',')
+            if not part.replace(' ', '').endswith(';q=0')
+        }
+        for encoding, path in self.encodings:
+            if encoding in accepted:
+                return path, encoding
+        return self.path, None
+
+
+def index_static_root(root):
+    """{путь URL без STATIC_URL: StaticFile} по содержимому STATIC_ROOT"""
+    storage = ManifestStaticFilesStorage(location=root)
+    hashed = set(storage.hashed_files.values())
+    files = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(tuple(extension for extension, _ in ENCODINGS)):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            files[name] = StaticFile(path, name, immutable=name in hashed)
+    return files
+
+
+class StaticAssetMiddleware:
+    """Раздача собранной статики из STATIC_ROOT со сжатием и вечным кэшем"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.STATIC_BUILD:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.files = index_static_root(settings.STATIC_ROOT)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        static_file = self.find(request)
+        if static_file is None:
+            return self.get_response(request)
+        return self.serve(request, static_file)
+
+    async def __acall__(self, request):
+        static_file = self.find(request)
+        if static_file is None:
+            return await self.get_response(request)
+        # Под ASGI - содержимое целиком: FileResponse там читался бы синхронно
+        return await sync_to_async(self.serve)(request, static_file, buffered=True)
+
+    def find(self, request):
+        if not request.path_info.startswith(self.prefix):
+            return None
+        return self.files.get(request.path_info[len(self.prefix):])
+
+    def serve(self, request, static_file, buffered=False):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+        path, encoding = static_file.choose(request.headers.get('Accept-Encoding', ''))
+        etag = static_file.etag(encoding)
+        # If-None-Match со списком, W/ и *, If-Modified-Since - как в Django
+        response = get_conditional_response(request, etag=etag, last_modified=static_file.mtime)
+        if response is None:
+            response = self.content(request, static_file.content_type, path, buffered)
+
+        if encoding and response.status_code == 200:
+            response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = static_file.cache_control
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(static_file.mtime)
+        return response
+
+    def content(self, request, content_type, path, buffered):
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+            response['Content-Length'] = os.path.getsize(path)
+        elif buffered:
+            with open(path, 'rb') as file:
+                response = HttpResponse(file.read(), content_type=content_type)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            # FileResponse ставит Content-Disposition по имени .gz-файла
+            del response['Content-Disposition']
+        return response
@@ -0,0 +1,250 @@
+"""Расчет занятости врачей и свободных слотов для записи"""
+import heapq
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+# Статусы записей, которые занимают время врача
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+# Рабочее время клиники (и врачей без расписания, см. schedule.py)
+WORK_START = time(8, 0)
+WORK_END = time(20, 0)
+
+# Длительность приема, если услуга не выбрана
+DEFAULT_DURATION = 30
+
+# Шаг сетки слотов
+SLOT_STEP = timedelta(minutes=30)
+
+# Прием вне смены врача
+NOT_WORKING = 'Врач не принимает в это время. Выберите другое время.'
+
+# Насколько раньше начала дня ищем записи, которые могут на него заходить
+LOOKBACK = timedelta(hours=24)
+
+# Поиск ближайших слотов: горизонт по умолчанию, дни
+EARLIEST_HORIZON = 30
+
+
+def day_bounds(day):
+    """Начало и конец календарного дня в текущей временной зоне"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def working_bounds(day):
+    """Начало и конец рабочего времени в указанный день"""
+    return (
+        timezone.make_aware(datetime.combine(day, WORK_START)),
+        timezone.make_aware(datetime.combine(day, WORK_END)),
+    )
+
+
+class BusyIntervals:
+    """Отсортированный набор непересекающихся интервалов занятости [start, end)"""
+
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._ends = []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if self._ends and start <= self._ends[-1]:
+                # Пересекающиеся и смежные интервалы склеиваем
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __iter__(self):
+        return zip(self._starts, self._ends)
+
+    def is_free(self, start, end):
+        """Свободен ли интервал [start, end) - O(log n)"""
+        i = bisect_right(self._starts, start)
+        # Интервал, начавшийся раньше, не должен заходить на start
+        if i > 0 and self._ends[i - 1] > start:
+            return False
+        # Следующий интервал должен начинаться не раньше end
+        return i >= len(self._starts) or self._starts[i] >= end
+
+    def gaps(self, window_start, window_end):
+        """Свободные промежутки внутри окна [window_start, window_end)"""
+        i = bisect_right(self._ends, window_start)
+        cursor = window_start
+        while i < len(self._starts) and self._starts[i] < window_end:
+            if self._starts[i] > cursor:
+                yield cursor, self._starts[i]
+            cursor = max(cursor, self._ends[i])
+            i += 1
+        if cursor < window_end:
+            yield cursor, window_end
+
+    def free_slots(self, window_start, window_end, duration, step=SLOT_STEP):
+        """Начала слотов длительностью duration по сетке step внутри окна"""
+        slots = []
+        for gap_start, gap_end in self.gaps(window_start, window_end):
+            # Выравниваем начало по сетке, отсчитываемой от начала окна
+            offset = (gap_start - window_start) % step
+            slot = gap_start if not offset else gap_start + (step - offset)
+            while slot + duration <= gap_end:
+                slots.append(slot)
+                slot += step
+        return slots
+
+
+class DoctorDay:
+    """Рабочее время и занятость одного врача в течение одного дня"""
+
+    def __init__(self, doctor_id, day, busy, working=None):
+        self.doctor_id = doctor_id
+        self.day = day
+        self.busy = busy
+        # Рабочие интервалы по расписанию (см. schedule.py), по возрастанию
+        self.working = [working_bounds(day)] if working is None else working
+
+    @staticmethod
+    def _rows(doctor_id, day, exclude_id=None):
+        from .models import Appointment
+
+        start, end = day_bounds(day)
+        rows = Appointment.objects.filter(
+            doctor_id=doctor_id,
+            status__in=ACTIVE_STATUSES,
+            date_time__gte=start - LOOKBACK,
+            date_time__lt=end
+        ).order_by('date_time')
+        if exclude_id is not None:
+            rows = rows.exclude(id=exclude_id)
+        return rows.values_list('date_time', 'service__duration')
+
+    @classmethod
+    def _from_rows(cls, doctor_id, day, rows, working):
+        intervals = [
+            (date_time, date_time + timedelta(minutes=duration or DEFAULT_DURATION))
+            for date_time, duration in rows
+        ]
+        return cls(doctor_id, day, BusyIntervals(intervals), working)
+
+    @classmethod
+    def load(cls, doctor_id, day, exclude_id=None):
+        """Загружает все записи врача на день одним запросом, расписание - из кэша"""
+        from . import schedule
+
+        working = schedule.working_intervals(doctor_id, day)
+        return cls._from_rows(doctor_id, day, cls._rows(doctor_id, day, exclude_id), working)
+
+    @classmethod
+    async def aload(cls, doctor_id, day, exclude_id=None):
+        """load() для асинхронных вьюшек"""
+        from . import schedule
+
+        working = await schedule.aworking_intervals(doctor_id, day)
+        rows = [row async for row in cls._rows(doctor_id, day, exclude_id)]
+        return cls._from_rows(doctor_id, day, rows, working)
+
+    def bounds(self):
+        """Начало первой и конец последней смены (без смен - рабочее время клиники)"""
+        if not self.working:
+            return working_bounds(self.day)
+        return self.working[0][0], self.working[-1][1]
+
+    def is_working(self, start, duration=DEFAULT_DURATION):
+        """Умещается ли прием с start в течение duration минут в одну смену"""
+        end = start + timedelta(minutes=duration)
+        return any(shift_start <= start and end <= shift_end for shift_start, shift_end in self.working)
+
+    def is_free(self, start, duration=DEFAULT_DURATION):
+        """Свободен ли врач с start в течение duration минут"""
+        return self.busy.is_free(start, start + timedelta(minutes=duration))
+
+    def free_slots(self, duration=DEFAULT_DURATION, step=SLOT_STEP, not_before=None):
+        """Свободные слоты в рабочее время дня по сетке от начала первой смены"""
+        origin = self.bounds()[0]
+        slots = []
+        for window_start, window_end in self.working:
+            if not_before is not None and not_before > window_start:
+                window_start = not_before
+            # Сдвигаем начало окна на ближайший узел сетки
+            offset = (window_start - origin) % step
+            if offset:
+                window_start += step - offset
+            slots.extend(self.busy.free_slots(
+                window_start, window_end, timedelta(minutes=duration), step
+            ))
+        return slots
+
+
+def _day_chunks(horizon):
+    """Смещения дней (начало, конец) пачками 1, 2, 4, ... дня"""
+    start, size = 0, 1
+    while start < horizon:
+        yield start, min(start + size, horizon)
+        start += size
+        size *= 2
+
+
+def _busy_by_doctor(doctor_ids, first_day, last_day):
+    """Занятость врачей за дни [first_day, last_day] одним запросом"""
+    from .models import Appointment
+
+    start, end = day_bounds(first_day)[0], day_bounds(last_day)[1]
+    rows = Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        status__in=ACTIVE_STATUSES,
+        date_time__gte=start - LOOKBACK,
+        date_time__lt=end,
+    ).values_list('doctor_id', 'date_time', 'service__duration')
+    intervals = defaultdict(list)
+    for doctor_id, date_time, duration in rows:
+        intervals[doctor_id].append((date_time, date_time + timedelta(minutes=duration or DEFAULT_DURATION)))
+    return {doctor_id: BusyIntervals(intervals[doctor_id]) for doctor_id in doctor_ids}
+
+
+def _doctor_slots(doctor_id, days, busy, weeks, duration, not_before):
+    """Свободные слоты одного врача по дням, по возрастанию: (начало, id врача)"""
+    from .schedule import week_start
+
+    for day in days:
+        working = weeks[week_start(day)][doctor_id][day]
+        doctor_day = DoctorDay(doctor_id, day, busy, working=working)
+        for slot in doctor_day.free_slots(duration, not_before=not_before):
+            yield slot, doctor_id
+
+
+def earliest_slots(doctor_ids, duration=DEFAULT_DURATION, limit=10, horizon=EARLIEST_HORIZON, not_before=None):
+    """Ближайшие limit свободных слотов у любого из врачей: [(начало, id врача), ...]
+
+    Потоки слотов врачей сливаются кучей (heapq.merge), поэтому слоты
+    считаются лениво - ровно до limit-го. Дни читаются пачками растущего
+    размера (1, 2, 4, ... дня; на пачку - один запрос записей и расписание
+    из кэша): обычно все нужные слоты находятся в первой пачке.
+    """
+    from .schedule import get_weeks, week_start
+
+    not_before = not_before or timezone.now()
+    first_day = timezone.localtime(not_before).date()
+    found = []
+    if not doctor_ids or limit < 1:
+        return found
+
+    for chunk_start, chunk_end in _day_chunks(horizon):
+        days = [first_day + timedelta(days=offset) for offset in range(chunk_start, chunk_end)]
+        busy = _busy_by_doctor(doctor_ids, days[0], days[-1])
+        weeks = {monday: get_weeks(doctor_ids, monday) for monday in sorted({week_start(day) for day in days})}
+        streams = [
+            _doctor_slots(doctor_id, days, busy[doctor_id], weeks, duration, not_before)
+            for doctor_id in doctor_ids
+        ]
+        # Пачки идут по порядку: все слоты этой пачки раньше слотов следующей
+        for slot in heapq.merge(*streams):
+            found.append(slot)
+            if len(found) == limit:
+                return found
+    return found
@@ -0,0 +1,73 @@
+"""Запись на прием без двойного бронирования
+
+Appointment.save() проверяет занятость врача и сохраняет запись в одной
+транзакции под блокировкой расписания врача на день (DoctorDayLock).
+book() добавляет к этому повтор транзакции, если база отказала из-за
+конкурентного доступа: SQLite - "database is locked", PostgreSQL -
+ошибка сериализации или взаимная блокировка.
+"""
+import random
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError
+
+from .availability import ACTIVE_STATUSES
+from .models import Appointment
+
+BOOKING_ATTEMPTS = 5
+# Пауза перед повтором: RETRY_DELAY * 2^попытка со случайной долей
+RETRY_DELAY = 0.02
+
+# SQLSTATE: serialization_failure, deadlock_detected
+RETRYABLE_PGCODES = ('40001', '40P01')
+
+# Уникальное ограничение Appointment на активную запись врача на время
+SLOT_CONSTRAINT = 'appt_unique_active_doctor_slot'
+
+SLOT_TAKEN = 'Врач занят в это время. Выберите другое время.'
+TOO_BUSY = 'Не удалось записаться из-за большого числа одновременных записей. Попробуйте еще раз.'
+
+
+def is_retryable(error):
+    """Ошибка конкурентного доступа, после которой транзакцию можно повторить"""
+    cause = error.__cause__
+    if getattr(cause, 'pgcode', None) in RETRYABLE_PGCODES:
+        return True
+    return 'locked' in str(error)
+
+
+def is_slot_taken(error, appointment):
+    """IntegrityError - нарушение SLOT_CONSTRAINT, а не другого ограничения"""
+    diag = getattr(error.__cause__, 'diag', None)
+    if getattr(diag, 'constraint_name', None):
+        return diag.constraint_name == SLOT_CONSTRAINT
+    # SQLite имени ограничения не сообщает: проверяем, занят ли слот
+    return (
+        appointment.status in ACTIVE_STATUSES
+        and Appointment.objects.filter(
+            doctor_id=appointment.doctor_id, date_time=appointment.date_time, status__in=ACTIVE_STATUSES
+        ).exclude(pk=appointment.pk).exists()
+    )
+
+
+def book(appointment):
+    """Сохраняет запись; ValidationError, если время занято или база перегружена"""
+    pk, adding = appointment.pk, appointment._state.adding
+    for attempt in range(BOOKING_ATTEMPTS):
+        # Откаченная транзакция могла успеть присвоить записи id
+        appointment.pk, appointment._state.adding = pk, adding
+        try:
+            appointment.save()
+            return appointment
+        except IntegrityError as e:
+            appointment.pk = pk
+            if not is_slot_taken(e, appointment):
+                raise
+            # Слот занят параллельной записью
+            raise ValidationError(SLOT_TAKEN)
+        except OperationalError as e:
+            if not is_retryable(e):
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt * random.random())
+    raise ValidationError(TOO_BUSY)
@@ -0,0 +1,150 @@
+"""Кэш каталога: активные врачи, услуги и категории
+
+Каталог меняется несколько раз в день, а читается на каждой странице
+со списками и в форме записи. Снимок хранится в кэше Django в виде
+готовых словарей (по структуре совпадают с тем, что читают шаблоны)
+и сбрасывается сигналами при изменении моделей (см. signals.py).
+"""
+import time
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from .images import describe
+from .routers import use_primary
+
+CATALOG_KEY = 'clinic:catalog'
+VERSION_KEY = 'clinic:catalog:version'
+
+# Страховка на случай пропущенной инвалидации
+CATALOG_TIMEOUT = 60 * 60
+
+# Порядок списков снимка - он же ключ keyset-пагинации списков врачей и услуг
+DOCTOR_ORDERING = ('specialization', 'id')
+SERVICE_ORDERING = ('order', 'name', 'id')
+
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _new_version():
+    # Версия от времени: после вытеснения ключа версии из кэша
+    # не совпадет ни с одним старым снимком
+    return time.time_ns()
+
+
+def get_version():
+    return cache.get_or_set(VERSION_KEY, _new_version, None)
+
+
+async def aget_version():
+    return await cache.aget_or_set(VERSION_KEY, _new_version, None)
+
+
+def serialize_doctor(doctor):
+    """Врач в виде словаря для кэша (doctor.user должен быть загружен)"""
+    return {
+        'id': doctor.pk,
+        'user': {'first_name': doctor.user.first_name, 'last_name': doctor.user.last_name},
+        'full_name': doctor.full_name,
+        'specialization': doctor.specialization,
+        'room': doctor.room,
+        'experience': doctor.experience,
+        'rating': doctor.rating,
+        'photo': describe(doctor.photo, doctor.photo_variants),
+        'short_description': doctor.short_description,
+    }
+
+
+def serialize_service(service):
+    """Услуга в виде словаря для кэша (service.category должна быть загружена)"""
+    return {
+        'id': service.pk,
+        'name': service.name,
+        'slug': service.slug,
+        'description': service.description,
+        'price': service.price,
+        'duration': service.duration,
+        'icon': service.icon,
+        'image': describe(service.image, service.image_variants),
+        'is_popular': service.is_popular,
+        'order': service.order,
+        'category': {
+            'id': service.category.pk,
+            'name': service.category.name,
+            'slug': service.category.slug,
+        } if service.category else None,
+    }
+
+
+def build_catalog():
+    """Читает каталог из БД (3 запроса)"""
+    from .models import Doctor, Service, ServiceCategory
+
+    # Снимок живет в кэше час: читаем с основной базы, а не с реплики,
+    # которая может еще не получить изменение, сбросившее кэш
+    with use_primary():
+        doctors = [
+            serialize_doctor(doctor)
+            for doctor in Doctor.objects.filter(is_active=True).select_related('user')
+        ]
+        services = [
+            serialize_service(service)
+            for service in Service.objects.filter(is_active=True).select_related('category')
+        ]
+        categories = list(
+            ServiceCategory.objects.filter(is_active=True)
+            .order_by('order', 'name')
+            .values('id', 'name', 'slug', 'icon', 'order')
+        )
+
+    # Сортировка в Python, а не в БД: пагинатор ищет курсор bisect'ом по
+    # сравнению Python, а правило сравнения строк в PostgreSQL (локаль) другое
+    doctors.sort(key=itemgetter(*DOCTOR_ORDERING))
+    services.sort(key=itemgetter(*SERVICE_ORDERING))
+    return {'doctors': doctors, 'services': services, 'categories': categories}
+
+
+def get_catalog():
+    """Снимок каталога из кэша; при промахе собирается заново"""
+    version = get_version()
+    key = f'{CATALOG_KEY}:{version}'
+    catalog = cache.get(key)
+    if catalog is None:
+        _stats['misses'] += 1
+        catalog = build_catalog()
+        catalog['version'] = version
+        cache.set(key, catalog, CATALOG_TIMEOUT)
+    else:
+        _stats['hits'] += 1
+    return catalog
+
+
+async def aget_catalog():
+    """get_catalog() для асинхронных вьюшек"""
+    version = await aget_version()
+    key = f'{CATALOG_KEY}:{version}'
+    catalog = await cache.aget(key)
+    if catalog is None:
+        _stats['misses'] += 1
+        # Три запроса сборки - одним переходом в поток ORM, а не тремя
+        catalog = await sync_to_async(build_catalog)()
+        catalog['version'] = version
+        await cache.aset(key, catalog, CATALOG_TIMEOUT)
+    else:
+        _stats['hits'] += 1
+    return catalog
+
+
+def invalidate():
+    """Сбрасывает снимок: следующее чтение соберет каталог заново"""
+    _stats['invalidations'] += 1
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _new_version(), None)
+
+
+def get_stats():
+    """Счетчики попаданий и промахов кэша в текущем процессе"""
+    return dict(_stats)
@@ -2,12 +2,19 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model  # ← ВАЖНО!
 from django.utils import timezone
-from django.core.exceptions import ValidationError
-from .models import Appointment, Doctor, Service, Patient
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.utils.functional import cached_property
+from .models import Appointment, Patient
+from .catalog import get_catalog, get_version
+from . import reports
+from .booking import SLOT_CONSTRAINT
 
 # Получаем кастомную модель User
 User = get_user_model()
 
+# Поля AppointmentForm, проверенные по снимку каталога
+CATALOG_FIELDS = {'doctor', 'service'}
+
 class PatientRegistrationForm(UserCreationForm):
     """Форма регистрации пациента для кастомной модели User"""
     phone = forms.CharField(
@@ -95,11 +102,77 @@ class PatientRegistrationForm(UserCreationForm):
                 address=''
             )
         return user
+class BookingChoices:
+    """Врачи и услуги формы записи по одной версии каталога
+
+    Словари по id строятся сразу (по ним проверяется выбор), списки
+    вариантов - при первом обращении: POST без ошибок их не выводит.
+    """
+
+    def __init__(self, catalog):
+        self.version = catalog['version']
+        self.doctors = {d['id']: d for d in catalog['doctors']}
+        self.services = {s['id']: s for s in catalog['services']}
+
+    @cached_property
+    def doctor_choices(self):
+        doctors = sorted(self.doctors.values(), key=lambda d: (d['specialization'], d['user']['last_name']))
+        return [(d['id'], f"Доктор {d['full_name']} - {d['specialization']}") for d in doctors]
+
+    @cached_property
+    def service_choices(self):
+        services = sorted(self.services.values(), key=lambda s: s['name'])
+        return [(s['id'], f"{s['name']} - {s['price']} руб.") for s in services]
+
+
+_booking_choices = None
+
+
+def get_booking_choices():
+    """Варианты формы записи для текущей версии каталога
+
+    Пока версия не изменилась, снимок каталога даже не читается из кэша.
+    """
+    global _booking_choices
+    choices = _booking_choices
+    if choices is None or choices.version != get_version():
+        choices = _booking_choices = BookingChoices(get_catalog())
+    return choices
+
+
+class CatalogChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField, проверяющий выбор по снимку каталога без запросов к БД
+
+    Возвращает экземпляр модели с полями из снимка (snapshot_fields);
+    остальные поля догружаются при обращении, как отложенные.
+    """
+
+    def __init__(self, *args, snapshot_fields=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.snapshot_fields = snapshot_fields
+        self.snapshot = {}
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            item = self.snapshot[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value}
+            )
+        model = self.queryset.model
+        # from_db() ждет значения в порядке полей модели
+        names = [field.attname for field in model._meta.concrete_fields if field.attname in self.snapshot_fields]
+        return model.from_db(self.queryset.db, names, [item[name] for name in names])
+
+
 class AppointmentForm(forms.ModelForm):
     """Форма записи на прием"""
     class Meta:
         model = Appointment
         fields = ['doctor', 'service', 'date_time', 'notes']
+        field_classes = {'doctor': CatalogChoiceField, 'service': CatalogChoiceField}
         widgets = {
             'doctor': forms.Select(attrs={
                 'class': 'form-select',
@@ -122,12 +195,13 @@ class AppointmentForm(forms.ModelForm):
             }),
         }
     
+    # Поля из снимка каталога, которыми заполняются выбранные врач и услуга
+    DOCTOR_FIELDS = ('id', 'specialization', 'room', 'experience', 'rating')
+    SERVICE_FIELDS = ('id', 'name', 'slug', 'description', 'price', 'duration', 'icon', 'is_popular', 'order')
+    
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-
-        self.fields['doctor'].queryset = Doctor.objects.filter(is_active=True).order_by('specialization', 'user__last_name')
-        self.fields['service'].queryset = Service.objects.all().order_by('name')
         
         self.fields['doctor'].empty_label = "Выберите врача"
         self.fields['doctor'].label = "Врач"
@@ -135,6 +209,16 @@ class AppointmentForm(forms.ModelForm):
         self.fields['service'].empty_label = "Выберите услугу"
         self.fields['service'].label = "Услуга"
         
+        # Варианты выбора и проверка выбранных id - по снимку каталога, а не по БД;
+        # списки вариантов строятся, только когда форму выводят
+        choices = get_booking_choices()
+        self.fields['doctor'].snapshot = choices.doctors
+        self.fields['doctor'].snapshot_fields = self.DOCTOR_FIELDS
+        self.fields['doctor'].choices = lambda: [('', "Выберите врача")] + choices.doctor_choices
+        self.fields['service'].snapshot = choices.services
+        self.fields['service'].snapshot_fields = self.SERVICE_FIELDS
+        self.fields['service'].choices = lambda: [('', "Выберите услугу")] + choices.service_choices
+        
         self.fields['date_time'].label = "Дата и время приема"
         self.fields['notes'].label = "Примечания"
         
@@ -145,15 +229,19 @@ class AppointmentForm(forms.ModelForm):
         if user and hasattr(user, 'last_doctor'):
             self.fields['doctor'].initial = user.last_doctor
 
+    def _get_validation_exclusions(self):
+        # Врач и услуга проверены по снимку каталога: проверка модели
+        # (ForeignKey.validate) повторила бы ее двумя запросами exists()
+        exclude = super()._get_validation_exclusions()
+        exclude.update(CATALOG_FIELDS)
+        return exclude
+
     def clean_date_time(self):
         date_time = self.cleaned_data.get('date_time')
         if date_time < timezone.now():
             raise ValidationError("Нельзя записаться на прошедшее время")
         
-        hour = date_time.hour
-        if hour < 8 or hour > 20:
-            raise ValidationError("Запись возможна только с 8:00 до 20:00")
-        
+        # Часы приема зависят от врача: проверяются в clean() по его расписанию
         return date_time
     
     def clean(self):
@@ -162,13 +250,92 @@ class AppointmentForm(forms.ModelForm):
         date_time = cleaned_data.get('date_time')
         
         if doctor and date_time:
-            conflicting = Appointment.objects.filter(
-                doctor=doctor,
-                date_time=date_time,
-                status__in=['pending', 'confirmed']
-            ).exists()
-            
-            if conflicting:
-                raise ValidationError("Врач занят в это время. Выберите другое время.")
+            # Заполняем экземпляр заранее: загруженная занятость врача
+            # переиспользуется в Appointment.clean() и во вьюшке.
+            # Смену и занятость врача проверяет Appointment.clean(), которую
+            # форма вызывает после clean(): своя проверка дала бы ошибку дважды
+            self.instance.doctor = doctor
+            self.instance.service = cleaned_data.get('service')
+            self.instance.date_time = date_time
         
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+    def validate_unique(self):
+        """Уникальность полей и уникальные ограничения с врачом и услугой
+
+        full_clean() пропустил ограничения с врачом и услугой (они в
+        исключениях, см. выше), поэтому они проверяются здесь. Кроме слота
+        врача: он уже проверен в clean() по интервалам занятости, а при
+        гонке сработает сама БД.
+        """
+        super().validate_unique()
+        exclude = self._get_validation_exclusions() - CATALOG_FIELDS
+        errors = {}
+        for model_class, constraints in self.instance.get_constraints():
+            for constraint in constraints:
+                if constraint.name == SLOT_CONSTRAINT or not CATALOG_FIELDS & set(getattr(constraint, 'fields', ())):
+                    continue
+                try:
+                    constraint.validate(model_class, self.instance, exclude=exclude)
+                except ValidationError as e:
+                    errors.setdefault(NON_FIELD_ERRORS, []).extend(e.error_list)
+        if errors:
+            self._update_errors(ValidationError(errors))
+
+
+class ServiceFilterForm(forms.Form):
+    """Параметры фильтрации каталога услуг (GET)"""
+    SORT_CHOICES = [
+        ('', 'По умолчанию'),
+        ('price', 'Сначала дешевле'),
+        ('-price', 'Сначала дороже'),
+        ('popular', 'Сначала популярные'),
+    ]
+
+    category = forms.SlugField(required=False)
+    q = forms.CharField(required=False, max_length=100)
+    min_price = forms.DecimalField(required=False, min_value=0)
+    max_price = forms.DecimalField(required=False, min_value=0)
+    popular = forms.BooleanField(required=False)
+    sort = forms.ChoiceField(required=False, choices=SORT_CHOICES)
+
+    def get_filters(self):
+        """Только корректно заполненные параметры (ошибочные игнорируются)"""
+        self.is_valid()
+        return {
+            name: value for name, value in self.cleaned_data.items()
+            if value not in (None, '', False)
+        }
+
+
+class ReportForm(forms.Form):
+    """Параметры выгрузки отчета по записям (GET)"""
+    GROUP_CHOICES = [
+        ('doctor', 'Врач'),
+        ('service', 'Услуга'),
+        ('category', 'Категория'),
+        ('status', 'Статус'),
+    ]
+    PERIOD_CHOICES = [
+        ('', 'Без разбивки'),
+        ('day', 'День'),
+        ('week', 'Неделя'),
+        ('month', 'Месяц'),
+    ]
+    FORMAT_CHOICES = [(name, name.upper()) for name in reports.FORMATS]
+
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False, help_text='Не включается')
+    group_by = forms.MultipleChoiceField(required=False, choices=GROUP_CHOICES)
+    period = forms.ChoiceField(required=False, choices=PERIOD_CHOICES)
+    format = forms.ChoiceField(required=False, choices=FORMAT_CHOICES)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_from >= date_to:
+            raise ValidationError('Начало периода должно быть раньше конца')
+        if not cleaned_data.get('format'):
+            cleaned_data['format'] = 'csv'
+        return cleaned_data
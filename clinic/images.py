@@ -0,0 +1,314 @@
+"""Уменьшенные копии фото врачей и изображений услуг
+
+Оригинал сохраняется как есть, а обработчик очереди (команда
+image_worker) делает из него копии шириной WIDTHS в WebP и JPEG
+и размытую заглушку - WebP 16 пикселей (около 60 байт) в data URI,
+которая видна, пока грузится копия. Имена копий - от хэша содержимого оригинала
+(variants/ab/<хэш>-640.webp): файл под таким именем никогда не меняется,
+а одинаковые оригиналы дают одни и те же файлы.
+
+Описание копий хранится в JSON-поле модели (Doctor.photo_variants,
+Service.image_variants) вместе с именем оригинала: после замены
+изображения старые копии не выводятся, страница показывает оригинал,
+пока не готовы новые. Шаблоны выводят копии через
+clinic/responsive_image.html (srcset, loading="lazy").
+
+Копии делаются без обращения к Django, в том числе в пуле процессов
+(image_worker --processes, backfill_images). Модели импортируются
+внутри функций: процесс пула (spawn) импортирует модуль без django.setup().
+"""
+import base64
+import hashlib
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageFilter, ImageOps
+
+# Ширины копий; копий шире оригинала не бывает
+WIDTHS = (320, 640, 960)
+
+# (формат Pillow, расширение, MIME-тип); последний - запасной для <img src>
+FORMATS = (
+    ('WEBP', 'webp', 'image/webp'),
+    ('JPEG', 'jpg', 'image/jpeg'),
+)
+QUALITY = 80
+
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 40
+
+VARIANTS_DIR = 'variants'
+
+# ImageJob.model -> (модель, поле изображения, поле описания копий)
+FIELDS = {
+    'doctor': ('Doctor', 'photo', 'photo_variants'),
+    'service': ('Service', 'image', 'image_variants'),
+}
+
+# Через сколько задача упавшего обработчика снова берется в работу
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+# --- Обработка (без Django) ---
+
+def variant_name(digest, width, extension):
+    return f'{VARIANTS_DIR}/{digest[:2]}/{digest}-{width}.{extension}'
+
+
+def _flatten(image):
+    """RGB без прозрачности: прозрачные области - белые, как фон карточек"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, pil_format, quality, **options):
+    buffer = BytesIO()
+    image.save(buffer, pil_format, quality=quality, **options)
+    return buffer.getvalue()
+
+
+def render(data):
+    """Копии и заглушка из байтов оригинала: (описание, {имя файла: байты})"""
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    with Image.open(BytesIO(data)) as original:
+        image = _flatten(original)
+    width, height = image.size
+
+    widths = sorted({w for w in WIDTHS if w < width} | {min(width, WIDTHS[-1])})
+    formats = {mime: [] for _, _, mime in FORMATS}
+    files = {}
+    for target in widths:
+        size = (target, max(1, round(height * target / width)))
+        resized = image if size == image.size else image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for pil_format, extension, mime in FORMATS:
+            name = variant_name(digest, target, extension)
+            files[name] = _encode(resized, pil_format, QUALITY, optimize=True)
+            formats[mime].append([target, name])
+
+    small = image.resize(
+        (PLACEHOLDER_WIDTH, max(1, round(height * PLACEHOLDER_WIDTH / width))), Image.Resampling.BOX
+    ).filter(ImageFilter.GaussianBlur(1))
+    # WebP: у JPEG такого размера почти весь файл - заголовки и таблицы
+    placeholder = base64.b64encode(_encode(small, 'WEBP', PLACEHOLDER_QUALITY)).decode()
+
+    description = {
+        'digest': digest,
+        'width': width,
+        'height': height,
+        'formats': formats,
+        'placeholder': f'data:image/webp;base64,{placeholder}',
+    }
+    return description, files
+
+
+def _render(data):
+    # Ошибка одного файла не должна прерывать всю пачку в пуле
+    try:
+        return render(data), ''
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+# --- Шаблоны ---
+
+def describe(field, variants):
+    """Изображение для шаблона: {'url': ..., и если копии готовы - srcset, sources, placeholder}"""
+    if not field:
+        return None
+    if not variants or variants.get('source') != field.name:
+        return {'url': field.url}
+    url = field.storage.url
+    srcsets = [
+        (mime, ', '.join(f'{url(name)} {width}w' for width, name in variants['formats'][mime]))
+        for _, _, mime in FORMATS
+    ]
+    largest = variants['formats'][FORMATS[-1][2]][-1][1]
+    return {
+        'url': url(largest),
+        'srcset': srcsets[-1][1],
+        # <source> для форматов, которые браузер может не поддерживать
+        'sources': [{'type': mime, 'srcset': srcset} for mime, srcset in srcsets[:-1]],
+        'width': variants['width'],
+        'height': variants['height'],
+        'placeholder': variants['placeholder'],
+    }
+
+
+# --- Очередь ---
+
+def _fields(model):
+    from django.apps import apps
+
+    model_name, field_name, variants_name = FIELDS[model]
+    return apps.get_model('clinic', model_name), field_name, variants_name
+
+
+def enqueue(instance):
+    """Ставит изображение врача или услуги в очередь, если копии не от него (из post_save)"""
+    from .models import ImageJob
+
+    model = instance._meta.model_name
+    model_class, field_name, variants_name = _fields(model)
+    field = getattr(instance, field_name)
+    variants = getattr(instance, variants_name)
+    if not field:
+        if variants:
+            # Изображение удалено: копии больше не выводятся
+            model_class.objects.filter(pk=instance.pk).update(**{variants_name: {}})
+            setattr(instance, variants_name, {})
+        return
+    if variants.get('source') == field.name:
+        return
+    # На объект - одна задача в очереди: повторная загрузка заменяет в ней файл
+    if not ImageJob.objects.filter(model=model, object_id=instance.pk, status=ImageJob.PENDING).update(source=field.name):
+        ImageJob.objects.create(model=model, object_id=instance.pk, source=field.name)
+
+
+def stale_jobs(force=False):
+    """Задачи для всех изображений, копии которых не от текущего файла (или для всех с force)"""
+    from .models import ImageJob
+
+    queued = set(ImageJob.objects.filter(status=ImageJob.PENDING).values_list('model', 'object_id'))
+    jobs = []
+    for model in FIELDS:
+        model_class, field_name, variants_name = _fields(model)
+        rows = (
+            model_class.objects.exclude(Q(**{f'{field_name}__isnull': True}) | Q(**{field_name: ''}))
+            .values_list('pk', field_name, variants_name)
+        )
+        for pk, source, variants in rows.iterator():
+            if (model, pk) in queued or (not force and (variants or {}).get('source') == source):
+                continue
+            jobs.append(ImageJob(model=model, object_id=pk, source=source))
+    return jobs
+
+
+class ImageWorker:
+    """Обработчик очереди: берет пачку задач и делает копии, при processes > 1 - в пуле процессов"""
+
+    def __init__(self, processes=1, batch_size=20):
+        self.processes = processes
+        self.batch_size = batch_size
+
+    def claim_batch(self):
+        """Помечает пачку задач меткой этого обработчика"""
+        from .models import ImageJob
+
+        now = timezone.now()
+        available = (
+            Q(status=ImageJob.PENDING)
+            | Q(status=ImageJob.PROCESSING, claimed_at__lt=now - CLAIM_TIMEOUT)
+        )
+        ids = list(ImageJob.objects.filter(available).order_by('id').values_list('id', flat=True)[:self.batch_size])
+        if not ids:
+            return []
+
+        # Условие повторяется в UPDATE: задачу, которую уже забрал другой
+        # обработчик, мы не получим
+        claim = uuid.uuid4().hex
+        ImageJob.objects.filter(available, id__in=ids).update(
+            status=ImageJob.PROCESSING, claim=claim, claimed_at=now
+        )
+        return list(ImageJob.objects.filter(claim=claim).order_by('id'))
+
+    def read(self, job):
+        model_class, field_name, _ = _fields(job.model)
+        storage = model_class._meta.get_field(field_name).storage
+        with storage.open(job.source, 'rb') as file:
+            return file.read()
+
+    def store(self, job, description, files):
+        """Сохраняет копии и описание; False, если изображение объекта уже заменено"""
+        model_class, field_name, variants_name = _fields(job.model)
+        storage = model_class._meta.get_field(field_name).storage
+        for name, content in files.items():
+            # Имя от содержимого: существующий файл уже такой же
+            if not storage.exists(name):
+                storage.save(name, ContentFile(content))
+        updated = model_class.objects.filter(pk=job.object_id, **{field_name: job.source}).update(
+            **{variants_name: {'source': job.source, **description}}
+        )
+        return bool(updated)
+
+    def process_batch(self, pool=None):
+        """Обрабатывает одну пачку; возвращает статистику по результатам"""
+        from . import catalog
+        from .models import ImageJob
+
+        jobs = self.claim_batch()
+        if not jobs:
+            return {}
+
+        sources, errors = [], {}
+        for job in jobs:
+            try:
+                sources.append(self.read(job))
+            except OSError as e:
+                sources.append(None)
+                errors[job.pk] = f'{type(e).__name__}: {e}'
+        readable = [data for data in sources if data is not None]
+        rendered = iter(pool.map(_render, readable) if pool else map(_render, readable))
+
+        stats = {DONE: 0, SKIPPED: 0, FAILED: 0}
+        now = timezone.now()
+        for job, data in zip(jobs, sources):
+            result, error = next(rendered) if data is not None else (None, errors[job.pk])
+            if result is None:
+                outcome = FAILED
+            else:
+                outcome = DONE if self.store(job, *result) else SKIPPED
+            job.status = ImageJob.FAILED if outcome == FAILED else ImageJob.DONE
+            job.last_error = error
+            job.claim = ''
+            job.claimed_at = None
+            job.processed_at = now
+            stats[outcome] += 1
+
+        ImageJob.objects.bulk_update(jobs, ['status', 'last_error', 'claim', 'claimed_at', 'processed_at'])
+        if stats[DONE]:
+            # Описание сохранено через update(): сигналы не сработали
+            catalog.invalidate()
+        return stats
+
+    def pool(self):
+        if self.processes <= 1:
+            return nullcontext()
+        return ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def run(self, once=False, poll_interval=1.0, on_batch=None):
+        """Разбирает очередь; с once=True - только то, что в ней сейчас"""
+        with self.pool() as pool:
+            while True:
+                stats = self.process_batch(pool)
+                if stats and on_batch:
+                    on_batch(stats)
+                if not stats:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+
+
+def backfill(processes=1, force=False, batch_size=20, on_batch=None):
+    """Ставит в очередь изображения без актуальных копий и разбирает очередь; возвращает число задач"""
+    from .models import ImageJob
+
+    jobs = ImageJob.objects.bulk_create(stale_jobs(force))
+    ImageWorker(processes=processes, batch_size=batch_size).run(once=True, on_batch=on_batch)
+    return len(jobs)
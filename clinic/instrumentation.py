@@ -0,0 +1,278 @@
+"""Замеры времени обработки запросов
+
+Включаются настройкой INSTRUMENTATION (переменная окружения INSTRUMENTATION=1).
+Для каждого запроса считаются общее время, число и время SQL-запросов,
+повторы одного и того же SQL (признак N+1) и время рендеринга шаблонов.
+Результат попадает:
+
+    - в заголовок Server-Timing (виден в DevTools браузера, вкладка Timing)
+    - в строку JSON лога clinic.instrumentation
+    - в счетчики процесса, которые отдает /metrics в формате Prometheus
+
+Счетчики хранятся в памяти процесса: при нескольких воркерах gunicorn
+каждый отдает свои, их суммирует Prometheus.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# Один и тот же SQL, выполненный столько раз за запрос, считается N+1
+DUPLICATE_WARNING = 10
+
+# Границы корзин гистограммы времени ответа, секунды
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Замеры текущего запроса (None вне InstrumentationMiddleware)
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """Замеры одного запроса; сам объект - обертка для execute_wrapper соединений"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            # Параметры в SQL не подставлены: одинаковый текст - один и тот же запрос
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+    def most_repeated(self):
+        """(SQL, число выполнений) самого частого запроса"""
+        return self.statements.most_common(1)[0] if self.statements else (None, 0)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def server_timing(self):
+        return (
+            f'total;dur={self.duration * 1000:.1f}, '
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries, {self.duplicates} duplicate", '
+            f'tpl;dur={self.template_time * 1000:.1f}'
+        )
+
+
+class TimedTemplate(Template):
+    """Шаблон, время рендеринга которого учитывается в замерах запроса"""
+
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+
+        # Вложенные render() (render_to_string в тегах) уже входят во внешний
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """Бэкенд DjangoTemplates, отдающий TimedTemplate"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class Registry:
+    """Счетчики процесса для /metrics"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = Counter()
+            self.buckets = defaultdict(lambda: [0] * len(BUCKETS))
+            self.duration_sum = Counter()
+            self.duration_count = Counter()
+            self.queries = Counter()
+            self.db_time = Counter()
+            self.duplicates = Counter()
+            self.template_time = Counter()
+
+    def observe(self, view, method, status, metrics):
+        with self.lock:
+            self.requests[view, method, str(status)] += 1
+            buckets = self.buckets[view]
+            for i, bound in enumerate(BUCKETS):
+                if metrics.duration <= bound:
+                    buckets[i] += 1
+            self.duration_sum[view] += metrics.duration
+            self.duration_count[view] += 1
+            self.queries[view] += metrics.queries
+            self.db_time[view] += metrics.db_time
+            self.duplicates[view] += metrics.duplicates
+            self.template_time[view] += metrics.template_time
+
+    def render(self):
+        """Счетчики в текстовом формате Prometheus"""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{format_labels(labels)} {value}')
+
+        with self.lock:
+            family('clinic_requests_total', 'counter', 'Обработанные запросы', [
+                ({'view': view, 'method': method, 'status': status}, count)
+                for (view, method, status), count in sorted(self.requests.items())
+            ])
+
+            samples = []
+            for view, buckets in sorted(self.buckets.items()):
+                for bound, count in zip(BUCKETS, buckets):
+                    samples.append(({'view': view, 'le': str(bound)}, count))
+                samples.append(({'view': view, 'le': '+Inf'}, self.duration_count[view]))
+            lines.append('# HELP clinic_request_duration_seconds Время обработки запроса')
+            lines.append('# TYPE clinic_request_duration_seconds histogram')
+            for labels, value in samples:
+                lines.append(f'clinic_request_duration_seconds_bucket{format_labels(labels)} {value}')
+            for view in sorted(self.duration_count):
+                lines.append(f'clinic_request_duration_seconds_sum{format_labels({"view": view})} {self.duration_sum[view]:.6f}')
+                lines.append(f'clinic_request_duration_seconds_count{format_labels({"view": view})} {self.duration_count[view]}')
+
+            for name, help_text, counter in (
+                ('clinic_db_queries_total', 'SQL-запросы', self.queries),
+                ('clinic_db_query_seconds_total', 'Время SQL-запросов', self.db_time),
+                ('clinic_db_duplicate_queries_total', 'Повторные SQL-запросы (признак N+1)', self.duplicates),
+                ('clinic_template_render_seconds_total', 'Время рендеринга шаблонов', self.template_time),
+            ):
+                family(name, 'counter', help_text, [
+                    ({'view': view}, f'{value:.6f}' if isinstance(value, float) else value)
+                    for view, value in sorted(counter.items())
+                ])
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels.items()
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+registry = Registry()
+
+
+def _attach(metrics):
+    # Все базы: с репликой каталог читается не с основной
+    for alias in connections:
+        connections[alias].execute_wrappers.append(metrics)
+
+
+def _detach(metrics):
+    for alias in connections:
+        connections[alias].execute_wrappers.remove(metrics)
+
+
+class InstrumentationMiddleware:
+    """Замеры запроса: Server-Timing, строка лога и счетчики /metrics
+
+    Должна стоять первой в MIDDLEWARE, чтобы учитывать время остальных.
+    Работает и под ASGI, не переводя асинхронные вьюшки в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        _attach(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _detach(metrics)
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        # Асинхронный ORM выполняет запросы в отдельном потоке (один на запрос),
+        # обертка ставится на соединение этого потока
+        await sync_to_async(_attach)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_detach)(metrics)
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        metrics.finish()
+
+        # Имя маршрута, а не путь: иначе число рядов в /metrics не ограничено
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        registry.observe(view, request.method, response.status_code, metrics)
+        response['Server-Timing'] = metrics.server_timing()
+        self.log(request, response, view, metrics)
+        return response
+
+    def log(self, request, response, view, metrics):
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'duration_ms': round(metrics.duration * 1000, 1),
+            'db_queries': metrics.queries,
+            'db_ms': round(metrics.db_time * 1000, 1),
+            'db_duplicates': metrics.duplicates,
+            'template_ms': round(metrics.template_time * 1000, 1),
+        }
+        sql, count = metrics.most_repeated()
+        if count >= DUPLICATE_WARNING:
+            record['repeated_sql'] = sql[:200]
+            record['repeated_count'] = count
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,33 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from clinic import images
+
+
+class Command(BaseCommand):
+    help = 'Делает уменьшенные копии для уже загруженных фото врачей и изображений услуг'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Процессов для обработки изображений')
+        parser.add_argument('--batch-size', type=int, default=20, help='Изображений в одной пачке')
+        parser.add_argument('--force', action='store_true', help='Пересоздать и актуальные копии (после смены WIDTHS)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        totals = {images.DONE: 0, images.SKIPPED: 0, images.FAILED: 0}
+
+        def report(stats):
+            for outcome, count in stats.items():
+                totals[outcome] += count
+
+        queued = images.backfill(
+            processes=options['processes'], force=options['force'],
+            batch_size=options['batch_size'], on_batch=report,
+        )
+        self.stdout.write(
+            f"Поставлено в очередь: {queued}, обработано: {totals[images.DONE]}, "
+            f"заменено до обработки: {totals[images.SKIPPED]}, ошибок: {totals[images.FAILED]}"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Готово за {time.monotonic() - started:.2f} с"))
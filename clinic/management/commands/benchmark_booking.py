@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic.services import booking_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Замеряет пропускную способность записи на прием на SQLite при нескольких процессах'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile', action='append', choices=booking_benchmark.PROFILES,
+            help='Профиль соединения SQLite (по умолчанию оба: до и после настройки)'
+        )
+        parser.add_argument('--processes', type=int, default=4, help='Процессов-воркеров')
+        parser.add_argument('--bookings', type=int, default=50, help='Записей на каждый процесс')
+        parser.add_argument('--doctors', type=int, default=4, help='Между сколькими врачами распределять записи')
+
+    def handle(self, *args, **options):
+        if min(options['processes'], options['bookings'], options['doctors']) < 1:
+            raise CommandError('--processes, --bookings и --doctors должны быть положительными')
+
+        self.stdout.write(f"{'профиль':<10}{'записано':>10}{'отказ':>8}{'занято':>8}{'ошибки':>8}{'сек':>8}{'в сек':>8}")
+        try:
+            booking_benchmark.run(
+                profiles=options['profile'] or booking_benchmark.PROFILES,
+                processes=options['processes'],
+                bookings=options['bookings'],
+                doctors=options['doctors'],
+                report=self.report,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def report(self, result):
+        self.stdout.write(
+            f"{result['profile']:<10}{result['booked']:>10}{result['rejected']:>8}{result['busy']:>8}"
+            f"{result['errors']:>8}{result['seconds']:>8}{result['per_second']:>8}"
+        )
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from clinic.models import Appointment
+from clinic.services.reminders import REMINDER_WINDOWS, due_appointments
+
+# Объем данных, на котором план запроса считается показательным
+MIN_ROWS = 1_000_000
+
+
+class Command(BaseCommand):
+    help = 'Проверяет, что горячие запросы к записям используют индексы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Выполнить EXPLAIN ANALYZE (только PostgreSQL)'
+        )
+
+    def get_checks(self):
+        """Горячие запросы и индексы, которые они должны использовать"""
+        sample = Appointment.objects.order_by().values('doctor_id', 'patient_id').first()
+        if not sample:
+            raise CommandError('В базе нет записей на прием')
+
+        now = timezone.now()
+        return [
+            (
+                'Расписание врача на день',
+                Appointment.objects.filter(
+                    doctor_id=sample['doctor_id'],
+                    date_time__gte=now,
+                    date_time__lt=now + timedelta(days=1)
+                ).values_list('date_time', 'service__duration', 'status', 'updated_at'),
+                ('appt_doctor_time_status_idx',),
+            ),
+            (
+                'Последние записи врача',
+                Appointment.objects.filter(doctor_id=sample['doctor_id']).order_by('-date_time')[:5],
+                ('appt_doctor_time_status_idx',),
+            ),
+            (
+                'Напоминания за 24 ч',
+                due_appointments(*REMINDER_WINDOWS[0], now).values_list('id', flat=True),
+                ('appt_reminder_24h_idx',),
+            ),
+            (
+                'История пациента',
+                Appointment.objects.filter(patient_id=sample['patient_id']).order_by('-date_time')[:5],
+                ('appt_patient_time_idx',),
+            ),
+        ]
+
+    def handle(self, *args, **options):
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--analyze поддерживается только на PostgreSQL')
+            explain_options = {'analyze': True, 'buffers': True}
+
+        total = Appointment.objects.count()
+        self.stdout.write(f"База: {connection.vendor}, записей на прием: {total}")
+        if total < MIN_ROWS:
+            self.stdout.write(self.style.WARNING(
+                f"Меньше {MIN_ROWS} записей - планировщик может предпочесть полный просмотр. "
+                f"Сгенерируйте данные перед проверкой."
+            ))
+
+        failed = []
+        for title, queryset, indexes in self.get_checks():
+            plan = queryset.explain(**explain_options)
+            self.stdout.write(f"\n{title}:\n{plan}")
+
+            used = [name for name in indexes if name in plan]
+            if used:
+                self.stdout.write(self.style.SUCCESS(f"✅ Используется индекс {used[0]}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"❌ Индекс не используется: {', '.join(indexes)}"))
+                failed.append(title)
+
+        if failed:
+            raise CommandError(f"Запросы без индекса: {', '.join(failed)}")
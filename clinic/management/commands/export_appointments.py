@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from clinic.availability import day_bounds
+from clinic.models import Appointment
+from clinic.services.appointment_transfer import BATCH_SIZE, FORMATS, export_rows, write_rows
+
+
+class Command(BaseCommand):
+    help = 'Выгружает записи на прием в CSV или JSON Lines (в формате import_appointments)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Файл для выгрузки ("-" - stdout)')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--date-from', help='С даты (ГГГГ-ММ-ДД)')
+        parser.add_argument('--date-to', help='По дату включительно (ГГГГ-ММ-ДД)')
+        parser.add_argument('--chunk-size', type=int, default=BATCH_SIZE, help='Строк, читаемых из БД за раз')
+
+    def parse_day(self, value):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Некорректная дата: {value}")
+        return day
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else path.rsplit('.', 1)[-1].lower())
+        if fmt not in FORMATS:
+            raise CommandError(f"Неизвестный формат файла: {fmt}. Укажите --format")
+
+        queryset = Appointment.objects.all()
+        if options['date_from']:
+            queryset = queryset.filter(date_time__gte=day_bounds(self.parse_day(options['date_from']))[0])
+        if options['date_to']:
+            queryset = queryset.filter(date_time__lt=day_bounds(self.parse_day(options['date_to']))[1])
+
+        started = time.monotonic()
+        rows = export_rows(queryset, chunk_size=options['chunk_size'])
+        if path == '-':
+            count = write_rows(self.stdout, fmt, rows)
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as stream:
+                count = write_rows(stream, fmt, rows)
+
+        elapsed = time.monotonic() - started
+        rate = count / elapsed if elapsed else 0
+        # В stderr: stdout может быть самой выгрузкой
+        self.stderr.write(f"Выгружено записей: {count} за {elapsed:.1f} с ({rate:.0f} строк/с)", self.style.SUCCESS)
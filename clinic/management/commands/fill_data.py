@@ -1,6 +1,5 @@
 from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from clinic.models import Patient, Doctor, Service
+from clinic.models import Patient, Doctor, Service, User
 
 class Command(BaseCommand):
     help = 'Заполняет базу тестовыми данными'
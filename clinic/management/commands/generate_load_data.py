@@ -0,0 +1,44 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from clinic.services.load_data import BATCH_SIZE, TIERS, LoadDataGenerator, clear
+
+
+class Command(BaseCommand):
+    help = 'Генерирует воспроизводимый набор данных для нагрузочного тестирования (см. clinic/services/load_data.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tier', choices=TIERS, default='small', help='Уровень объема данных')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+        for name in ('doctors', 'services', 'patients', 'months', 'appointments'):
+            parser.add_argument(f'--{name}', type=int, help='Переопределить значение уровня')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Строк в одном INSERT')
+        parser.add_argument(
+            '--anchor-date', type=date.fromisoformat,
+            help='День, от которого отсчитываются даты записей (ГГГГ-ММ-ДД, по умолчанию сегодня)'
+        )
+        parser.add_argument('--clear', action='store_true', help='Сначала удалить ранее сгенерированные данные')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def report(message):
+            self.stdout.write(f"[{time.monotonic() - started:7.1f} с] {message}")
+
+        if options['clear']:
+            clear()
+            report("Старые сгенерированные данные удалены")
+
+        sizes = dict(TIERS[options['tier']])
+        for name in sizes:
+            if options[name] is not None:
+                sizes[name] = options[name]
+        generator = LoadDataGenerator(
+            seed=options['seed'], batch_size=options['batch_size'], report=report,
+            anchor_date=options['anchor_date'], **sizes
+        )
+        report(f"Уровень {options['tier']}, seed {options['seed']}, от {generator.today}: {sizes}")
+        generator.run()
+        self.stdout.write(self.style.SUCCESS(f"Готово за {time.monotonic() - started:.1f} с"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from clinic.images import DONE, FAILED, SKIPPED, ImageWorker
+
+
+class Command(BaseCommand):
+    help = 'Делает уменьшенные копии загруженных изображений из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Процессов для обработки изображений')
+        parser.add_argument('--batch-size', type=int, default=20, help='Изображений в одной пачке')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза при пустой очереди (сек)')
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь и выйти')
+
+    def report(self, stats):
+        self.stdout.write(f"Обработано: {stats[DONE]}, заменено до обработки: {stats[SKIPPED]}, ошибок: {stats[FAILED]}")
+
+    def handle(self, *args, **options):
+        worker = ImageWorker(processes=options['processes'], batch_size=options['batch_size'])
+        self.stdout.write(f"Обработчик изображений запущен (процессов: {worker.processes})")
+        worker.run(once=options['once'], poll_interval=options['poll_interval'], on_batch=self.report)
+        self.stdout.write(self.style.SUCCESS('Очередь разобрана'))
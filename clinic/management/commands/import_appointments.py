@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic import stats
+from clinic.services.appointment_transfer import BATCH_SIZE, FORMATS, AppointmentImporter, read_rows
+
+# Сколько ошибок выводить подробно
+MAX_ERRORS_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = 'Импортирует записи на прием из CSV или JSON Lines (без проверки каждой строки через save)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с записями')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Строк в одной пачке (транзакции)')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл, ничего не записывая')
+        parser.add_argument(
+            '--skip-stats',
+            action='store_true',
+            help='Не пересобирать статистику врачей после импорта'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if fmt not in FORMATS:
+            raise CommandError(f"Неизвестный формат файла: {fmt}. Укажите --format")
+
+        importer = AppointmentImporter(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        started = time.monotonic()
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                first_line = 2 if fmt == 'csv' else 1
+                for processed in importer.run(read_rows(stream, fmt), first_line=first_line):
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f"Обработано строк: {processed}, импортировано: {importer.imported} "
+                        f"({processed / elapsed:.0f} строк/с)"
+                    )
+        except OSError as e:
+            raise CommandError(f"Не удалось прочитать файл: {e}")
+        except ValueError as e:
+            raise CommandError(f"Некорректная строка файла: {e}")
+
+        for line, reason in importer.errors[:MAX_ERRORS_SHOWN]:
+            self.stdout.write(self.style.WARNING(f"Строка {line}: {reason}"))
+        if len(importer.errors) > MAX_ERRORS_SHOWN:
+            self.stdout.write(self.style.WARNING(f"... и еще ошибок: {len(importer.errors) - MAX_ERRORS_SHOWN}"))
+
+        elapsed = time.monotonic() - started
+        rate = importer.imported / elapsed if elapsed else 0
+        action = 'Проверено без записи' if options['dry_run'] else 'Импортировано'
+        self.stdout.write(self.style.SUCCESS(
+            f"{action}: {importer.imported}, пропущено: {importer.skipped} "
+            f"за {elapsed:.1f} с ({rate:.0f} строк/с)"
+        ))
+
+        # bulk_create идет в обход сигналов, поэтому счетчики панели врача пересобираем
+        if importer.imported and not options['dry_run'] and not options['skip_stats']:
+            stats.rebuild()
+            self.stdout.write("Статистика врачей пересобрана")
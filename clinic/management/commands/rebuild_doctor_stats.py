@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic import stats
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает статистику врачей по таблице записей или проверяет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сравнить счетчики с записями, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rows = stats.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Статистика пересобрана, строк: {rows}"))
+            return
+
+        drift = stats.find_drift()
+        for (doctor_id, day), (actual, expected) in sorted(drift.items(), key=lambda item: str(item[0])):
+            self.stdout.write(
+                f"Врач {doctor_id}, {day or 'всего'}: сохранено {actual}, по записям {expected}"
+            )
+        if drift:
+            raise CommandError(f"Расхождений: {len(drift)}. Запустите rebuild_doctor_stats без --check")
+        self.stdout.write(self.style.SUCCESS("Расхождений нет"))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from clinic import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс врачей и услуг'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=search.BATCH_SIZE, help='Объектов в одной пачке')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Проиндексировано объектов: {total} ({time.monotonic() - started:.2f} с)"
+        ))
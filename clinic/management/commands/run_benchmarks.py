@@ -0,0 +1,89 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic.services.benchmark import ENDPOINTS, MODES, Benchmark, compare
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время ответа и число SQL-запросов страниц записи и списков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=MODES, default='wsgi', help='Как выполнять запросы')
+        parser.add_argument('--url', help='Адрес запущенного сервера (для --mode http)')
+        parser.add_argument('--iterations', type=int, default=100, help='Запросов к каждой странице')
+        parser.add_argument('--warmup', type=int, default=5, help='Запросов для прогрева (не учитываются)')
+        parser.add_argument('--concurrency', type=int, default=1, help='Параллельных клиентов (для --mode http)')
+        parser.add_argument(
+            '--endpoint', action='append', choices=[name for name, *rest in ENDPOINTS],
+            help='Только эти страницы (можно указать несколько раз)'
+        )
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего замера для сравнения')
+        parser.add_argument(
+            '--threshold', type=float, default=20.0,
+            help='Допустимый рост времени ответа, %% (по умолчанию 20)'
+        )
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'http' and not options['url']:
+            raise CommandError('Для --mode http укажите --url')
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть положительным')
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Не удалось прочитать {options['compare']}: {e}")
+
+        try:
+            benchmark = Benchmark(
+                mode=options['mode'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                url=options['url'],
+                concurrency=options['concurrency'],
+                endpoints=options['endpoint'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{'страница':<26}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>8}{'SQL':>6}  коды")
+        result = benchmark.run(report=self.report)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результат сохранен в {options['output']}"))
+
+        errors = sum(endpoint['errors'] for endpoint in result['endpoints'].values())
+        if errors:
+            self.stdout.write(self.style.WARNING(f"Ответов с ошибкой сервера: {errors}"))
+
+        if baseline:
+            self.check_regressions(baseline, result, options['threshold'])
+
+    def report(self, name, result):
+        queries = '-' if result['queries_max'] is None else result['queries_max']
+        statuses = ' '.join(f'{status}:{count}' for status, count in sorted(result['statuses'].items()))
+        self.stdout.write(
+            f"{name:<26}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+            f"{result['rps']:>8.1f}{queries:>6}  {statuses}"
+        )
+
+    def check_regressions(self, baseline, result, threshold):
+        if baseline['meta'].get('mode') != result['meta']['mode']:
+            self.stdout.write(self.style.WARNING(
+                f"Режимы замеров различаются: {baseline['meta'].get('mode')} и {result['meta']['mode']}"
+            ))
+        rows = compare(baseline, result, threshold)
+        regressions = [row for row in rows if row[-1]]
+        for name, metric, old, new, change, regression in rows:
+            line = f"{name:<26}{metric:<13}{old:>10}{new:>10}{change:>+9.1f}%"
+            self.stdout.write(self.style.ERROR(line) if regression else line)
+        if regressions:
+            raise CommandError(f"Регрессий относительно {baseline['meta'].get('revision')}: {len(regressions)}")
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from clinic.services.reminders import BATCH_SIZE, send_reminders
+
+
+class Command(BaseCommand):
+    help = 'Ставит в очередь Telegram напоминания за 24 ч и за 2 ч до приема'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Записей в одной пачке')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно')
+        parser.add_argument('--interval', type=int, default=60, help='Пауза между проходами (сек)')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            queued = send_reminders(batch_size=options['batch_size'])
+            self.stdout.write(
+                f"Напоминаний за 24 ч: {queued['reminder_24h_sent_at']}, "
+                f"за 2 ч: {queued['reminder_2h_sent_at']} "
+                f"({time.monotonic() - started:.2f} с)"
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
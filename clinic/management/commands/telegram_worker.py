@@ -0,0 +1,38 @@
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from clinic.services.telegram_delivery import SENT, RETRY, FAILED, DEFERRED, TelegramWorker
+
+
+class Command(BaseCommand):
+    help = 'Отправляет сообщения из очереди Telegram'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=10, help='Одновременных запросов к Telegram')
+        parser.add_argument('--batch-size', type=int, default=100, help='Сообщений в одной пачке')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза при пустой очереди (сек)')
+        parser.add_argument('--api-url', help='Адрес Bot API (по умолчанию TELEGRAM_API_URL)')
+        parser.add_argument('--once', action='store_true', help='Разобрать готовые сообщения и выйти')
+
+    def report(self, stats):
+        latency = stats['latency_ms']
+        avg = sum(latency) / len(latency) if latency else 0
+        self.stdout.write(
+            f"Отправлено: {stats[SENT]}, повтор: {stats[RETRY]}, отложено: {stats[DEFERRED]}, "
+            f"ошибок: {stats[FAILED]}, среднее время отправки: {avg:.0f} мс"
+        )
+
+    def handle(self, *args, **options):
+        worker = TelegramWorker(
+            api_url=options['api_url'],
+            concurrency=options['concurrency'],
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(f"Обработчик очереди Telegram запущен ({worker.api_url})")
+        # async_to_sync: запросы к БД через sync_to_async выполняются в этом же потоке
+        async_to_sync(worker.run)(
+            once=options['once'],
+            poll_interval=options['poll_interval'],
+            on_batch=self.report
+        )
+        self.stdout.write(self.style.SUCCESS('Очередь разобрана'))
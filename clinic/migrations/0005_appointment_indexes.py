@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0004_servicecategory_alter_service_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'date_time', 'status'], name='appt_doctor_time_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', '-date_time'], name='appt_patient_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'confirmed'])), fields=('doctor', 'date_time'), name='appt_unique_active_doctor_slot', violation_error_message='Врач занят в это время. Выберите другое время.'),
+        ),
+    ]
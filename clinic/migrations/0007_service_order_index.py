@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0006_appointment_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['order', 'name', 'id'], name='service_order_name_idx'),
+        ),
+    ]
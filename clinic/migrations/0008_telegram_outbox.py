@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0007_service_order_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.CharField(max_length=100, verbose_name='Chat ID')),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('keyboard', models.JSONField(blank=True, null=True, verbose_name='Клавиатура')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('claim', models.CharField(blank=True, max_length=32, verbose_name='Метка обработчика')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в работу')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Время отправки (мс)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата отправки')),
+            ],
+            options={
+                'verbose_name': 'Сообщение Telegram',
+                'verbose_name_plural': 'Сообщения Telegram',
+                'ordering': ['next_attempt_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='tgmsg_status_next_idx'), models.Index(fields=['claim'], name='tgmsg_claim_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0008_telegram_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='reminder_24h_sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Напоминание за 24 ч'),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='reminder_2h_sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Напоминание за 2 ч'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('reminder_24h_sent_at__isnull', True)), fields=['date_time', 'status'], name='appt_reminder_24h_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('reminder_2h_sent_at__isnull', True)), fields=['date_time', 'status'], name='appt_reminder_2h_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0009_appointment_reminders'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['category', 'is_active', 'order'], name='service_category_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['price'], name='service_price_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# Схема индекса на момент миграции; clinic.search может меняться дальше
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE clinic_search USING fts5("
+        "label UNINDEXED, detail UNINDEXED, is_active UNINDEXED, title, body, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    ],
+    'postgresql': [
+        "CREATE TABLE clinic_search ("
+        "id bigint PRIMARY KEY, label text NOT NULL, detail text NOT NULL, "
+        "is_active boolean NOT NULL, document tsvector NOT NULL)",
+        "CREATE INDEX clinic_search_document_idx ON clinic_search USING GIN (document)",
+    ],
+}
+DROP_SQL = "DROP TABLE IF EXISTS clinic_search"
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in CREATE_SQL:
+        return
+    for sql in CREATE_SQL[connection.vendor]:
+        schema_editor.execute(sql)
+
+    # Содержимое индекса - производные данные: заполняется текущим кодом,
+    # как и командой rebuild_search_index, в той же базе, что и таблица
+    from clinic import search
+
+    search.rebuild(
+        doctors=apps.get_model('clinic', 'Doctor').objects.all(),
+        services=apps.get_model('clinic', 'Service').objects.all(),
+        using=connection.alias,
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0010_service_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
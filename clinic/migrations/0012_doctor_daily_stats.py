@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from clinic import stats
+
+
+def fill_doctor_stats(apps, schema_editor):
+    stats.rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(blank=True, null=True, verbose_name='День')),
+                ('total', models.IntegerField(default=0, verbose_name='Всего')),
+                ('pending', models.IntegerField(default=0, verbose_name='Ожидают')),
+                ('confirmed', models.IntegerField(default=0, verbose_name='Подтверждены')),
+                ('completed', models.IntegerField(default=0, verbose_name='Завершены')),
+                ('cancelled', models.IntegerField(default=0, verbose_name='Отменены')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='clinic.doctor', verbose_name='Врач')),
+            ],
+            options={
+                'verbose_name': 'Статистика врача',
+                'verbose_name_plural': 'Статистика врачей',
+                'ordering': ['doctor', '-day'],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'day'), name='doctor_stats_unique_day'), models.UniqueConstraint(condition=models.Q(('day__isnull', True)), fields=('doctor',), name='doctor_stats_unique_total')],
+            },
+        ),
+        migrations.RunPython(fill_doctor_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0012_doctor_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDayLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Версия')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_locks', to='clinic.doctor', verbose_name='Врач')),
+            ],
+            options={
+                'verbose_name': 'Блокировка расписания',
+                'verbose_name_plural': 'Блокировки расписания',
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'day'), name='doctor_day_lock_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:12
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0013_doctor_day_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Понедельник'), (1, 'Вторник'), (2, 'Среда'), (3, 'Четверг'), (4, 'Пятница'), (5, 'Суббота'), (6, 'Воскресенье')], verbose_name='День недели')),
+                ('start_time', models.TimeField(verbose_name='Начало приема')),
+                ('end_time', models.TimeField(verbose_name='Конец приема')),
+                ('every_weeks', models.PositiveSmallIntegerField(default=1, help_text='1 - каждую неделю, 2 - через неделю', validators=[django.core.validators.MinValueValidator(1)], verbose_name='Повтор, недель')),
+                ('valid_from', models.DateField(default=django.utils.timezone.localdate, verbose_name='Действует с')),
+                ('valid_until', models.DateField(blank=True, null=True, verbose_name='Действует по')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='clinic.doctor', verbose_name='Врач')),
+            ],
+            options={
+                'verbose_name': 'Расписание врача',
+                'verbose_name_plural': 'Расписание врачей',
+                'ordering': ['doctor', 'weekday', 'start_time'],
+                'constraints': [models.CheckConstraint(condition=models.Q(('end_time__gt', models.F('start_time'))), name='doctor_schedule_end_after_start', violation_error_message='Конец приема должен быть позже начала')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DoctorTimeOff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='Начало')),
+                ('end', models.DateTimeField(verbose_name='Конец')),
+                ('reason', models.CharField(blank=True, max_length=200, verbose_name='Причина')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_off', to='clinic.doctor', verbose_name='Врач')),
+            ],
+            options={
+                'verbose_name': 'Отсутствие врача',
+                'verbose_name_plural': 'Отсутствия врачей',
+                'ordering': ['doctor', 'start'],
+                'indexes': [models.Index(fields=['doctor', 'start'], name='timeoff_doctor_start_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('end__gt', models.F('start'))), name='doctor_timeoff_end_after_start', violation_error_message='Конец отсутствия должен быть позже начала')],
+            },
+        ),
+    ]
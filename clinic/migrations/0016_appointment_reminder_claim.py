@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0015_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='reminder_claim',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Метка рассылки'),
+        ),
+    ]
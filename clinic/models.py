@@ -1,11 +1,15 @@
+from datetime import timedelta
+
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.urls import reverse
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.conf import settings
 
+from .availability import ACTIVE_STATUSES, DEFAULT_DURATION, NOT_WORKING, DoctorDay
+
 
 class User(AbstractUser):
     """Кастомная модель пользователя"""
@@ -117,11 +121,9 @@ class Patient(models.Model):
     address = models.TextField(verbose_name='Адрес', blank=True)
     telegram_id = models.CharField(max_length=100, blank=True, verbose_name='Telegram ID')
 
-    def send_telegram_reminder(self, appointment):
-        """Отправка напоминания о приеме"""
-        if not self.telegram_id:
-            return False
-        
+    @staticmethod
+    def build_reminder(appointment):
+        """Текст и клавиатура напоминания о приеме"""
         from .services.telegram_service import telegram_service
         
         message = f"""
@@ -138,7 +140,16 @@ class Patient(models.Model):
             telegram_service.create_button('✅ Подтвердить', f'confirm_{appointment.id}'),
             telegram_service.create_button('🔄 Перенести', f'reschedule_{appointment.id}')
         ])
+        return message, keyboard
+
+    def send_telegram_reminder(self, appointment):
+        """Отправка напоминания о приеме"""
+        if not self.telegram_id:
+            return False
+        
+        from .services.telegram_service import telegram_service
         
+        message, keyboard = self.build_reminder(appointment)
         return telegram_service.send_message(self.telegram_id, message, keyboard)
     
     def __str__(self):
@@ -168,6 +179,8 @@ class Doctor(models.Model):
         blank=True, 
         null=True
     )
+    # Уменьшенные копии фото (см. images.py)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Варианты фото')
     phone = models.CharField(
         max_length=20, 
         verbose_name='Телефон', 
@@ -278,6 +291,8 @@ class Service(models.Model):
         blank=True,
         verbose_name='Изображение'
     )
+    # Уменьшенные копии изображения (см. images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Варианты изображения')
     order = models.IntegerField(default=0, verbose_name='Порядок отображения')
     
     # SEO поля
@@ -297,6 +312,13 @@ class Service(models.Model):
         verbose_name = 'Услуга'
         verbose_name_plural = 'Услуги'
         ordering = ['order', 'name']
+        indexes = [
+            # Порядок вывода каталога и курсор постраничного вывода
+            models.Index(fields=['order', 'name', 'id'], name='service_order_name_idx'),
+            # Фильтрация каталога по категории и цене
+            models.Index(fields=['category', 'is_active', 'order'], name='service_category_active_idx'),
+            models.Index(fields=['price'], name='service_price_idx'),
+        ]
 
 
 
@@ -335,37 +357,370 @@ class Appointment(models.Model):
     )
     notes = models.TextField(verbose_name='Заметки', blank=True)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    reminder_24h_sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Напоминание за 24 ч')
+    reminder_2h_sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Напоминание за 2 ч')
+    # Метка запуска рассылки, который пометил запись последним (см. services/reminders.py)
+    reminder_claim = models.CharField(max_length=32, blank=True, editable=False, verbose_name='Метка рассылки')
 
     def __str__(self):
         return f"Запись {self.patient} к {self.doctor} на {self.date_time}"
 
+    @property
+    def duration(self):
+        """Длительность приема в минутах"""
+        if self.service_id:
+            return self.service.duration
+        return DEFAULT_DURATION
+
+    def get_doctor_day(self):
+        """Занятость врача на день записи (загружается один раз на экземпляр)"""
+        day = timezone.localtime(self.date_time).date()
+        key = (self.doctor_id, day, self.pk)
+        cached = getattr(self, '_doctor_day', None)
+        if cached is None or cached[0] != key:
+            cached = (key, DoctorDay.load(self.doctor_id, day, exclude_id=self.pk))
+            self._doctor_day = cached
+        return cached[1]
+
     def is_time_available(self):
-        """Проверяет, свободно ли время у врача"""
-        conflicting_appointments = Appointment.objects.filter(
-            doctor=self.doctor,
-            date_time=self.date_time,
-            status__in=['pending', 'confirmed']
-        ).exclude(id=self.id)
-        
-        return not conflicting_appointments.exists()
+        """Проверяет, свободен ли врач на всю длительность приема"""
+        return self.get_doctor_day().is_free(self.date_time, self.duration)
+
+    def is_working_time(self):
+        """Проверяет, что прием целиком приходится на смену врача"""
+        return self.get_doctor_day().is_working(self.date_time, self.duration)
 
     def clean(self):
         """Валидация данных перед сохранением"""
         if self.date_time and self.date_time < timezone.now():
             raise ValidationError('Нельзя записаться на прошедшее время')
         
-        if self.doctor and self.date_time and not self.is_time_available():
+        # Отмена или завершение приема, попавшего в новый отпуск врача, проходят
+        if self.doctor_id and self.date_time and self.status in ACTIVE_STATUSES and not self.is_working_time():
+            raise ValidationError(NOT_WORKING)
+        
+        if self.doctor_id and self.date_time and not self.is_time_available():
             raise ValidationError('Врач занят в это время. Выберите другое время.')
 
+    def locked_days(self):
+        """Дни расписания врача, которые занимает прием"""
+        start = timezone.localtime(self.date_time)
+        end = timezone.localtime(self.date_time + timedelta(minutes=self.duration))
+        return {start.date(), end.date()}
+
     def save(self, *args, **kwargs):
-        """Переопределяем save для автоматической валидации"""
-        self.clean()
-        super().save(*args, **kwargs)
+        """Проверка занятости и сохранение под блокировкой расписания врача
+
+        Без блокировки два параллельных запроса могут оба увидеть время
+        свободным и оба сохранить запись.
+        """
+        with transaction.atomic():
+            if self.doctor_id and self.date_time and self.status in ACTIVE_STATUSES:
+                DoctorDayLock.acquire(self.doctor_id, self.locked_days())
+                # Занятость, загруженная до блокировки, могла устареть
+                self._doctor_day = None
+            self.clean()
+            super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = 'Запись на прием'
         verbose_name_plural = 'Записи на прием'
         ordering = ['-date_time']
+        indexes = [
+            # Расписание врача: doctor + диапазон date_time (+ status)
+            models.Index(fields=['doctor', 'date_time', 'status'], name='appt_doctor_time_status_idx'),
+            # История пациента: patient, сортировка по -date_time
+            models.Index(fields=['patient', '-date_time'], name='appt_patient_time_idx'),
+            # Рассылка напоминаний: только записи без отправленного напоминания
+            models.Index(
+                fields=['date_time', 'status'],
+                condition=models.Q(reminder_24h_sent_at__isnull=True),
+                name='appt_reminder_24h_idx'
+            ),
+            models.Index(
+                fields=['date_time', 'status'],
+                condition=models.Q(reminder_2h_sent_at__isnull=True),
+                name='appt_reminder_2h_idx'
+            ),
+        ]
+        constraints = [
+            # Две активные записи не могут занимать один слот врача
+            models.UniqueConstraint(
+                fields=['doctor', 'date_time'],
+                condition=models.Q(status__in=['pending', 'confirmed']),
+                name='appt_unique_active_doctor_slot',
+                violation_error_message='Врач занят в это время. Выберите другое время.'
+            ),
+        ]
+
+
+class DoctorDayLock(models.Model):
+    """Строка блокировки расписания врача на день
+
+    Запись на прием начинает транзакцию с UPDATE этой строки: в PostgreSQL
+    это блокировка строки, в SQLite - блокировка записи всей базы. Поэтому
+    проверка занятости и вставка для одного врача и дня идут строго по очереди,
+    а записи к разным врачам друг друга не ждут (в PostgreSQL).
+    """
+    doctor = models.ForeignKey(
+        Doctor,
+        on_delete=models.CASCADE,
+        related_name='day_locks',
+        verbose_name='Врач'
+    )
+    day = models.DateField(verbose_name='День')
+    version = models.PositiveIntegerField(default=0, verbose_name='Версия')
+
+    class Meta:
+        verbose_name = 'Блокировка расписания'
+        verbose_name_plural = 'Блокировки расписания'
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'day'], name='doctor_day_lock_unique'),
+        ]
+
+    @classmethod
+    def acquire(cls, doctor_id, days):
+        """Блокирует расписание врача на дни до конца текущей транзакции"""
+        # Один порядок захвата во всех транзакциях - без взаимных блокировок
+        for day in sorted(days):
+            rows = cls.objects.filter(doctor_id=doctor_id, day=day)
+            if rows.update(version=models.F('version') + 1):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(doctor_id=doctor_id, day=day, version=1)
+            except IntegrityError:
+                # Строку только что создал параллельный запрос - ждем его
+                rows.update(version=models.F('version') + 1)
+
+
+class DoctorSchedule(models.Model):
+    """Правило расписания: часы приема врача в день недели
+
+    Смены и перерывы - несколько правил на один день (9:00-13:00 и
+    14:00-18:00). Правило повторяется каждые every_weeks недель, начиная
+    с недели valid_from, и действует до valid_until включительно.
+    Врач без правил принимает ежедневно в рабочее время клиники.
+    """
+    WEEKDAY_CHOICES = [
+        (0, 'Понедельник'),
+        (1, 'Вторник'),
+        (2, 'Среда'),
+        (3, 'Четверг'),
+        (4, 'Пятница'),
+        (5, 'Суббота'),
+        (6, 'Воскресенье'),
+    ]
+
+    doctor = models.ForeignKey(
+        Doctor,
+        on_delete=models.CASCADE,
+        related_name='schedules',
+        verbose_name='Врач'
+    )
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, verbose_name='День недели')
+    start_time = models.TimeField(verbose_name='Начало приема')
+    end_time = models.TimeField(verbose_name='Конец приема')
+    every_weeks = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        verbose_name='Повтор, недель',
+        help_text='1 - каждую неделю, 2 - через неделю'
+    )
+    valid_from = models.DateField(default=timezone.localdate, verbose_name='Действует с')
+    valid_until = models.DateField(null=True, blank=True, verbose_name='Действует по')
+
+    def __str__(self):
+        return f"{self.doctor}: {self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+    def applies_on(self, day):
+        """Действует ли правило в этот день"""
+        if day.weekday() != self.weekday or day < self.valid_from:
+            return False
+        if self.valid_until and day > self.valid_until:
+            return False
+        weeks = (day - self.valid_from).days // 7
+        return weeks % self.every_weeks == 0
+
+    class Meta:
+        verbose_name = 'Расписание врача'
+        verbose_name_plural = 'Расписание врачей'
+        ordering = ['doctor', 'weekday', 'start_time']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(end_time__gt=models.F('start_time')),
+                name='doctor_schedule_end_after_start',
+                violation_error_message='Конец приема должен быть позже начала'
+            ),
+        ]
+
+
+class DoctorTimeOff(models.Model):
+    """Отсутствие врача: отпуск, больничный, учеба"""
+    doctor = models.ForeignKey(
+        Doctor,
+        on_delete=models.CASCADE,
+        related_name='time_off',
+        verbose_name='Врач'
+    )
+    start = models.DateTimeField(verbose_name='Начало')
+    end = models.DateTimeField(verbose_name='Конец')
+    reason = models.CharField(max_length=200, blank=True, verbose_name='Причина')
+
+    def __str__(self):
+        return f"{self.doctor}: {self.start:%d.%m.%Y} - {self.end:%d.%m.%Y}"
+
+    class Meta:
+        verbose_name = 'Отсутствие врача'
+        verbose_name_plural = 'Отсутствия врачей'
+        ordering = ['doctor', 'start']
+        indexes = [
+            models.Index(fields=['doctor', 'start'], name='timeoff_doctor_start_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(end__gt=models.F('start')),
+                name='doctor_timeoff_end_after_start',
+                violation_error_message='Конец отсутствия должен быть позже начала'
+            ),
+        ]
+
+
+class DoctorDailyStats(models.Model):
+    """Счетчики записей врача за день (строка с day=None - итог за все время)
+
+    Обновляются при создании, смене статуса и удалении записи (см. stats.py).
+    """
+    doctor = models.ForeignKey(
+        Doctor,
+        on_delete=models.CASCADE,
+        related_name='daily_stats',
+        verbose_name='Врач'
+    )
+    day = models.DateField(null=True, blank=True, verbose_name='День')
+    total = models.IntegerField(default=0, verbose_name='Всего')
+    pending = models.IntegerField(default=0, verbose_name='Ожидают')
+    confirmed = models.IntegerField(default=0, verbose_name='Подтверждены')
+    completed = models.IntegerField(default=0, verbose_name='Завершены')
+    cancelled = models.IntegerField(default=0, verbose_name='Отменены')
+
+    @property
+    def active(self):
+        return self.pending + self.confirmed
+
+    def __str__(self):
+        return f"{self.doctor_id}: {self.day or 'всего'} ({self.total})"
+
+    class Meta:
+        verbose_name = 'Статистика врача'
+        verbose_name_plural = 'Статистика врачей'
+        ordering = ['doctor', '-day']
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'day'], name='doctor_stats_unique_day'),
+            models.UniqueConstraint(
+                fields=['doctor'],
+                condition=models.Q(day__isnull=True),
+                name='doctor_stats_unique_total'
+            ),
+        ]
+
+
+class TelegramMessage(models.Model):
+    """Исходящее сообщение Telegram (очередь на отправку)"""
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (SENDING, 'Отправляется'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    chat_id = models.CharField(max_length=100, verbose_name='Chat ID')
+    text = models.TextField(verbose_name='Текст')
+    keyboard = models.JSONField(null=True, blank=True, verbose_name='Клавиатура')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    claim = models.CharField(max_length=32, blank=True, verbose_name='Метка обработчика')
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name='Взято в работу')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    latency_ms = models.PositiveIntegerField(null=True, blank=True, verbose_name='Время отправки (мс)')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата отправки')
+
+    def __str__(self):
+        return f"Сообщение для {self.chat_id} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = 'Сообщение Telegram'
+        verbose_name_plural = 'Сообщения Telegram'
+        ordering = ['next_attempt_at']
+        indexes = [
+            # Выборка очередной пачки: status + next_attempt_at
+            models.Index(fields=['status', 'next_attempt_at'], name='tgmsg_status_next_idx'),
+            models.Index(fields=['claim'], name='tgmsg_claim_idx'),
+        ]
+
+
+class ImageJob(models.Model):
+    """Загруженное изображение врача или услуги в очереди на обработку"""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Обрабатывается'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    DOCTOR = 'doctor'
+    SERVICE = 'service'
+
+    MODEL_CHOICES = [
+        (DOCTOR, 'Врач'),
+        (SERVICE, 'Услуга'),
+    ]
+
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES, verbose_name='Модель')
+    object_id = models.PositiveBigIntegerField(verbose_name='ID объекта')
+    source = models.CharField(max_length=255, verbose_name='Исходный файл')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    claim = models.CharField(max_length=32, blank=True, verbose_name='Метка обработчика')
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name='Взято в работу')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата обработки')
+
+    def __str__(self):
+        return f"{self.source} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = 'Обработка изображения'
+        verbose_name_plural = 'Обработка изображений'
+        ordering = ['id']
+        indexes = [
+            # Выборка очередной пачки: status + id
+            models.Index(fields=['status', 'id'], name='imagejob_status_idx'),
+            models.Index(fields=['claim'], name='imagejob_claim_idx'),
+        ]
 
 
 class MedicalRecord(models.Model):
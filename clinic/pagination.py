@@ -0,0 +1,221 @@
+"""Постраничный вывод по ключу (keyset/cursor pagination)"""
+import base64
+import json
+from bisect import bisect_right
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.views import View
+
+
+class InvalidCursor(Exception):
+    """Курсор поврежден или не подходит к сортировке"""
+
+
+class KeysetPaginator:
+    """Пагинация по упорядоченному набору уникальных полей
+
+    Вместо OFFSET следующая страница выбирается условием "после последней
+    строки предыдущей", поэтому глубокие страницы стоят столько же, сколько
+    первая, если для сортировки есть индекс.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip('-')) for name in self.ordering
+        ]
+
+    def encode_cursor(self, obj):
+        values = [field.value_to_string(obj) for field in self.fields]
+        raw = json.dumps(values, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (ValueError, TypeError, ValidationError) as e:
+            raise InvalidCursor(cursor) from e
+
+    def after(self, values):
+        """Условие "строго после values" в порядке сортировки"""
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, values):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def page_queryset(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor)))
+        # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+        return queryset[:self.per_page + 1]
+
+    def split(self, rows):
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            return rows, self.encode_cursor(rows[-1])
+        return rows, None
+
+    def page(self, cursor=None):
+        """Возвращает (строки страницы, курсор следующей страницы или None)"""
+        return self.split(list(self.page_queryset(cursor)))
+
+    async def apage(self, cursor=None):
+        return self.split([row async for row in self.page_queryset(cursor)])
+
+
+class ListKeysetPaginator:
+    """Та же пагинация для уже отсортированного списка словарей (кэш каталога)
+
+    Поддерживается только сортировка по возрастанию. Список должен быть
+    отсортирован в Python (sort по тем же ключам), а не в БД: курсор
+    ищется bisect'ом, а правила сравнения строк в БД зависят от локали.
+    """
+
+    def __init__(self, rows, ordering, per_page):
+        self.rows = rows
+        self.ordering = list(ordering)
+        self.per_page = per_page
+
+    def key(self, row):
+        return tuple(row[name] for name in self.ordering)
+
+    def encode_cursor(self, row):
+        raw = json.dumps(list(self.key(row)), separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def page(self, cursor=None):
+        start = 0
+        if cursor:
+            try:
+                padded = cursor + '=' * (-len(cursor) % 4)
+                values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+                if not isinstance(values, list) or len(values) != len(self.ordering):
+                    raise ValueError
+                start = bisect_right(self.rows, tuple(values), key=self.key)
+            except (ValueError, TypeError) as e:
+                raise InvalidCursor(cursor) from e
+
+        rows = self.rows[start:start + self.per_page + 1]
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            return rows, self.encode_cursor(rows[-1])
+        return rows, None
+
+    async def apage(self, cursor=None):
+        # Список уже в памяти
+        return self.page(cursor)
+
+
+def make_paginator(rows, ordering, per_page):
+    if isinstance(rows, list):
+        return ListKeysetPaginator(rows, ordering, per_page)
+    return KeysetPaginator(rows, ordering, per_page)
+
+
+def next_page_query(request, cursor_kwarg, next_cursor):
+    """Параметры следующей страницы с сохранением фильтров"""
+    query = request.GET.copy()
+    query.pop('format', None)
+    query[cursor_kwarg] = next_cursor or ''
+    return query.urlencode()
+
+
+class KeysetPaginationMixin:
+    """Keyset-пагинация для ListView с JSON-вариантом (?format=json)"""
+    keyset_ordering = ('id',)
+    paginate_by = 20
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = make_paginator(queryset, self.keyset_ordering, page_size)
+        try:
+            rows, self.next_cursor = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            # Битый курсор - отдаем первую страницу
+            rows, self.next_cursor = paginator.page()
+        return paginator, None, rows, self.next_cursor is not None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
+        context['next_query'] = next_page_query(self.request, self.cursor_kwarg, self.next_cursor)
+        return context
+
+    def serialize_object(self, obj):
+        return {'id': obj.pk}
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') == 'json':
+            return JsonResponse({
+                'results': [self.serialize_object(obj) for obj in context['object_list']],
+                'next_cursor': context['next_cursor'],
+            })
+        return super().render_to_response(context, **response_kwargs)
+
+
+class AsyncKeysetListView(View):
+    """Асинхронный аналог ListView + KeysetPaginationMixin для работы под ASGI
+
+    Шаблон получает те же переменные: object_list, context_object_name,
+    next_cursor и next_query. get_queryset() - корутина, которая может
+    вернуть queryset или уже отсортированный список словарей.
+    """
+    template_name = None
+    context_object_name = None
+    keyset_ordering = ('id',)
+    paginate_by = 20
+    cursor_kwarg = 'cursor'
+
+    async def get_queryset(self):
+        raise NotImplementedError
+
+    def get_template_names(self):
+        return [self.template_name]
+
+    def serialize_object(self, obj):
+        return {'id': obj.pk}
+
+    async def paginate(self, queryset):
+        paginator = make_paginator(queryset, self.keyset_ordering, self.paginate_by)
+        try:
+            return await paginator.apage(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            return await paginator.apage()
+
+    async def get_context_data(self, object_list, next_cursor):
+        context = {
+            'view': self,
+            'object_list': object_list,
+            'next_cursor': next_cursor,
+            'next_query': next_page_query(self.request, self.cursor_kwarg, next_cursor),
+        }
+        if self.context_object_name:
+            context[self.context_object_name] = object_list
+        return context
+
+    async def get(self, request, *args, **kwargs):
+        # Контекст-процессоры и шаблоны читают request.user синхронно:
+        # пользователь должен быть загружен заранее
+        request.user = await request.auser()
+        object_list, next_cursor = await self.paginate(await self.get_queryset())
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'results': [self.serialize_object(obj) for obj in object_list],
+                'next_cursor': next_cursor,
+            })
+        context = await self.get_context_data(object_list, next_cursor)
+        return render(request, self.get_template_names(), context)
@@ -0,0 +1,223 @@
+"""Отчеты по записям на прием
+
+Агрегация выполняется в БД (GROUP BY по врачу, услуге, категории,
+статусу и периоду), результат читается курсором порциями по CHUNK_SIZE
+и сразу уходит клиенту в CSV или XLSX - отчет за несколько лет не
+собирается в памяти ни на сервере приложения, ни целиком в ответе.
+"""
+import csv
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import Count, DecimalField, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Appointment
+
+CHUNK_SIZE = 2000
+
+PERIODS = {
+    'day': TruncDate,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Группировка: поля values() и подписи колонок
+GROUPINGS = {
+    'doctor': (('doctor_id', 'ID врача'), ('doctor__user__last_name', 'Фамилия'), ('doctor__user__first_name', 'Имя')),
+    'service': (('service_id', 'ID услуги'), ('service__name', 'Услуга')),
+    'category': (('service__category__name', 'Категория'),),
+    'status': (('status', 'Статус'),),
+}
+
+# Выручка - по оказанным услугам
+REVENUE_STATUSES = ('completed',)
+KOPECK = Decimal('0.01')
+
+METRICS = (
+    ('appointments', 'Записей'),
+    ('completed', 'Завершено'),
+    ('cancelled', 'Отменено'),
+    ('revenue', 'Выручка, руб.'),
+)
+
+
+def appointment_report(date_from=None, date_to=None, group_by=('doctor',), period='month', doctor_id=None):
+    """Queryset строк отчета (словари) в порядке периода и группировки
+
+    date_to не включается. Группировки - ключи GROUPINGS, period - ключ PERIODS или None.
+    """
+    queryset = Appointment.objects.order_by()
+    if date_from:
+        queryset = queryset.filter(date_time__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date_time__lt=date_to)
+    if doctor_id:
+        queryset = queryset.filter(doctor_id=doctor_id)
+
+    fields = []
+    if period:
+        queryset = queryset.annotate(period=PERIODS[period]('date_time', tzinfo=timezone.get_current_timezone()))
+        fields.append('period')
+    for name in group_by:
+        fields += [field for field, label in GROUPINGS[name]]
+
+    return queryset.values(*fields).annotate(
+        appointments=Count('id'),
+        completed=Count('id', filter=Q(status='completed')),
+        cancelled=Count('id', filter=Q(status='cancelled')),
+        revenue=Coalesce(
+            Sum('service__price', filter=Q(status__in=REVENUE_STATUSES)),
+            0,
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        ),
+    ).order_by(*fields)
+
+
+def report_columns(group_by=('doctor',), period='month'):
+    """(поле, подпись) колонок отчета в порядке вывода"""
+    columns = [('period', 'Период')] if period else []
+    for name in group_by:
+        columns += GROUPINGS[name]
+    return columns + list(METRICS)
+
+
+def report_rows(queryset, columns, chunk_size=CHUNK_SIZE):
+    """Строки отчета списками значений; из БД читается порциями"""
+    status_labels = dict(Appointment.STATUS_CHOICES)
+    for row in queryset.iterator(chunk_size=chunk_size):
+        values = []
+        for field, label in columns:
+            value = row[field]
+            if field == 'status':
+                value = status_labels.get(value, value)
+            elif field == 'revenue':
+                # SQLite возвращает сумму без копеек
+                value = Decimal(value).quantize(KOPECK)
+            values.append(value)
+        yield values
+
+
+class Echo:
+    """Псевдофайл для csv.writer: write() возвращает строку, а не пишет ее"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(Echo())
+    # BOM: Excel иначе откроет русский текст не в той кодировке
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+class _ChunkBuffer:
+    """Незаписываемый назад поток для zipfile: накопленные байты забираются через take()"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Отчет" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if value is None:
+        return '<c/>'
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(header, rows, chunk_size=CHUNK_SIZE):
+    """Минимальная книга XLSX (один лист, строки inline), собираемая на лету
+
+    zipfile пишет в поток без перемотки (дескрипторы данных после каждого
+    файла), поэтому сжатые байты отдаются клиенту по мере готовности.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield buffer.take()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row(header)
+            ).encode())
+            for number, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row).encode())
+                if number % chunk_size == 0:
+                    yield buffer.take()
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.take()
+
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', stream_csv),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', stream_xlsx),
+}
@@ -0,0 +1,121 @@
+"""Чтение каталога с реплики
+
+Если задана DATABASE_REPLICA_URL, запросы на чтение врачей, услуг
+и категорий уходят на реплику (алиас settings.REPLICA_DATABASE),
+а записи, пациенты и вся запись в базу - на основную.
+
+Реплика отстает от основной базы, поэтому чтение возвращается
+на основную:
+
+    - внутри транзакции на основной базе (бронирование читает услугу
+      и врача в той же транзакции, что и сохраняет запись)
+    - во время запроса, который меняет данные (POST и т.п.), и еще
+      REPLICA_PIN_SECONDS секунд после него для того же браузера
+      (cookie), чтобы пациент сразу увидел свою запись
+    - в блоке with use_primary()
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Модели каталога, которые можно читать с реплики
+REPLICA_MODELS = {
+    ('clinic', 'doctor'),
+    ('clinic', 'service'),
+    ('clinic', 'servicecategory'),
+    # Связь услуг и врачей (Service.doctors)
+    ('clinic', 'service_doctors'),
+}
+
+PIN_COOKIE = 'pin_primary'
+
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Все чтения в блоке - с основной базы"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def is_pinned():
+    return _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class ReplicaRouter:
+    """Каталог - с реплики, все остальное - с основной базы"""
+
+    def db_for_read(self, model, **hints):
+        replica = settings.REPLICA_DATABASE
+        if not replica or is_pinned():
+            return None
+        if (model._meta.app_label, model._meta.model_name) in REPLICA_MODELS:
+            return replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной базы, связи между ними допустимы
+        databases = {DEFAULT_DB_ALIAS, settings.REPLICA_DATABASE}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит с основной базы
+        if db == settings.REPLICA_DATABASE:
+            return False
+        return None
+
+
+class PrimaryPinningMiddleware:
+    """Чтение с основной базы во время и после запросов, меняющих данные"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _pinned.set(self.pin(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = _pinned.set(self.pin(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self.finish(request, response)
+
+    def pin(self, request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS') or PIN_COOKIE in request.COOKIES
+
+    def finish(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,145 @@
+"""Рабочее время врачей: недельное расписание минус отсутствия
+
+Правила DoctorSchedule раскрываются в рабочие интервалы по дням, из них
+вычитаются отсутствия DoctorTimeOff. Результат кэшируется на неделю врача
+(два запроса на промах), так что проверка записи и сетка слотов вычитают
+занятость из рабочего времени в памяти. Изменение расписания или отсутствий
+врача сбрасывает его кэш (см. signals.py).
+
+Врач без правил принимает ежедневно с WORK_START до WORK_END.
+"""
+import time
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.utils import timezone
+
+from .availability import BusyIntervals, working_bounds
+
+WEEK_KEY = 'clinic:schedule:{doctor_id}:{version}:{monday}'
+VERSION_KEY = 'clinic:schedule:{doctor_id}:version'
+
+# Страховка на случай пропущенной инвалидации
+WEEK_TIMEOUT = 60 * 60 * 24
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def expand_week(monday, rules, time_off):
+    """Рабочие интервалы по дням недели: {day: [(start, end), ...]}
+
+    rules - правила расписания врача (все, не только этой недели),
+    time_off - отсутствия (start, end), пересекающие неделю.
+    """
+    absent = BusyIntervals(time_off)
+    week = {}
+    for offset in range(7):
+        day = monday + timedelta(days=offset)
+        if rules:
+            intervals = [
+                (
+                    timezone.make_aware(datetime.combine(day, rule.start_time)),
+                    timezone.make_aware(datetime.combine(day, rule.end_time)),
+                )
+                for rule in rules if rule.applies_on(day)
+            ]
+        else:
+            intervals = [working_bounds(day)]
+        # Склеиваем пересекающиеся смены и вырезаем отсутствия
+        week[day] = [
+            gap
+            for start, end in BusyIntervals(intervals)
+            for gap in absent.gaps(start, end)
+        ]
+    return week
+
+
+def build_weeks(doctor_ids, monday):
+    """Читает расписание и отсутствия врачей на неделю из БД (2 запроса на всех)"""
+    from .models import DoctorSchedule, DoctorTimeOff
+
+    week_start_at = timezone.make_aware(datetime.combine(monday, datetime.min.time()))
+    week_end_at = week_start_at + timedelta(days=7)
+    rules = {doctor_id: [] for doctor_id in doctor_ids}
+    for rule in DoctorSchedule.objects.filter(doctor_id__in=doctor_ids):
+        rules[rule.doctor_id].append(rule)
+    time_off = {doctor_id: [] for doctor_id in doctor_ids}
+    absences = DoctorTimeOff.objects.filter(
+        doctor_id__in=doctor_ids, start__lt=week_end_at, end__gt=week_start_at
+    ).values_list('doctor_id', 'start', 'end')
+    for doctor_id, start, end in absences:
+        time_off[doctor_id].append((start, end))
+    return {doctor_id: expand_week(monday, rules[doctor_id], time_off[doctor_id]) for doctor_id in doctor_ids}
+
+
+def build_week(doctor_id, monday):
+    return build_weeks([doctor_id], monday)[doctor_id]
+
+
+def get_week(doctor_id, monday):
+    version = cache.get_or_set(VERSION_KEY.format(doctor_id=doctor_id), _new_version, None)
+    key = WEEK_KEY.format(doctor_id=doctor_id, version=version, monday=monday.isoformat())
+    week = cache.get(key)
+    if week is None:
+        week = build_week(doctor_id, monday)
+        cache.set(key, week, WEEK_TIMEOUT)
+    return week
+
+
+def get_weeks(doctor_ids, monday):
+    """get_week() для многих врачей: два get_many и одна сборка всех промахов"""
+    version_keys = {doctor_id: VERSION_KEY.format(doctor_id=doctor_id) for doctor_id in doctor_ids}
+    versions = cache.get_many(version_keys.values())
+    new_versions = {key: _new_version() for key in version_keys.values() if key not in versions}
+    if new_versions:
+        cache.set_many(new_versions, None)
+        versions.update(new_versions)
+
+    week_keys = {
+        doctor_id: WEEK_KEY.format(doctor_id=doctor_id, version=versions[key], monday=monday.isoformat())
+        for doctor_id, key in version_keys.items()
+    }
+    cached = cache.get_many(week_keys.values())
+    weeks = {doctor_id: cached[key] for doctor_id, key in week_keys.items() if key in cached}
+    missing = [doctor_id for doctor_id in doctor_ids if doctor_id not in weeks]
+    if missing:
+        built = build_weeks(missing, monday)
+        cache.set_many({week_keys[doctor_id]: built[doctor_id] for doctor_id in missing}, WEEK_TIMEOUT)
+        weeks.update(built)
+    return weeks
+
+
+async def aget_week(doctor_id, monday):
+    """get_week() для асинхронных вьюшек"""
+    version = await cache.aget_or_set(VERSION_KEY.format(doctor_id=doctor_id), _new_version, None)
+    key = WEEK_KEY.format(doctor_id=doctor_id, version=version, monday=monday.isoformat())
+    week = await cache.aget(key)
+    if week is None:
+        week = await sync_to_async(build_week)(doctor_id, monday)
+        await cache.aset(key, week, WEEK_TIMEOUT)
+    return week
+
+
+def working_intervals(doctor_id, day):
+    """Рабочие интервалы врача в день, по возрастанию"""
+    return get_week(doctor_id, week_start(day))[day]
+
+
+async def aworking_intervals(doctor_id, day):
+    return (await aget_week(doctor_id, week_start(day)))[day]
+
+
+def invalidate(doctor_id):
+    """Сбрасывает кэш рабочего времени врача на все недели"""
+    key = VERSION_KEY.format(doctor_id=doctor_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
@@ -0,0 +1,322 @@
+"""Полнотекстовый поиск по врачам и услугам
+
+Индекс - отдельная таблица clinic_search (создается миграцией 0011):
+на SQLite это виртуальная таблица FTS5, на PostgreSQL - tsvector с
+GIN-индексом. В индексе хранится все, что нужно для выдачи (имя,
+подпись, активность), поэтому поиск - это один запрос без JOIN.
+Индекс обновляется сигналами (см. signals.py); полная пересборка -
+команда rebuild_search_index.
+
+Номер строки индекса кодирует объект: object_id * 10 + код типа.
+"""
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+
+from .stemmer import WORD_RE, stem, stem_text
+
+TABLE = 'clinic_search'
+
+DOCTOR = 'doctor'
+SERVICE = 'service'
+KIND_CODES = {DOCTOR: 1, SERVICE: 2}
+KINDS = {code: kind for kind, code in KIND_CODES.items()}
+
+SEARCH_LIMIT = 50
+TYPEAHEAD_LIMIT = 8
+# Поиск в админке: дальше первой тысячи по релевантности никто не листает
+ADMIN_LIMIT = 1000
+BATCH_SIZE = 1000
+# Больше слов в запросе не нужно, а лишние только замедляют поиск
+MAX_TERMS = 8
+
+# Вес совпадения в названии относительно описания
+TITLE_WEIGHT = 10.0
+
+
+def row_id(kind, object_id):
+    return object_id * 10 + KIND_CODES[kind]
+
+
+def _terms(query):
+    return WORD_RE.findall((query or '').lower())[:MAX_TERMS]
+
+
+def _join(*parts):
+    return ' '.join(part for part in parts if part)
+
+
+def doctor_document(doctor):
+    """Поля индекса врача (doctor.user должен быть загружен)"""
+    name = _join(doctor.user.first_name, doctor.user.last_name) or doctor.user.username
+    return {
+        'id': row_id(DOCTOR, doctor.pk),
+        'label': name,
+        'detail': doctor.specialization,
+        'is_active': doctor.is_active,
+        'title': _join(name, doctor.specialization),
+        'body': _join(doctor.description, doctor.education),
+    }
+
+
+def service_document(service):
+    """Поля индекса услуги (service.category должна быть загружена)"""
+    category = service.category.name if service.category else ''
+    return {
+        'id': row_id(SERVICE, service.pk),
+        'label': service.name,
+        'detail': category,
+        'is_active': service.is_active,
+        'title': service.name,
+        'body': _join(service.description, service.full_description, category),
+    }
+
+
+class SQLiteBackend:
+    """FTS5: в индекс пишутся основы слов (русской морфологии в FTS5 нет)"""
+
+    def save(self, cursor, documents):
+        self.delete(cursor, [doc['id'] for doc in documents])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, label, detail, is_active, title, body) VALUES (%s, %s, %s, %s, %s, %s)",
+            [
+                (
+                    doc['id'], doc['label'], doc['detail'], int(doc['is_active']),
+                    ' '.join(stem_text(doc['title'])), ' '.join(stem_text(doc['body'])),
+                )
+                for doc in documents
+            ]
+        )
+
+    def delete(self, cursor, ids):
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [(pk,) for pk in ids])
+
+    def select(self, columns, terms, kind, active_only):
+        # Каждое слово - префикс основы: подходит и для подсказок по мере ввода
+        match = ' '.join(f'"{stem(term)}"*' for term in terms)
+        sql = f"SELECT {columns} FROM {TABLE} WHERE {TABLE} MATCH %s"
+        params = [match]
+        if kind:
+            sql += " AND rowid %% 10 = %s"
+            params.append(KIND_CODES[kind])
+        if active_only:
+            sql += " AND is_active = 1"
+        return sql, params
+
+    def query(self, cursor, terms, kind, active_only, limit):
+        sql, params = self.select('rowid, label, detail', terms, kind, active_only)
+        sql += f" ORDER BY bm25({TABLE}, 0, 0, 0, %s, 1.0) LIMIT %s"
+        params += [TITLE_WEIGHT, limit]
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    def ids(self, terms, kind):
+        return self.select('rowid / 10', terms, kind, False)
+
+
+class PostgreSQLBackend:
+    """tsvector с конфигурацией 'russian' и GIN-индекс"""
+
+    def save(self, cursor, documents):
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (id, label, detail, is_active, document) VALUES (%s, %s, %s, %s, "
+            f"setweight(to_tsvector('russian', %s), 'A') || setweight(to_tsvector('russian', %s), 'B')) "
+            f"ON CONFLICT (id) DO UPDATE SET label = EXCLUDED.label, detail = EXCLUDED.detail, "
+            f"is_active = EXCLUDED.is_active, document = EXCLUDED.document",
+            [
+                (doc['id'], doc['label'], doc['detail'], doc['is_active'], doc['title'], doc['body'])
+                for doc in documents
+            ]
+        )
+
+    def delete(self, cursor, ids):
+        if ids:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE id = ANY(%s)", [list(ids)])
+
+    def select(self, columns, terms, kind, active_only):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        sql = (
+            f"SELECT {columns} FROM {TABLE}, to_tsquery('russian', %s) query "
+            f"WHERE document @@ query"
+        )
+        params = [tsquery]
+        if kind:
+            sql += " AND id %% 10 = %s"
+            params.append(KIND_CODES[kind])
+        if active_only:
+            sql += " AND is_active"
+        return sql, params
+
+    def ids(self, terms, kind):
+        return self.select('id / 10', terms, kind, False)
+
+    def query(self, cursor, terms, kind, active_only, limit):
+        sql, params = self.select('id, label, detail', terms, kind, active_only)
+        # Вес 'A' (название) в 10 раз больше веса 'B' (описание)
+        sql += " ORDER BY ts_rank('{0, 0, 0.1, 1}'::float4[], document, query) DESC LIMIT %s"
+        params.append(limit)
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend(),
+    'postgresql': PostgreSQLBackend(),
+}
+
+
+def get_backend(conn=None):
+    """Бэкенд индекса для базы; None - база не поддерживается (поиск через LIKE)"""
+    return BACKENDS.get((conn or connection).vendor)
+
+
+def save_documents(documents, using=DEFAULT_DB_ALIAS):
+    conn = connections[using]
+    backend = get_backend(conn)
+    if backend and documents:
+        with conn.cursor() as cursor:
+            backend.save(cursor, documents)
+
+
+def index_doctors(doctors):
+    save_documents([doctor_document(doctor) for doctor in doctors])
+
+
+def index_services(services):
+    save_documents([service_document(service) for service in services])
+
+
+def remove(kind, ids):
+    backend = get_backend()
+    if backend:
+        with connection.cursor() as cursor:
+            backend.delete(cursor, [row_id(kind, pk) for pk in ids])
+
+
+def _batches(queryset, batch_size):
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            break
+        yield batch
+        last_pk = batch[-1].pk
+
+
+def rebuild(doctors=None, services=None, batch_size=BATCH_SIZE, using=DEFAULT_DB_ALIAS):
+    """Пересобирает индекс в базе using целиком; возвращает число проиндексированных объектов
+
+    doctors и services - querysets (в миграции - исторических моделей).
+    """
+    if doctors is None or services is None:
+        from .models import Doctor, Service
+        doctors = Doctor.objects.all() if doctors is None else doctors
+        services = Service.objects.all() if services is None else services
+
+    conn = connections[using]
+    if get_backend(conn) is None:
+        return 0
+
+    total = 0
+    # Одной транзакцией: поиск не увидит наполовину пустой индекс
+    with transaction.atomic(using=using):
+        with conn.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE}")
+        for batch in _batches(doctors.using(using).select_related('user'), batch_size):
+            save_documents([doctor_document(doctor) for doctor in batch], using)
+            total += len(batch)
+        for batch in _batches(services.using(using).select_related('category'), batch_size):
+            save_documents([service_document(service) for service in batch], using)
+            total += len(batch)
+    return total
+
+
+def _result(kind, object_id, label, detail):
+    return {
+        'kind': kind,
+        'id': object_id,
+        'label': label,
+        'detail': detail,
+        'url': f"{reverse('appointment_create')}?{kind}={object_id}",
+    }
+
+
+def _like_search(terms, kind, active_only, limit):
+    """Поиск без индекса для баз без полнотекстового поиска"""
+    from .models import Doctor, Service
+
+    results = []
+    if kind in (None, DOCTOR):
+        doctors = Doctor.objects.select_related('user')
+        if active_only:
+            doctors = doctors.filter(is_active=True)
+        for term in terms:
+            doctors = doctors.filter(
+                Q(user__first_name__icontains=term) | Q(user__last_name__icontains=term)
+                | Q(specialization__icontains=term)
+            )
+        results += [
+            _result(DOCTOR, d.pk, d.user.get_full_name() or d.user.username, d.specialization)
+            for d in doctors[:limit]
+        ]
+    if kind in (None, SERVICE):
+        services = Service.objects.select_related('category')
+        if active_only:
+            services = services.filter(is_active=True)
+        for term in terms:
+            services = services.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        results += [
+            _result(SERVICE, s.pk, s.name, s.category.name if s.category else '')
+            for s in services[:limit - len(results)]
+        ]
+    return results
+
+
+def search(query, kind=None, limit=SEARCH_LIMIT, active_only=True):
+    """Найденные врачи и услуги по убыванию релевантности
+
+    Каждый результат - словарь kind, id, label, detail, url.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    backend = get_backend()
+    if backend is None:
+        return _like_search(terms, kind, active_only, limit)
+
+    with connection.cursor() as cursor:
+        rows = backend.query(cursor, terms, kind, active_only, limit)
+    return [_result(KINDS[pk % 10], pk // 10, label, detail) for pk, label, detail in rows]
+
+
+def object_ids(kind, query, limit=ADMIN_LIMIT):
+    """id объектов одного типа для поиска в админке (включая неактивные)
+
+    None - база не поддерживается, нужен обычный поиск.
+    """
+    backend = get_backend()
+    if backend is None:
+        return None
+    terms = _terms(query)
+    if not terms:
+        return []
+    with connection.cursor() as cursor:
+        rows = backend.query(cursor, terms, kind, False, limit)
+    return [pk // 10 for pk, label, detail in rows]
+
+
+def ids_subquery(kind, query):
+    """Подзапрос id всех найденных объектов одного типа для filter(pk__in=...)
+
+    Без ограничения числа и без списка id в параметрах (фильтр каталога).
+    None - база не поддерживается, нужен обычный поиск.
+    """
+    backend = get_backend()
+    if backend is None:
+        return None
+    terms = _terms(query)
+    if not terms:
+        return RawSQL('SELECT NULL WHERE 1 = 0', [])
+    return RawSQL(*backend.ids(terms, kind))
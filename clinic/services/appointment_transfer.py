@@ -0,0 +1,225 @@
+"""Массовый импорт и экспорт записей на прием (CSV / JSON Lines)
+
+Врач, пациент и услуга в файле задаются ключами: логин врача, логин
+пациента и slug услуги. Импорт рассчитан на сотни тысяч строк из
+доверенного источника: ключи разрешаются по словарям, загруженным
+заранее, строки вставляются через bulk_create пачками (каждая пачка -
+своя транзакция), а Appointment.save()/clean() не вызываются. Пересечения
+активных записей врача проверяются для всей пачки одним запросом; если
+слот успели занять после проверки, пачка вставляется по одной строке.
+"""
+import csv
+import json
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from clinic.availability import ACTIVE_STATUSES, DEFAULT_DURATION, LOOKBACK, BusyIntervals
+from clinic.booking import is_slot_taken
+from clinic.models import Appointment, Doctor, Patient, Service
+
+FIELDS = ('doctor', 'patient', 'service', 'date_time', 'status', 'notes')
+FORMATS = ('csv', 'jsonl')
+STATUSES = {value for value, label in Appointment.STATUS_CHOICES}
+
+BATCH_SIZE = 5000
+
+CONFLICT = 'врач занят в это время'
+
+
+class RowError(Exception):
+    """Строку нельзя импортировать"""
+
+
+def read_rows(stream, fmt):
+    """Строки файла словарями, по одной (файл целиком не читается)"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_rows(stream, fmt, rows):
+    """Пишет строки (кортежи в порядке FIELDS); возвращает их число"""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+    else:
+        for count, row in enumerate(rows, 1):
+            stream.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n')
+    return count
+
+
+def export_rows(queryset, chunk_size=BATCH_SIZE):
+    """Записи в формате файла обмена; из БД читается порциями"""
+    rows = queryset.order_by('date_time', 'id').values_list(
+        'doctor__user__username', 'patient__user__username', 'service__slug',
+        'date_time', 'status', 'notes'
+    )
+    for doctor, patient, service, date_time, status, notes in rows.iterator(chunk_size=chunk_size):
+        yield doctor, patient or '', service, date_time.isoformat(), status, notes
+
+
+class AppointmentImporter:
+    """Импорт пачками с проверкой пересечений по всей пачке"""
+
+    def __init__(self, batch_size=BATCH_SIZE, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.imported = 0
+        self.skipped = 0
+        # (номер строки, причина)
+        self.errors = []
+
+        # Справочники целиком в памяти: три запроса вместо трех на строку
+        self.doctors = dict(Doctor.objects.values_list('user__username', 'id'))
+        self.patients = dict(Patient.objects.values_list('user__username', 'id'))
+        self.services = {
+            slug: (pk, duration or DEFAULT_DURATION)
+            for slug, pk, duration in Service.objects.values_list('slug', 'id', 'duration')
+        }
+
+    def parse(self, row):
+        """Строка файла -> (Appointment, длительность в минутах)"""
+        try:
+            doctor_id = self.doctors[row['doctor']]
+        except KeyError:
+            raise RowError(f"неизвестный врач {row.get('doctor')!r}")
+        try:
+            service_id, duration = self.services[row['service']]
+        except KeyError:
+            raise RowError(f"неизвестная услуга {row.get('service')!r}")
+
+        patient_id = None
+        if row.get('patient'):
+            try:
+                patient_id = self.patients[row['patient']]
+            except KeyError:
+                raise RowError(f"неизвестный пациент {row['patient']!r}")
+
+        date_time = parse_datetime(row.get('date_time') or '')
+        if date_time is None:
+            raise RowError(f"некорректная дата {row.get('date_time')!r}")
+        if timezone.is_naive(date_time):
+            date_time = timezone.make_aware(date_time)
+
+        status = row.get('status') or 'pending'
+        if status not in STATUSES:
+            raise RowError(f"неизвестный статус {status!r}")
+
+        appointment = Appointment(
+            doctor_id=doctor_id, service_id=service_id, patient_id=patient_id,
+            date_time=date_time, status=status, notes=row.get('notes') or ''
+        )
+        return appointment, duration
+
+    def find_conflicts(self, batch):
+        """Индексы активных записей пачки, пересекающихся с БД или друг с другом"""
+        active = [
+            (i, appointment, duration) for i, (appointment, duration) in enumerate(batch)
+            if appointment.status in ACTIVE_STATUSES
+        ]
+        if not active:
+            return set()
+
+        start = min(appointment.date_time for i, appointment, duration in active)
+        end = max(appointment.date_time + timedelta(minutes=duration) for i, appointment, duration in active)
+        doctor_ids = {appointment.doctor_id for i, appointment, duration in active}
+
+        # Занятость всех врачей пачки - одним запросом
+        existing = defaultdict(list)
+        for doctor_id, date_time, duration in Appointment.objects.filter(
+            doctor_id__in=doctor_ids,
+            status__in=ACTIVE_STATUSES,
+            date_time__gte=start - LOOKBACK,
+            date_time__lt=end
+        ).values_list('doctor_id', 'date_time', 'service__duration'):
+            existing[doctor_id].append((date_time, date_time + timedelta(minutes=duration or DEFAULT_DURATION)))
+        busy = {doctor_id: BusyIntervals(intervals) for doctor_id, intervals in existing.items()}
+
+        conflicts = set()
+        # Принятые строки пачки: при сортировке по началу пересечение с любой
+        # из них означает start < наибольшего конца среди предыдущих
+        accepted_end = {}
+        for i, appointment, duration in sorted(active, key=lambda item: item[1].date_time):
+            begin = appointment.date_time
+            finish = begin + timedelta(minutes=duration)
+            doctor_busy = busy.get(appointment.doctor_id)
+            if (doctor_busy and not doctor_busy.is_free(begin, finish)) or (
+                appointment.doctor_id in accepted_end and begin < accepted_end[appointment.doctor_id]
+            ):
+                conflicts.add(i)
+                continue
+            accepted_end[appointment.doctor_id] = max(accepted_end.get(appointment.doctor_id, finish), finish)
+        return conflicts
+
+    def import_batch(self, numbered_rows):
+        batch = []
+        line_numbers = []
+        for line, row in numbered_rows:
+            try:
+                batch.append(self.parse(row))
+                line_numbers.append(line)
+            except RowError as e:
+                self.skipped += 1
+                self.errors.append((line, str(e)))
+
+        conflicts = self.find_conflicts(batch)
+        for i in sorted(conflicts):
+            self.skipped += 1
+            self.errors.append((line_numbers[i], CONFLICT))
+
+        numbered = [
+            (line_numbers[i], appointment) for i, (appointment, duration) in enumerate(batch) if i not in conflicts
+        ]
+        if self.dry_run:
+            self.imported += len(numbered)
+            return
+        try:
+            with transaction.atomic():
+                Appointment.objects.bulk_create([appointment for line, appointment in numbered], batch_size=self.batch_size)
+            self.imported += len(numbered)
+        except IntegrityError:
+            # Слот занят записью, сделанной после проверки пересечений
+            # (запись с сайта): пачка откачена, вставляем строки по одной
+            self.insert_one_by_one(numbered)
+
+    def insert_one_by_one(self, numbered):
+        for line, appointment in numbered:
+            # id мог быть присвоен в откаченной пачке
+            appointment.pk, appointment._state.adding = None, True
+            try:
+                with transaction.atomic():
+                    Appointment.objects.bulk_create([appointment])
+            except IntegrityError as e:
+                self.skipped += 1
+                self.errors.append((line, CONFLICT if is_slot_taken(e, appointment) else str(e)))
+            else:
+                self.imported += 1
+
+    def run(self, rows, first_line=1):
+        """Импортирует строки; после каждой пачки отдает число обработанных строк
+
+        first_line - номер первой строки данных в файле (для CSV с заголовком - 2).
+        """
+        numbered = []
+        processed = 0
+        for line, row in enumerate(rows, first_line):
+            numbered.append((line, row))
+            if len(numbered) >= self.batch_size:
+                self.import_batch(numbered)
+                processed += len(numbered)
+                numbered = []
+                yield processed
+        if numbered:
+            self.import_batch(numbered)
+            processed += len(numbered)
+            yield processed
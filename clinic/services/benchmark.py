@@ -0,0 +1,310 @@
+"""Нагрузочные замеры страниц записи и списков
+
+Каждая страница запрашивается iterations раз после прогрева; для нее
+считаются перцентили времени ответа, пропускная способность, коды
+ответов и число SQL-запросов. Режимы:
+
+    wsgi - в процессе через django.test.Client (WSGIHandler)
+    asgi - в процессе через django.test.AsyncClient (ASGIHandler)
+    http - запросы к запущенному серверу (runserver, gunicorn, uvicorn)
+           с той же базой
+
+SQL-запросы считаются только в режиме wsgi: в остальных синхронные
+вьюшки выполняются в другом потоке или процессе со своим соединением.
+
+Замеры имеют смысл только на данных generate_load_data: пользователи
+load_patient0 и load_doctor0 используются для страниц, требующих входа.
+Результат сохраняется в JSON и сравнивается с предыдущим (compare()).
+"""
+import itertools
+import logging
+import math
+import platform
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from importlib import import_module
+
+import django
+import httpx
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from clinic.availability import WORK_START
+from clinic.models import Appointment, Doctor, Patient, Service, User
+from clinic.services import load_data
+
+MODES = ('wsgi', 'asgi', 'http')
+
+# Записи, созданные замером, помечаются и удаляются после него
+BENCHMARK_NOTE = 'benchmark'
+
+# Созданные записи кладутся далеко за пределы сгенерированных данных
+BOOKING_OFFSET = timedelta(days=2000)
+BOOKING_SLOTS_PER_DAY = 12
+BOOKING_STEP = timedelta(hours=1)
+
+# (имя, метод, URL name, пользователь: None / 'patient' / 'doctor')
+ENDPOINTS = [
+    ('home', 'GET', 'home', None),
+    ('doctor_list', 'GET', 'doctor_list', None),
+    ('service_list', 'GET', 'service_list', None),
+    ('appointment_list', 'GET', 'appointment_list', 'patient'),
+    ('appointment_create', 'GET', 'appointment_create', 'patient'),
+    ('appointment_create_post', 'POST', 'appointment_create', 'patient'),
+    ('doctor_dashboard', 'GET', 'doctor_dashboard', 'doctor'),
+    ('doctor_slots_api', 'GET', 'doctor_slots_api', None),
+    ('service_earliest_api', 'GET', 'service_earliest_api', None),
+]
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(timings, queries, statuses, elapsed):
+    """Сводка по одной странице (время в миллисекундах)"""
+    timings_ms = [t * 1000 for t in timings]
+    result = {
+        'requests': len(timings),
+        # Ошибки сервера и соединения (статус - имя исключения)
+        'errors': sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500),
+        'statuses': statuses,
+        'p50_ms': round(percentile(timings_ms, 50), 2),
+        'p95_ms': round(percentile(timings_ms, 95), 2),
+        'p99_ms': round(percentile(timings_ms, 99), 2),
+        'mean_ms': round(statistics.fmean(timings_ms), 2),
+        'rps': round(len(timings) / elapsed, 1) if elapsed else None,
+        'queries_p50': None,
+        'queries_max': None,
+    }
+    if queries:
+        result['queries_p50'] = percentile(queries, 50)
+        result['queries_max'] = max(queries)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def cleanup():
+    """Удаляет записи, созданные замерами"""
+    # По одной через delete(): счетчики статистики врача должны вернуться
+    for appointment in Appointment.objects.filter(notes=BENCHMARK_NOTE, date_time__gte=timezone.now() + BOOKING_OFFSET / 2):
+        appointment.delete()
+
+
+class Benchmark:
+    """Прогон всех страниц в одном режиме"""
+
+    def __init__(self, mode='wsgi', iterations=100, warmup=5, url=None, concurrency=1, endpoints=None):
+        self.mode = mode
+        self.iterations = iterations
+        self.warmup = warmup
+        self.url = (url or '').rstrip('/')
+        self.concurrency = concurrency
+        self.endpoints = [e for e in ENDPOINTS if not endpoints or e[0] in endpoints]
+        # Номера слотов для записей; next() атомарен и в потоках ThreadPoolExecutor
+        self.booking_numbers = itertools.count()
+
+        self.users = {'patient': self.find_user(Patient, 'load_patient0'), 'doctor': self.find_user(Doctor, 'load_doctor0')}
+        doctor = Doctor.objects.filter(services_offered__isnull=False).order_by('pk').first()
+        service = doctor and doctor.services_offered.filter(duration__lte=60).order_by('pk').first()
+        if service is None:
+            raise ValueError('Нет врача с услугой: сначала выполните generate_load_data')
+        self.booking = {'doctor': doctor.pk, 'service': service.pk}
+
+    def find_user(self, model, username):
+        profile = (
+            model.objects.filter(user__username=username).select_related('user').first()
+            or model.objects.select_related('user').order_by('pk').first()
+        )
+        if profile is None:
+            raise ValueError(f'Нет {model._meta.verbose_name_plural}: сначала выполните generate_load_data')
+        return profile.user
+
+    def booking_data(self):
+        """Данные формы записи на очередной свободный слот"""
+        number = next(self.booking_numbers)
+        day = timezone.localdate() + BOOKING_OFFSET + timedelta(days=number // BOOKING_SLOTS_PER_DAY)
+        start = datetime.combine(day, WORK_START) + BOOKING_STEP * (number % BOOKING_SLOTS_PER_DAY)
+        return {**self.booking, 'date_time': start.strftime('%Y-%m-%dT%H:%M'), 'notes': BENCHMARK_NOTE}
+
+    def endpoint_path(self, url_name):
+        if url_name == 'doctor_slots_api':
+            # Сетка на завтра для врача и услуги из формы записи
+            day = timezone.localdate() + timedelta(days=1)
+            path = reverse(url_name, args=[self.booking['doctor']])
+            return f"{path}?date={day.isoformat()}&service={self.booking['service']}"
+        if url_name == 'service_earliest_api':
+            return reverse(url_name, args=[self.booking['service']])
+        return reverse(url_name)
+
+    # --- Клиенты ---
+
+    def make_client(self, user):
+        if self.mode == 'http':
+            client = httpx.Client(base_url=self.url, follow_redirects=False, timeout=30)
+            if user:
+                client.cookies.set(settings.SESSION_COOKIE_NAME, self.session_for(user))
+            return client
+        client_class = AsyncClient if self.mode == 'asgi' else Client
+        # Ошибки страниц учитываются как ответы 500, а не прерывают замер
+        client = client_class(raise_request_exception=False)
+        if user:
+            client.force_login(user)
+        return client
+
+    def session_for(self, user):
+        """Сессия в БД для режима http (сервер использует ту же базу)"""
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.create()
+        return store.session_key
+
+    def request(self, client, method, path):
+        """Один запрос; возвращает код ответа (в режиме http - или имя ошибки соединения)"""
+        data = self.booking_data() if method == 'POST' else None
+        if self.mode == 'asgi':
+            call = client.post if method == 'POST' else client.get
+            return async_to_sync(call)(path, data).status_code
+        if self.mode == 'http':
+            try:
+                return self.http_request(client, method, path, data)
+            except httpx.HTTPError as e:
+                # Таймаут или обрыв соединения под нагрузкой - тоже результат замера
+                return type(e).__name__
+        call = client.post if method == 'POST' else client.get
+        return call(path, data).status_code
+
+    def http_request(self, client, method, path, data):
+        if method == 'POST':
+            # CSRF: токен из cookie, полученной вместе с формой
+            if 'csrftoken' not in client.cookies:
+                client.get(path)
+            data['csrfmiddlewaretoken'] = client.cookies.get('csrftoken', '')
+            return client.post(path, data=data, headers={'Referer': self.url + path}).status_code
+        return client.get(path).status_code
+
+    # --- Замер ---
+
+    def measure(self, method, path, user):
+        client = self.make_client(user)
+        for _ in range(self.warmup):
+            self.request(client, method, path)
+
+        timings, queries, statuses = [], [], {}
+
+        def one_request(worker_client):
+            started = time.perf_counter()
+            status = self.request(worker_client, method, path)
+            return time.perf_counter() - started, str(status)
+
+        started = time.perf_counter()
+        if self.mode == 'http' and self.concurrency > 1:
+            clients = [self.make_client(user) for _ in range(self.concurrency)]
+            with ThreadPoolExecutor(self.concurrency) as pool:
+                results = list(pool.map(lambda i: one_request(clients[i % len(clients)]), range(self.iterations)))
+        else:
+            results = []
+            for _ in range(self.iterations):
+                if self.mode != 'wsgi':
+                    results.append(one_request(client))
+                    continue
+                with CaptureQueriesContext(connection) as ctx:
+                    results.append(one_request(client))
+                queries.append(len(ctx))
+        elapsed = time.perf_counter() - started
+
+        for duration, status in results:
+            timings.append(duration)
+            statuses[status] = statuses.get(status, 0) + 1
+        return summarize(timings, queries, statuses, elapsed)
+
+    def run(self, report=None):
+        report = report or (lambda name, result: None)
+        cleanup()
+        results = {}
+        # Ответы 500 считаются в отчете; трассировка на каждый запрос не нужна
+        request_logger = logging.getLogger('django.request')
+        request_logger.disabled, logger_disabled = True, request_logger.disabled
+        # Тестовые клиенты обращаются к хосту testserver
+        hosts = override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+        hosts.enable()
+        try:
+            for name, method, url_name, user in self.endpoints:
+                path = self.endpoint_path(url_name)
+                results[name] = self.measure(method, path, self.users.get(user))
+                report(name, results[name])
+        finally:
+            hosts.disable()
+            request_logger.disabled = logger_disabled
+            cleanup()
+
+        anchor = load_data.anchor_date()
+        return {
+            'meta': {
+                'revision': git_revision(),
+                'created_at': timezone.now().isoformat(),
+                'mode': self.mode,
+                'iterations': self.iterations,
+                'concurrency': self.concurrency if self.mode == 'http' else 1,
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'data': {
+                    'doctors': Doctor.objects.count(),
+                    'services': Service.objects.count(),
+                    'patients': Patient.objects.count(),
+                    'appointments': Appointment.objects.count(),
+                    'users': User.objects.count(),
+                    # Даты записей отсчитаны от этого дня (generate_load_data --anchor-date)
+                    'anchor_date': anchor and anchor.isoformat(),
+                },
+            },
+            'endpoints': results,
+        }
+
+
+# Метрики для сравнения (для всех больше - хуже)
+COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_max')
+
+
+def compare(baseline, current, threshold=20.0):
+    """Изменения метрик относительно baseline; регрессия - рост больше threshold %
+
+    Возвращает список (страница, метрика, было, стало, изменение %, регрессия).
+    """
+    rows = []
+    for name, result in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        for metric in COMPARED:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else (0.0 if new == old else float('inf'))
+            # Число запросов должно совпадать точно, время - в пределах порога
+            regression = new > old if metric.startswith('queries') else change > threshold
+            rows.append((name, metric, old, new, round(change, 1), regression))
+    return rows
@@ -0,0 +1,173 @@
+"""Пропускная способность записи на прием при нескольких процессах
+
+Воркеры (отдельные процессы, как воркеры gunicorn) одновременно
+записывают пациента через booking.book() - так же, как форма записи.
+Слоты не пересекаются, но чередуются между несколькими врачами, так что
+процессы спорят за блокировку базы и строки DoctorDayLock одних и тех же дней.
+
+Профили соединения SQLite:
+
+    plain - как в Django по умолчанию: журнал DELETE, BEGIN DEFERRED
+    tuned - settings.SQLITE_OPTIONS (WAL, mmap, busy_timeout, BEGIN IMMEDIATE)
+
+Замер меняет режим журнала файла базы и возвращает WAL после прогона.
+Модели импортируются внутри функций: дочерний процесс (spawn) импортирует
+модуль до django.setup().
+"""
+import multiprocessing
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import django
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, connections
+from django.utils import timezone
+
+PROFILES = ('plain', 'tuned')
+
+# Сколько ждать воркеры, секунды
+WORKER_TIMEOUT = 600
+
+
+def profile_options(profile):
+    """OPTIONS соединения для профиля"""
+    if profile == 'tuned':
+        return dict(settings.SQLITE_OPTIONS)
+    return {}
+
+
+def database_file():
+    """Путь к файлу SQLite; ValueError для других баз"""
+    if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+        raise ValueError('Замер профилей SQLite выполняется только на файле базы SQLite')
+    return str(connection.settings_dict['NAME'])
+
+
+def set_journal_mode(path, mode):
+    # Режим журнала хранится в файле базы; менять его можно без других соединений
+    connections.close_all()
+    with sqlite3.connect(path) as db:
+        db.execute(f'PRAGMA journal_mode={mode}')
+    db.close()
+
+
+def plan_slots(processes, bookings, doctors):
+    """Слоты воркеров: [(doctor_id, service_id, patient_id, ISO-время), ...] на процесс"""
+    from clinic.availability import WORK_START
+    from clinic.models import Patient, Service
+    from clinic.services.benchmark import BOOKING_OFFSET, BOOKING_SLOTS_PER_DAY, BOOKING_STEP
+
+    # Врачи и у каждого - первая короткая услуга (один запрос)
+    services = {}
+    offered = (
+        Service.doctors.through.objects.filter(service__duration__lte=60)
+        .order_by('doctor_id', 'service_id')
+        .values_list('doctor_id', 'service_id')
+    )
+    for doctor_id, service_id in offered.iterator():
+        services.setdefault(doctor_id, service_id)
+        if len(services) == doctors:
+            break
+    patient = Patient.objects.order_by('pk').first()
+    if not services or patient is None:
+        raise ValueError('Нет врача с услугой или пациента: сначала выполните generate_load_data')
+    doctor_ids = list(services)
+
+    plan = [[] for _ in range(processes)]
+    first_day = timezone.localdate() + BOOKING_OFFSET
+    for number in range(processes * bookings):
+        # Соседние номера - у разных процессов и (по кругу) у одних и тех же врачей
+        doctor_id = doctor_ids[number % len(doctor_ids)]
+        index = number // len(doctor_ids)
+        day = first_day + timedelta(days=index // BOOKING_SLOTS_PER_DAY)
+        start = timezone.make_aware(datetime.combine(day, WORK_START) + BOOKING_STEP * (index % BOOKING_SLOTS_PER_DAY))
+        plan[number % processes].append((doctor_id, services[doctor_id], patient.pk, start.isoformat()))
+    return plan
+
+
+def _worker(options, slots, barrier, results):
+    django.setup()
+    from clinic import booking
+    from clinic.models import Appointment
+    from clinic.services.benchmark import BENCHMARK_NOTE
+
+    connection.settings_dict['OPTIONS'] = options
+    connection.ensure_connection()
+    outcomes = Counter()
+    barrier.wait()
+    started = time.time()
+    for doctor_id, service_id, patient_id, date_time in slots:
+        appointment = Appointment(
+            doctor_id=doctor_id, service_id=service_id, patient_id=patient_id,
+            date_time=datetime.fromisoformat(date_time), notes=BENCHMARK_NOTE,
+        )
+        try:
+            booking.book(appointment)
+            outcomes['booked'] += 1
+        except ValidationError as e:
+            outcomes['busy' if booking.TOO_BUSY in e.messages else 'rejected'] += 1
+        except DatabaseError:
+            # "database is locked", которую book() не стал повторять
+            outcomes['errors'] += 1
+    finished = time.time()
+    connection.close()
+    results.put((dict(outcomes), started, finished))
+
+
+def run_profile(profile, plan):
+    """Прогон плана в одном профиле; сводка по всем воркерам"""
+    path = database_file()
+    set_journal_mode(path, 'WAL' if profile == 'tuned' else 'DELETE')
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(len(plan))
+    results = context.Queue()
+    workers = [
+        context.Process(target=_worker, args=(profile_options(profile), slots, barrier, results))
+        for slots in plan
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        reports = [results.get(timeout=WORKER_TIMEOUT) for _ in workers]
+    finally:
+        for worker in workers:
+            worker.join()
+        set_journal_mode(path, 'WAL')
+
+    outcomes = Counter()
+    for worker_outcomes, started, finished in reports:
+        outcomes.update(worker_outcomes)
+    elapsed = max(finished for *_, finished in reports) - min(started for _, started, _ in reports)
+    return {
+        'profile': profile,
+        'processes': len(plan),
+        'attempts': sum(len(slots) for slots in plan),
+        'booked': outcomes['booked'],
+        'rejected': outcomes['rejected'],
+        'busy': outcomes['busy'],
+        'errors': outcomes['errors'],
+        'seconds': round(elapsed, 2),
+        'per_second': round(outcomes['booked'] / elapsed, 1) if elapsed else None,
+    }
+
+
+def run(profiles=PROFILES, processes=4, bookings=50, doctors=4, report=None):
+    """Прогон профилей по очереди на одном плане; записи замера удаляются"""
+    from clinic.services.benchmark import cleanup
+
+    report = report or (lambda result: None)
+    database_file()
+    plan = plan_slots(processes, bookings, doctors)
+    results = []
+    try:
+        for profile in profiles:
+            cleanup()
+            results.append(run_profile(profile, plan))
+            report(results[-1])
+    finally:
+        cleanup()
+    return results
@@ -0,0 +1,82 @@
+"""Локальный сервер, имитирующий Telegram Bot API (для тестов и отладки)"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+
+        with fake.lock:
+            if not self.path.endswith('/sendMessage'):
+                status, body = 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+            elif fake.rate_limited > 0:
+                fake.rate_limited -= 1
+                status, body = 429, {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {fake.retry_after}',
+                    'parameters': {'retry_after': fake.retry_after},
+                }
+            elif str(payload.get('chat_id')) in fake.blocked_chats:
+                status, body = 403, {
+                    'ok': False,
+                    'error_code': 403,
+                    'description': 'Forbidden: bot was blocked by the user',
+                }
+            else:
+                fake.messages.append(payload)
+                status, body = 200, {'ok': True, 'result': {'message_id': len(fake.messages)}}
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTelegramServer:
+    """Принимает sendMessage и запоминает сообщения
+
+    rate_limited - сколько первых запросов получат ответ 429,
+    blocked_chats - чаты, для которых бот "заблокирован" (403).
+    """
+
+    def __init__(self, rate_limited=0, retry_after=1, blocked_chats=()):
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.blocked_chats = {str(chat) for chat in blocked_chats}
+        self.messages = []
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,259 @@
+"""Синтетические данные для нагрузочного тестирования
+
+Одинаковые tier и seed дают одинаковый набор данных, поэтому все замеры
+производительности в проекте сравнимы между собой. Уровни:
+
+    tier     врачей  услуг    пациентов  месяцев  записей
+    tiny     10      30       100        1        ~1 000
+    small    50      200      2 000      3        ~20 000
+    medium   200     2 000    20 000     12       ~200 000
+    large    500     10 000   100 000    24       ~1 000 000
+    xl       1 000   100 000  300 000    36       ~3 000 000
+
+Записи распределены по рабочим дням (пн-сб, 8:00-20:00) так, что у врача
+нет пересечений; три четверти периода - до дня привязки, четверть - после.
+День привязки по умолчанию - сегодня (будущие записи нужны замерам
+записи на прием); для точного повтора набора его задают явно
+(generate_load_data --anchor-date). Он сохраняется как date_joined
+сгенерированных пользователей и попадает в результат run_benchmarks.
+Все пишется через bulk_create без сигналов, после чего пересобираются
+статистика врачей, поисковый индекс и кэш каталога.
+
+Сгенерированные объекты помечены префиксом (логины load_*, slug load-*)
+и удаляются clear().
+"""
+import random
+from datetime import datetime, timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from clinic import catalog, search, stats
+from clinic.availability import SLOT_STEP, WORK_END, WORK_START
+from clinic.models import Appointment, Doctor, Patient, Service, ServiceCategory, User
+
+TIERS = {
+    'tiny': {'doctors': 10, 'services': 30, 'patients': 100, 'months': 1, 'appointments': 1_000},
+    'small': {'doctors': 50, 'services': 200, 'patients': 2_000, 'months': 3, 'appointments': 20_000},
+    'medium': {'doctors': 200, 'services': 2_000, 'patients': 20_000, 'months': 12, 'appointments': 200_000},
+    'large': {'doctors': 500, 'services': 10_000, 'patients': 100_000, 'months': 24, 'appointments': 1_000_000},
+    'xl': {'doctors': 1_000, 'services': 100_000, 'patients': 300_000, 'months': 36, 'appointments': 3_000_000},
+}
+
+USERNAME_PREFIX = 'load_'
+SLUG_PREFIX = 'load-'
+BATCH_SIZE = 5000
+
+# Специализация врача и категория его услуг
+SPECIALIZATIONS = [
+    ('Терапевт', 'Терапия', 'Консультация терапевта'),
+    ('Кардиолог', 'Кардиология', 'ЭКГ'),
+    ('Невролог', 'Неврология', 'Консультация невролога'),
+    ('Хирург', 'Хирургия', 'Перевязка'),
+    ('Офтальмолог', 'Офтальмология', 'Проверка зрения'),
+    ('Стоматолог', 'Стоматология', 'Лечение кариеса'),
+    ('Эндокринолог', 'Эндокринология', 'УЗИ щитовидной железы'),
+    ('Гастроэнтеролог', 'Гастроэнтерология', 'УЗИ брюшной полости'),
+    ('Дерматолог', 'Дерматология', 'Дерматоскопия'),
+    ('Педиатр', 'Педиатрия', 'Осмотр ребенка'),
+]
+FIRST_NAMES = ['Иван', 'Мария', 'Алексей', 'Елена', 'Сергей', 'Ольга', 'Дмитрий', 'Анна', 'Павел', 'Наталья']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Козлов', 'Смирнов', 'Попов', 'Волков', 'Морозов', 'Орлов', 'Лебедев']
+DURATIONS = [30, 30, 30, 45, 60]
+
+# Доли статусов (прошедшие и будущие записи)
+PAST_STATUSES = [('completed', 0.82), ('cancelled', 0.15), ('pending', 0.03)]
+FUTURE_STATUSES = [('pending', 0.55), ('confirmed', 0.35), ('cancelled', 0.10)]
+
+# Доля периода до текущего момента
+PAST_SHARE = 0.75
+
+
+def clear():
+    """Удаляет сгенерированные данные"""
+    with transaction.atomic():
+        # Прямой DELETE без сигналов: иначе Django загрузит в память каждую запись
+        # ради счетчиков статистики, которые все равно пересобираются после генерации
+        doctors = Doctor.objects.filter(user__username__startswith=USERNAME_PREFIX).values('id')
+        sql, params = doctors.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {connection.ops.quote_name(Appointment._meta.db_table)} WHERE doctor_id IN ({sql})',
+                params
+            )
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        Service.objects.filter(slug__startswith=SLUG_PREFIX).delete()
+        ServiceCategory.objects.filter(slug__startswith=SLUG_PREFIX).delete()
+
+
+def anchor_date():
+    """День привязки сгенерированного набора (None, если набора нет)"""
+    joined = User.objects.filter(username__startswith=USERNAME_PREFIX).values_list('date_joined', flat=True).first()
+    return joined and timezone.localtime(joined).date()
+
+
+class LoadDataGenerator:
+    """Генератор одного набора данных; report - функция для сообщений о ходе работы"""
+
+    def __init__(self, doctors, services, patients, months, appointments, seed=42,
+                 batch_size=BATCH_SIZE, report=None, anchor_date=None):
+        self.sizes = {'doctors': doctors, 'services': services, 'patients': patients}
+        self.months = months
+        self.appointments = appointments
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.report = report or (lambda message: None)
+        # Даты отсчитываются от дня привязки, все остальное определяется seed
+        self.today = anchor_date or timezone.localdate()
+
+    def create_users(self, count, role, kind):
+        users = [
+            User(
+                username=f'{USERNAME_PREFIX}{kind}{i}',
+                first_name=self.random.choice(FIRST_NAMES),
+                last_name=self.random.choice(LAST_NAMES),
+                role=role,
+                # Непригодный пароль: хэшировать сотни тысяч паролей долго
+                password='!',
+                date_joined=timezone.make_aware(datetime.combine(self.today, WORK_START)),
+            )
+            for i in range(count)
+        ]
+        return User.objects.bulk_create(users, batch_size=self.batch_size)
+
+    def create_catalog(self):
+        categories = ServiceCategory.objects.bulk_create([
+            ServiceCategory(name=category, slug=f'{SLUG_PREFIX}category-{i}', order=i)
+            for i, (specialization, category, service) in enumerate(SPECIALIZATIONS)
+        ])
+
+        users = self.create_users(self.sizes['doctors'], User.DOCTOR, 'doctor')
+        doctors = Doctor.objects.bulk_create([
+            Doctor(
+                user=user,
+                specialization=SPECIALIZATIONS[i % len(SPECIALIZATIONS)][0],
+                room=str(100 + i % 400),
+                experience=self.random.randint(1, 35),
+                rating=round(self.random.uniform(3.5, 5.0), 1),
+            )
+            for i, user in enumerate(users)
+        ], batch_size=self.batch_size)
+        self.report(f"Врачей: {len(doctors)}")
+
+        services = Service.objects.bulk_create([
+            Service(
+                name=f'{SPECIALIZATIONS[i % len(SPECIALIZATIONS)][2]} №{i}',
+                slug=f'{SLUG_PREFIX}service-{i}',
+                description=f'{SPECIALIZATIONS[i % len(SPECIALIZATIONS)][1]}: прием и диагностика',
+                price=self.random.randrange(500, 15000, 100),
+                duration=self.random.choice(DURATIONS),
+                category=categories[i % len(categories)],
+                is_popular=self.random.random() < 0.1,
+                order=i,
+            )
+            for i in range(self.sizes['services'])
+        ], batch_size=self.batch_size)
+        self.report(f"Услуг: {len(services)}")
+
+        # Каждую услугу оказывают 1-3 врача той же специализации
+        doctors_by_group = {}
+        for i, doctor in enumerate(doctors):
+            doctors_by_group.setdefault(i % len(SPECIALIZATIONS), []).append(doctor)
+        links = []
+        self.doctor_services = {doctor.pk: [] for doctor in doctors}
+        for i, service in enumerate(services):
+            group = doctors_by_group.get(i % len(SPECIALIZATIONS)) or doctors
+            for doctor in self.random.sample(group, min(len(group), self.random.randint(1, 3))):
+                links.append(Service.doctors.through(service_id=service.pk, doctor_id=doctor.pk))
+                self.doctor_services[doctor.pk].append((service.pk, service.duration))
+        Service.doctors.through.objects.bulk_create(links, batch_size=self.batch_size)
+        self.report(f"Связей врач-услуга: {len(links)}")
+
+        # Врачу без услуг достается любая
+        for doctor_id, offered in self.doctor_services.items():
+            if not offered:
+                service = self.random.choice(services)
+                offered.append((service.pk, service.duration))
+        self.doctor_ids = [doctor.pk for doctor in doctors]
+
+    def create_patients(self):
+        users = self.create_users(self.sizes['patients'], User.CLIENT, 'patient')
+        patients = Patient.objects.bulk_create([
+            Patient(
+                user=user,
+                phone=f'+7900{i:07d}',
+                birth_date=self.today - timedelta(days=self.random.randint(18 * 365, 85 * 365)),
+            )
+            for i, user in enumerate(users)
+        ], batch_size=self.batch_size)
+        self.patient_ids = [patient.pk for patient in patients]
+        self.report(f"Пациентов: {len(patients)}")
+
+    def working_days(self):
+        total_days = self.months * 30
+        first = self.today - timedelta(days=int(total_days * PAST_SHARE))
+        days = (first + timedelta(days=i) for i in range(total_days))
+        return [day for day in days if day.weekday() != 6]
+
+    def pick_status(self, is_past):
+        choices = PAST_STATUSES if is_past else FUTURE_STATUSES
+        return self.random.choices([s for s, w in choices], [w for s, w in choices])[0]
+
+    def day_appointments(self, doctor_id, day, count):
+        """Записи врача на день подряд по сетке, без пересечений"""
+        slot = timezone.make_aware(datetime.combine(day, WORK_START))
+        end = timezone.make_aware(datetime.combine(day, WORK_END))
+        is_past = day < self.today
+        offered = self.doctor_services[doctor_id]
+        for _ in range(count):
+            # Иногда между приемами остается окно
+            slot += SLOT_STEP * self.random.choice([0, 0, 0, 1])
+            service_id, duration = self.random.choice(offered)
+            finish = slot + timedelta(minutes=duration)
+            if finish > end:
+                break
+            yield Appointment(
+                doctor_id=doctor_id,
+                service_id=service_id,
+                patient_id=self.random.choice(self.patient_ids) if self.patient_ids else None,
+                date_time=slot,
+                status=self.pick_status(is_past),
+            )
+            # Следующий прием начинается с узла сетки
+            steps = -(-duration // int(SLOT_STEP.total_seconds() // 60))
+            slot += SLOT_STEP * steps
+
+    def create_appointments(self):
+        days = self.working_days()
+        per_doctor_day = self.appointments / max(1, len(days) * len(self.doctor_ids))
+        batch = []
+        created = 0
+        for day in days:
+            for doctor_id in self.doctor_ids:
+                # Целое число записей со средним per_doctor_day
+                count = int(per_doctor_day) + (self.random.random() < per_doctor_day % 1)
+                batch.extend(self.day_appointments(doctor_id, day, count))
+                if len(batch) >= self.batch_size:
+                    created += self.flush(batch)
+                    batch = []
+            if day.day == 1:
+                self.report(f"Записей: {created} (до {day:%d.%m.%Y})")
+        created += self.flush(batch)
+        self.report(f"Записей: {created}")
+        return created
+
+    def flush(self, batch):
+        with transaction.atomic():
+            Appointment.objects.bulk_create(batch, batch_size=self.batch_size)
+        return len(batch)
+
+    def run(self):
+        with transaction.atomic():
+            self.create_catalog()
+            self.create_patients()
+        self.create_appointments()
+
+        self.report("Пересборка статистики врачей и поискового индекса")
+        stats.rebuild()
+        search.rebuild()
+        catalog.invalidate()
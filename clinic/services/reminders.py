@@ -0,0 +1,79 @@
+"""Рассылка напоминаний о предстоящих приемах"""
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from clinic.availability import ACTIVE_STATUSES
+from clinic.models import Appointment, Patient, TelegramMessage
+
+# Окна напоминаний: (поле-отметка, за сколько до приема, окно следующего напоминания)
+# Напоминание за 24 ч не отправляется, если уже наступило время напоминания за 2 ч
+REMINDER_WINDOWS = [
+    ('reminder_24h_sent_at', timedelta(hours=24), timedelta(hours=2)),
+    ('reminder_2h_sent_at', timedelta(hours=2), timedelta(0)),
+]
+
+BATCH_SIZE = 500
+
+
+def due_appointments(field, lead, skip, now):
+    """Записи, вошедшие в окно напоминания (использует частичный индекс по date_time)"""
+    return Appointment.objects.filter(**{
+        'status__in': ACTIVE_STATUSES,
+        f'{field}__isnull': True,
+        'date_time__gt': now + skip,
+        'date_time__lte': now + lead,
+    })
+
+
+def claim(field, ids, now):
+    """Атомарно помечает записи как уведомленные и возвращает те, что пометил этот запуск
+
+    UPDATE ... WHERE <поле> IS NULL меняет каждую строку ровно один раз, поэтому
+    параллельные и повторные запуски не отправят напоминание дважды. "Свои"
+    строки - с меткой этого вызова: отметки времени двух запусков могут совпасть.
+    """
+    token = uuid.uuid4().hex
+    Appointment.objects.filter(id__in=ids, **{f'{field}__isnull': True}).update(
+        **{field: now, 'reminder_claim': token}
+    )
+    return (
+        Appointment.objects.filter(id__in=ids, reminder_claim=token)
+        .select_related('patient', 'doctor__user', 'service')
+    )
+
+
+def send_reminders(batch_size=BATCH_SIZE, now=None):
+    """Один проход рассылки; возвращает число поставленных в очередь сообщений по окнам"""
+    now = now or timezone.now()
+    queued = {}
+    for field, lead, skip in REMINDER_WINDOWS:
+        queued[field] = 0
+        while True:
+            ids = list(
+                due_appointments(field, lead, skip, now)
+                .order_by('date_time')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            # Отметка и сообщения - одной транзакцией: при сбое между ними
+            # запись не останется "уведомленной" без сообщения
+            with transaction.atomic():
+                messages = []
+                for appointment in claim(field, ids, timezone.now()):
+                    patient = appointment.patient
+                    if not patient or not patient.telegram_id:
+                        continue
+                    text, keyboard = Patient.build_reminder(appointment)
+                    messages.append(TelegramMessage(chat_id=patient.telegram_id, text=text, keyboard=keyboard))
+
+                TelegramMessage.objects.bulk_create(messages, batch_size=batch_size)
+            queued[field] += len(messages)
+
+            if len(ids) < batch_size:
+                break
+    return queued
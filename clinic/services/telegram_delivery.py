@@ -0,0 +1,211 @@
+"""Доставка очереди сообщений Telegram (TelegramMessage)"""
+import asyncio
+import time
+import uuid
+from datetime import timedelta
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from clinic.models import TelegramMessage
+
+# Сколько раз пытаемся отправить сообщение, прежде чем считать его неотправляемым
+MAX_ATTEMPTS = 5
+
+# Экспоненциальная задержка между попытками (секунды)
+BACKOFF_BASE = 2
+BACKOFF_MAX = 600
+
+# Через сколько "зависшее" сообщение (упавший обработчик) снова берется в работу
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+SENT = 'sent'
+RETRY = 'retry'
+FAILED = 'failed'
+DEFERRED = 'deferred'
+
+
+class RateLimiter:
+    """Ограничение частоты отправки: общее и для каждого чата
+
+    Каждый вызов acquire() резервирует следующий свободный слот, поэтому
+    параллельные отправки равномерно распределяются во времени.
+    """
+
+    def __init__(self, global_rate, chat_interval):
+        self.global_interval = 1 / global_rate
+        self.chat_interval = chat_interval
+        self._next_global = 0.0
+        self._next_chat = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, chat_id):
+        """Ждет слот отправки; возвращает задержку, если чат пока занят"""
+        async with self._lock:
+            now = time.monotonic()
+            chat_ready = self._next_chat.get(chat_id, 0.0)
+            if chat_ready > now:
+                return chat_ready - now
+
+            start = max(now, self._next_global)
+            self._next_global = start + self.global_interval
+            self._next_chat[chat_id] = start + self.chat_interval
+
+            if len(self._next_chat) > 10000:
+                self._next_chat = {
+                    chat: ready for chat, ready in self._next_chat.items() if ready > now
+                }
+
+        if start > now:
+            await asyncio.sleep(start - now)
+        return 0
+
+    def pause(self, seconds):
+        """Приостанавливает все отправки (ответ 429 от Telegram)"""
+        self._next_global = max(self._next_global, time.monotonic() + seconds)
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+class TelegramWorker:
+    """Обработчик очереди: берет пачку сообщений и отправляет их параллельно"""
+
+    def __init__(self, api_url=None, token=None, concurrency=10, batch_size=100):
+        self.api_url = (api_url or settings.TELEGRAM_API_URL).rstrip('/')
+        self.token = token or settings.TELEGRAM_BOT_TOKEN
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(settings.TELEGRAM_RATE_LIMIT, settings.TELEGRAM_CHAT_INTERVAL)
+
+    def claim_batch(self):
+        """Помечает пачку готовых к отправке сообщений меткой этого обработчика"""
+        now = timezone.now()
+        available = (
+            Q(status=TelegramMessage.PENDING, next_attempt_at__lte=now)
+            | Q(status=TelegramMessage.SENDING, claimed_at__lt=now - CLAIM_TIMEOUT)
+        )
+        ids = list(
+            TelegramMessage.objects.filter(available)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:self.batch_size]
+        )
+        if not ids:
+            return []
+
+        # Условие повторяется в UPDATE: строку, которую уже забрал другой
+        # обработчик, мы не получим
+        claim = uuid.uuid4().hex
+        TelegramMessage.objects.filter(available, id__in=ids).update(
+            status=TelegramMessage.SENDING, claim=claim, claimed_at=now
+        )
+        return list(TelegramMessage.objects.filter(claim=claim))
+
+    def save_batch(self, messages):
+        TelegramMessage.objects.bulk_update(messages, [
+            'status', 'attempts', 'next_attempt_at', 'claim', 'claimed_at',
+            'last_error', 'latency_ms', 'sent_at',
+        ])
+
+    async def send(self, client, message):
+        """Отправляет одно сообщение; возвращает (результат, задержка, ошибка, время мс)"""
+        delay = await self.limiter.acquire(message.chat_id)
+        if delay:
+            return DEFERRED, delay, '', None
+
+        payload = {'chat_id': message.chat_id, 'text': message.text, 'parse_mode': 'HTML'}
+        if message.keyboard:
+            payload['reply_markup'] = message.keyboard
+
+        started = time.monotonic()
+        try:
+            response = await client.post(f'{self.api_url}/bot{self.token}/sendMessage', json=payload)
+        except httpx.HTTPError as e:
+            return RETRY, None, f'{type(e).__name__}: {e}', None
+        latency = int((time.monotonic() - started) * 1000)
+
+        if response.status_code == 200:
+            return SENT, None, '', latency
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        error = f"{response.status_code}: {data.get('description', response.text[:200])}"
+
+        if response.status_code == 429:
+            retry_after = (data.get('parameters') or {}).get('retry_after', BACKOFF_BASE)
+            self.limiter.pause(retry_after)
+            return RETRY, retry_after, error, latency
+        if response.status_code >= 500:
+            return RETRY, None, error, latency
+        # 400/403: чат не найден, бот заблокирован и т.п. - повтор не поможет
+        return FAILED, None, error, latency
+
+    def apply_result(self, message, result):
+        outcome, delay, error, latency = result
+        now = timezone.now()
+        message.claim = ''
+        message.claimed_at = None
+        message.latency_ms = latency
+
+        if outcome == SENT:
+            message.attempts += 1
+            message.status = TelegramMessage.SENT
+            message.sent_at = now
+            message.last_error = ''
+        elif outcome == DEFERRED:
+            message.status = TelegramMessage.PENDING
+            message.next_attempt_at = now + timedelta(seconds=delay)
+        else:
+            message.attempts += 1
+            message.last_error = error
+            if outcome == FAILED or message.attempts >= MAX_ATTEMPTS:
+                message.status = TelegramMessage.FAILED
+            else:
+                message.status = TelegramMessage.PENDING
+                message.next_attempt_at = now + timedelta(seconds=delay or backoff(message.attempts))
+
+    async def process_batch(self, client):
+        """Отправляет одну пачку; возвращает статистику по результатам"""
+        messages = await sync_to_async(self.claim_batch)()
+        if not messages:
+            return {}
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send_limited(message):
+            async with semaphore:
+                return await self.send(client, message)
+
+        results = await asyncio.gather(*(send_limited(message) for message in messages))
+
+        stats = {SENT: 0, RETRY: 0, FAILED: 0, DEFERRED: 0, 'latency_ms': []}
+        for message, result in zip(messages, results):
+            self.apply_result(message, result)
+            stats[result[0]] += 1
+            if result[0] == SENT:
+                stats['latency_ms'].append(result[3])
+
+        await sync_to_async(self.save_batch)(messages)
+        return stats
+
+    async def run(self, once=False, poll_interval=1.0, on_batch=None):
+        """Разбирает очередь; с once=True - только то, что готово к отправке сейчас"""
+        limits = httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency
+        )
+        async with httpx.AsyncClient(limits=limits, timeout=10) as client:
+            while True:
+                stats = await self.process_batch(client)
+                if stats and on_batch:
+                    on_batch(stats)
+                if not stats:
+                    if once:
+                        return
+                    await asyncio.sleep(poll_interval)
@@ -0,0 +1,38 @@
+from django.conf import settings
+
+
+class TelegramService:
+    """Сервис для работы с Telegram
+
+    Сообщения не отправляются сразу, а ставятся в очередь (TelegramMessage).
+    Доставкой занимается отдельный процесс: python manage.py telegram_worker
+    """
+
+    @property
+    def token(self):
+        return settings.TELEGRAM_BOT_TOKEN
+
+    @staticmethod
+    def create_inline_keyboard(buttons):
+        """Создает inline-клавиатуру (отдельные кнопки размещаются по одной в ряд)"""
+        return {"inline_keyboard": [row if isinstance(row, list) else [row] for row in buttons]}
+
+    @staticmethod
+    def create_button(text, callback_data):
+        """Создает кнопку"""
+        return {"text": text, "callback_data": callback_data}
+
+    @staticmethod
+    def send_message(telegram_id, message, keyboard=None):
+        """Ставит сообщение в очередь на отправку"""
+        from clinic.models import TelegramMessage
+
+        TelegramMessage.objects.create(
+            chat_id=str(telegram_id),
+            text=message,
+            keyboard=keyboard
+        )
+        return True
+
+# Создаем экземпляр сервиса
+telegram_service = TelegramService()
@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import catalog, images, schedule, search, stats
+from .models import Appointment, Doctor, DoctorSchedule, DoctorTimeOff, Service, ServiceCategory, User
+
+
+def invalidate_catalog_on_commit():
+    # После коммита: иначе параллельный запрос успеет собрать каталог из старых данных
+    transaction.on_commit(catalog.invalidate)
+
+
+@receiver(post_save, sender=Doctor, dispatch_uid='catalog_doctor_saved')
+@receiver(post_delete, sender=Doctor, dispatch_uid='catalog_doctor_deleted')
+@receiver(post_save, sender=Service, dispatch_uid='catalog_service_saved')
+@receiver(post_delete, sender=Service, dispatch_uid='catalog_service_deleted')
+@receiver(post_save, sender=ServiceCategory, dispatch_uid='catalog_category_saved')
+@receiver(post_delete, sender=ServiceCategory, dispatch_uid='catalog_category_deleted')
+@receiver(m2m_changed, sender=Service.doctors.through, dispatch_uid='catalog_service_doctors_changed')
+def catalog_changed(sender, **kwargs):
+    """Изменение врачей, услуг или категорий сбрасывает кэш каталога"""
+    invalidate_catalog_on_commit()
+
+
+# Поля User, которые попадают в каталог и поисковый индекс
+DOCTOR_NAME_FIELDS = {'first_name', 'last_name', 'username', 'role'}
+
+
+def doctor_name_changed(instance, update_fields):
+    # update_last_login() и т.п. сохраняют только свои поля: имя врача не изменилось
+    if update_fields is not None and not DOCTOR_NAME_FIELDS.intersection(update_fields):
+        return False
+    return instance.role == User.DOCTOR
+
+
+@receiver(post_save, sender=User, dispatch_uid='catalog_doctor_user_saved')
+def doctor_user_changed(sender, instance, update_fields=None, **kwargs):
+    """Имя врача хранится в User"""
+    if doctor_name_changed(instance, update_fields):
+        invalidate_catalog_on_commit()
+
+
+@receiver(post_save, sender=Doctor, dispatch_uid='images_doctor_saved')
+@receiver(post_save, sender=Service, dispatch_uid='images_service_saved')
+def enqueue_image(sender, instance, raw=False, **kwargs):
+    """Новое фото врача или изображение услуги - в очередь на уменьшенные копии"""
+    if not raw:
+        images.enqueue(instance)
+
+
+@receiver(post_save, sender=Doctor, dispatch_uid='search_doctor_saved')
+def index_doctor(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_doctors([instance])
+
+
+@receiver(post_save, sender=Service, dispatch_uid='search_service_saved')
+def index_service(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_services([instance])
+
+
+@receiver(post_delete, sender=Doctor, dispatch_uid='search_doctor_deleted')
+@receiver(post_delete, sender=Service, dispatch_uid='search_service_deleted')
+def remove_from_index(sender, instance, **kwargs):
+    kind = search.DOCTOR if sender is Doctor else search.SERVICE
+    search.remove(kind, [instance.pk])
+
+
+@receiver(post_save, sender=User, dispatch_uid='search_doctor_user_saved')
+def index_doctor_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Имя врача хранится в User"""
+    if not raw and doctor_name_changed(instance, update_fields):
+        search.index_doctors(Doctor.objects.filter(user=instance).select_related('user'))
+
+
+@receiver(post_save, sender=ServiceCategory, dispatch_uid='search_category_saved')
+def index_category_services(sender, instance, raw=False, **kwargs):
+    """Название категории входит в документ услуги"""
+    if not raw:
+        search.index_services(instance.services.select_related('category'))
+
+
+@receiver(pre_delete, sender=ServiceCategory, dispatch_uid='search_category_deleted')
+def index_category_services_on_delete(sender, instance, **kwargs):
+    # После удаления у услуг уже не найти удаленную категорию: id запоминаем заранее
+    service_ids = list(instance.services.values_list('id', flat=True))
+    transaction.on_commit(
+        lambda: search.index_services(Service.objects.filter(pk__in=service_ids).select_related('category'))
+    )
+
+
+@receiver(pre_save, sender=Appointment, dispatch_uid='stats_appointment_pre_save')
+def remember_stats_key(sender, instance, **kwargs):
+    """Прежние врач, день и статус записи - из БД, а не из экземпляра"""
+    old = None
+    if instance.pk:
+        old = Appointment.objects.filter(pk=instance.pk).values_list('doctor_id', 'date_time', 'status').first()
+    instance._stats_old_key = stats.stats_key(*old) if old else None
+
+
+@receiver(post_save, sender=Appointment, dispatch_uid='stats_appointment_saved')
+def update_stats_on_save(sender, instance, **kwargs):
+    new_key = stats.stats_key(instance.doctor_id, instance.date_time, instance.status)
+    stats.move(getattr(instance, '_stats_old_key', None), new_key)
+    instance._stats_old_key = new_key
+
+
+@receiver(post_delete, sender=Appointment, dispatch_uid='stats_appointment_deleted')
+def update_stats_on_delete(sender, instance, **kwargs):
+    stats.bump(stats.stats_key(instance.doctor_id, instance.date_time, instance.status), -1)
+
+
+@receiver(post_save, sender=DoctorSchedule, dispatch_uid='schedule_rule_saved')
+@receiver(post_delete, sender=DoctorSchedule, dispatch_uid='schedule_rule_deleted')
+@receiver(post_save, sender=DoctorTimeOff, dispatch_uid='schedule_time_off_saved')
+@receiver(post_delete, sender=DoctorTimeOff, dispatch_uid='schedule_time_off_deleted')
+def schedule_changed(sender, instance, **kwargs):
+    """Изменение расписания или отсутствий сбрасывает кэш рабочего времени врача"""
+    doctor_id = instance.doctor_id
+    transaction.on_commit(lambda: schedule.invalidate(doctor_id))
@@ -0,0 +1,138 @@
+"""Статистика записей врача для панели управления
+
+Вместо COUNT по всей истории записей панель читает две строки
+DoctorDailyStats: за сегодня и итог за все время (day=None). Счетчики
+меняются на +1/-1 при создании, смене статуса или времени и удалении
+записи (см. signals.py). Массовые операции в обход сигналов
+(bulk_create, QuerySet.update статуса) счетчики не трогают - для них
+есть команда rebuild_doctor_stats (пересборка и проверка расхождений).
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+STATUSES = ('pending', 'confirmed', 'completed', 'cancelled')
+COUNTERS = ('total',) + STATUSES
+
+
+def _models(apps=None):
+    if apps is None:
+        from .models import Appointment, DoctorDailyStats
+        return Appointment, DoctorDailyStats
+    return apps.get_model('clinic', 'Appointment'), apps.get_model('clinic', 'DoctorDailyStats')
+
+
+def stats_key(doctor_id, date_time, status):
+    """Ключ счетчиков записи: (врач, день по местному времени, статус)"""
+    return doctor_id, timezone.localtime(date_time).date(), status
+
+
+def _bump_row(doctor_id, day, status, delta):
+    _, DoctorDailyStats = _models()
+    rows = DoctorDailyStats.objects.filter(doctor_id=doctor_id, day=day)
+    changes = {'total': F('total') + delta, status: F(status) + delta}
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DoctorDailyStats.objects.create(doctor_id=doctor_id, day=day, total=delta, **{status: delta})
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        rows.update(**changes)
+
+
+def bump(key, delta):
+    """Прибавляет delta к счетчикам дня и итогу за все время"""
+    doctor_id, day, status = key
+    if status not in STATUSES:
+        return
+    _bump_row(doctor_id, day, status, delta)
+    _bump_row(doctor_id, None, status, delta)
+
+
+def move(old_key, new_key):
+    """Запись сменила статус, врача или день"""
+    if old_key == new_key:
+        return
+    if old_key:
+        bump(old_key, -1)
+    if new_key:
+        bump(new_key, 1)
+
+
+def get_dashboard_stats(doctor_id, day=None):
+    """Счетчики за день и за все время (один запрос, две строки)"""
+    _, DoctorDailyStats = _models()
+    day = day or timezone.localdate()
+    rows = {
+        row.day: row
+        for row in DoctorDailyStats.objects.filter(doctor_id=doctor_id).filter(Q(day=day) | Q(day__isnull=True))
+    }
+    return {
+        'today': rows.get(day) or DoctorDailyStats(doctor_id=doctor_id, day=day),
+        'all_time': rows.get(None) or DoctorDailyStats(doctor_id=doctor_id),
+    }
+
+
+def compute(apps=None):
+    """Эталонные счетчики по таблице записей: {(doctor_id, day): {counter: n}}"""
+    Appointment, _ = _models(apps)
+    rows = (
+        Appointment.objects.order_by()
+        .annotate(day=TruncDate('date_time', tzinfo=timezone.get_current_timezone()))
+        .values('doctor_id', 'day')
+        .annotate(
+            total=Count('id', filter=Q(status__in=STATUSES)),
+            **{status: Count('id', filter=Q(status=status)) for status in STATUSES}
+        )
+    )
+
+    result = {}
+    totals = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for row in rows:
+        counters = {name: row[name] for name in COUNTERS}
+        if not counters['total']:
+            continue
+        result[row['doctor_id'], row['day']] = counters
+        for name in COUNTERS:
+            totals[row['doctor_id']][name] += counters[name]
+    for doctor_id, counters in totals.items():
+        result[doctor_id, None] = counters
+    return result
+
+
+def stored(apps=None):
+    """Счетчики из таблицы статистики в том же виде, что и compute()"""
+    _, DoctorDailyStats = _models(apps)
+    return {
+        (row['doctor_id'], row['day']): {name: row[name] for name in COUNTERS}
+        for row in DoctorDailyStats.objects.values('doctor_id', 'day', *COUNTERS)
+        if any(row[name] for name in COUNTERS)
+    }
+
+
+def find_drift(apps=None):
+    """Ключи, где сохраненные счетчики расходятся с эталоном: {key: (сохранено, эталон)}"""
+    expected = compute(apps)
+    actual = stored(apps)
+    return {
+        key: (actual.get(key), expected.get(key))
+        for key in expected.keys() | actual.keys()
+        if actual.get(key) != expected.get(key)
+    }
+
+
+def rebuild(apps=None, batch_size=1000):
+    """Пересобирает таблицу статистики с нуля; возвращает число строк"""
+    _, DoctorDailyStats = _models(apps)
+    objects = [
+        DoctorDailyStats(doctor_id=doctor_id, day=day, **counters)
+        for (doctor_id, day), counters in compute(apps).items()
+    ]
+    with transaction.atomic():
+        DoctorDailyStats.objects.all().delete()
+        DoctorDailyStats.objects.bulk_create(objects, batch_size=batch_size)
+    return len(objects)
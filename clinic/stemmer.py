@@ -0,0 +1,119 @@
+"""Стеммер русского языка (алгоритм Snowball/Портера)
+
+Нужен поиску на SQLite: у FTS5 нет русской морфологии, поэтому в индекс
+и в запрос попадают основы слов ("кардиологи", "кардиолога" -> "кардиолог").
+На PostgreSQL ту же работу делает конфигурация 'russian' в to_tsvector.
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+
+def _endings(*groups):
+    """Окончания от длинных к коротким: ищется самое длинное совпадение"""
+    endings = [(ending, after_a) for after_a, words in groups for ending in words.split()]
+    return sorted(endings, key=lambda item: len(item[0]), reverse=True)
+
+
+# Второй элемент: окончание допустимо только после "а" или "я"
+PERFECTIVE_GERUND = _endings(
+    (True, 'в вши вшись'),
+    (False, 'ив ивши ившись ыв ывши ывшись'),
+)
+ADJECTIVE = _endings(
+    (False, 'ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых ую юю ая яя ою ею'),
+)
+PARTICIPLE = _endings(
+    (True, 'ем нн вш ющ щ'),
+    (False, 'ивш ывш ующ'),
+)
+REFLEXIVE = _endings((False, 'ся сь'))
+VERB = _endings(
+    (True, 'ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно'),
+    (False, 'ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено ят ует уют ит ыт ены '
+            'ить ыть ишь ую ю'),
+)
+NOUN = _endings(
+    (False, 'а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем ам ом о у ах иях ях ы ь '
+            'ию ью ю ия ья я'),
+)
+SUPERLATIVE = _endings((False, 'ейш ейше'))
+DERIVATIONAL = _endings((False, 'ост ость'))
+
+
+def _regions(word):
+    """Начала областей RV и R2"""
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in VOWELS), len(word))
+    r1 = r2 = len(word)
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word, start, endings):
+    """Отрезает самое длинное окончание из endings, лежащее в word[start:]
+
+    Возвращает основу или None, если окончание не найдено.
+    """
+    for ending, after_a in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            stem = word[:-len(ending)]
+            if after_a and not (len(stem) > start and stem[-1] in 'ая'):
+                return None
+            return stem
+    return None
+
+
+def stem(word):
+    """Основа слова; слова не на кириллице возвращаются как есть"""
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC_RE.search(word):
+        return word
+
+    rv, r2 = _regions(word)
+
+    # Шаг 1: деепричастие или (возвратность +) прилагательное/глагол/существительное
+    stemmed = _strip(word, rv, PERFECTIVE_GERUND)
+    if stemmed is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stemmed = _strip(word, rv, ADJECTIVE)
+        if stemmed is not None:
+            stemmed = _strip(stemmed, rv, PARTICIPLE) or stemmed
+        else:
+            stemmed = _strip(word, rv, VERB)
+            if stemmed is None:
+                stemmed = _strip(word, rv, NOUN)
+    if stemmed is not None:
+        word = stemmed
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    # Шаг 4
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    else:
+        stemmed = _strip(word, rv, SUPERLATIVE)
+        if stemmed is not None:
+            word = stemmed[:-1] if stemmed.endswith('нн') else stemmed
+        elif word.endswith('ь') and len(word) - 1 >= rv:
+            word = word[:-1]
+    return word
+
+
+def stem_text(text):
+    """Основы всех слов текста"""
+    return [stem(word) for word in WORD_RE.findall(text or '')]
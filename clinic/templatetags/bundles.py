@@ -0,0 +1,22 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from clinic.assets import BUNDLES
+
+register = template.Library()
+
+
+def _tag(path):
+    if path.endswith('.css'):
+        return format_html('<link rel="stylesheet" href="{}" />', static(path))
+    return format_html('<script src="{}"></script>', static(path))
+
+
+@register.simple_tag
+def bundle(name):
+    """Бандл из assets.BUNDLES; без сборки статики (STATIC_BUILD) - его исходники по одному"""
+    if settings.STATIC_BUILD:
+        return _tag(name)
+    return format_html_join('\n', '{}', ((_tag(source),) for source in BUNDLES[name]))
@@ -1,3 +1,1398 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from datetime import date, time, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, connections, models, router
+from django.http import HttpResponse
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import assets, availability, booking, catalog, images, instrumentation, routers, schedule, search, stats, urls
+from .availability import NOT_WORKING, BusyIntervals, DoctorDay
+from .forms import AppointmentForm
+from .pagination import ListKeysetPaginator
+from .models import (
+    Appointment, Doctor, DoctorSchedule, DoctorTimeOff, ImageJob, Patient, Service, ServiceCategory,
+    TelegramMessage, User
+)
+from .services import benchmark, booking_benchmark, load_data
+from .services.appointment_transfer import AppointmentImporter, write_rows
+from .services.fake_telegram import FakeTelegramServer
+from .services.reminders import claim, send_reminders
+from .services.telegram_delivery import TelegramWorker
+from .services.telegram_service import telegram_service
+
+# Количество строк в каждой "большой" таблице для проверок N+1
+FIXTURE_ROWS = 500
+
+# Шаблон панели врача для тестов: обращается ко всем связям, которые выводятся на панели
+DASHBOARD_TEMPLATE = (
+    '{% for a in recent_appointments %}'
+    '{{ a.patient.user.get_full_name }} {{ a.service.name }} {{ a.date_time }}'
+    '{% endfor %}'
+)
+
+
+class QueryCountTests(TestCase):
+    """Число SQL-запросов на страницах-списках не зависит от объема данных"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = ServiceCategory.objects.bulk_create([
+            ServiceCategory(name=f'Категория {i}', slug=f'category-{i}') for i in range(10)
+        ])
+        doctor_users = User.objects.bulk_create([
+            User(username=f'doctor{i}', first_name='Врач', last_name=f'№{i}', role=User.DOCTOR)
+            for i in range(FIXTURE_ROWS)
+        ])
+        doctors = Doctor.objects.bulk_create([
+            Doctor(user=user, specialization=f'Специализация {i % 7}', room=str(100 + i))
+            for i, user in enumerate(doctor_users)
+        ])
+        services = Service.objects.bulk_create([
+            Service(
+                name=f'Услуга {i}', slug=f'service-{i}', description='Описание',
+                price=1000 + i, duration=30, category=categories[i % len(categories)]
+            )
+            for i in range(FIXTURE_ROWS)
+        ])
+
+        cls.patient_user = User.objects.create_user('patient', password='pass', role=User.CLIENT)
+        cls.patient = Patient.objects.create(user=cls.patient_user, phone='1', birth_date=date(1990, 1, 1))
+        cls.doctor_user = doctor_users[0]
+        cls.doctor_user.set_password('pass')
+        cls.doctor_user.save()
+
+        start = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0)
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=cls.patient,
+                doctor=doctors[0] if i % 2 else doctors[i],
+                service=services[i],
+                date_time=start - timedelta(days=i)
+            )
+            for i in range(FIXTURE_ROWS)
+        ])
+
+    def assertMaxQueries(self, limit, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(ctx), limit,
+            f"{url}: {len(ctx)} запросов, ожидалось не больше {limit}\n"
+            + '\n'.join(q['sql'] for q in ctx.captured_queries)
+        )
+        return response
+
+    def setUp(self):
+        cache.clear()
+
+    def test_doctor_list(self):
+        # Холодный кэш: сборка каталога, затем каталог из кэша
+        self.assertMaxQueries(3, reverse('doctor_list'))
+        self.assertMaxQueries(0, reverse('doctor_list'))
+
+    def test_service_list(self):
+        self.assertMaxQueries(3, reverse('service_list'))
+        self.assertMaxQueries(0, reverse('service_list'))
+
+    def test_appointment_list(self):
+        self.client.login(username='patient', password='pass')
+        self.assertMaxQueries(3, reverse('appointment_list'))
+
+    def test_patient_profile(self):
+        self.client.login(username='patient', password='pass')
+        self.assertMaxQueries(4, reverse('patient_profile'))
+
+    def test_form_catalog_instances(self):
+        # Врач и услуга формы собраны из снимка каталога: значения полей - как в БД
+        doctor, service = Doctor.objects.order_by('pk')[1], Service.objects.order_by('pk')[1]
+        Service.objects.filter(pk=service.pk).update(icon='stethoscope', is_popular=True, order=3)
+        cache.clear()
+        form = AppointmentForm()
+        with self.assertNumQueries(0):
+            chosen_doctor = form.fields['doctor'].clean(str(doctor.pk))
+            chosen_service = form.fields['service'].clean(str(service.pk))
+        for instance, fields in [(chosen_doctor, form.DOCTOR_FIELDS), (chosen_service, form.SERVICE_FIELDS)]:
+            stored = type(instance).objects.get(pk=instance.pk)
+            for name in fields:
+                self.assertEqual(getattr(instance, name), getattr(stored, name), name)
+        self.assertEqual(chosen_doctor.user, doctor.user)
+
+    def test_appointment_create(self):
+        # Форма записи на прогретом кэше не читает врачей и услуги из БД
+        self.client.login(username='patient', password='pass')
+        url = reverse('appointment_create')
+        self.client.get(url)
+        doctor, service = Doctor.objects.order_by('pk')[1], Service.objects.order_by('pk')[1]
+        day = timezone.localdate() + timedelta(days=7)
+        for data in [None, {'doctor': doctor.pk, 'service': service.pk, 'date_time': f'{day}T10:00'}]:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(url, data) if data else self.client.get(url)
+            catalog_queries = [
+                q['sql'] for q in ctx.captured_queries
+                if 'FROM "clinic_doctor"' in q['sql'] or 'FROM "clinic_service"' in q['sql']
+            ]
+            self.assertEqual(catalog_queries, [])
+        self.assertRedirects(response, reverse('appointment_list'), fetch_redirect_response=False)
+        appointment = Appointment.objects.get(date_time__date=day)
+        self.assertEqual((appointment.doctor, appointment.service), (doctor, service))
+
+        response = self.client.post(url, {'doctor': 10 ** 6, 'service': service.pk, 'date_time': f'{day}T11:00'})
+        self.assertIn('doctor', response.context['form'].errors)
+
+    @override_settings(TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {
+            'loaders': [('django.template.loaders.locmem.Loader', {
+                'clinic/doctor_dashboard.html': DASHBOARD_TEMPLATE,
+            })],
+        },
+    }])
+    def test_doctor_dashboard(self):
+        self.client.login(username='doctor0', password='pass')
+        self.assertMaxQueries(6, reverse('doctor_dashboard'))
+
+
+class KeysetPaginationTests(TestCase):
+    """Курсор проходит весь список без пропусков и повторов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('patient', password='pass', role=User.CLIENT)
+        patient = Patient.objects.create(user=user, phone='1', birth_date=date(1990, 1, 1))
+        doctor = Doctor.objects.create(
+            user=User.objects.create(username='doctor', role=User.DOCTOR),
+            specialization='Терапевт', room='101'
+        )
+        service = Service.objects.create(name='Прием', slug='priem', description='', price=1000, duration=30)
+        # Одинаковое время у пар записей проверяет разрешение равенства по id
+        start = timezone.now().replace(microsecond=123456)
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=patient, doctor=doctor, service=service,
+                date_time=start - timedelta(hours=i // 2), status='completed'
+            )
+            for i in range(45)
+        ])
+
+    def test_walks_all_appointments(self):
+        self.client.login(username='patient', password='pass')
+        seen = []
+        cursor = ''
+        while True:
+            data = self.client.get(reverse('appointment_list'), {'format': 'json', 'cursor': cursor}).json()
+            seen.extend(item['id'] for item in data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        expected = list(Appointment.objects.order_by('-date_time', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+
+@override_settings(TELEGRAM_CHAT_INTERVAL=0)
+class TelegramDeliveryTests(TestCase):
+    """Очередь Telegram доставляется через локальный фейковый Bot API"""
+
+    def test_delivery_with_rate_limit_and_blocked_chat(self):
+        for chat_id in range(1, 6):
+            telegram_service.send_message(chat_id, f'Сообщение {chat_id}')
+
+        with FakeTelegramServer(rate_limited=1, blocked_chats=['5']) as server:
+            worker = TelegramWorker(api_url=server.url, concurrency=1)
+            async_to_sync(worker.run)(once=True)
+
+        self.assertEqual(len(server.messages), 3)
+        self.assertEqual(TelegramMessage.objects.filter(status=TelegramMessage.SENT).count(), 3)
+        self.assertFalse(TelegramMessage.objects.filter(status=TelegramMessage.SENT, latency_ms=None).exists())
+
+        # Ответ 429: сообщение вернулось в очередь с задержкой retry_after
+        retried = TelegramMessage.objects.get(status=TelegramMessage.PENDING)
+        self.assertEqual(retried.attempts, 1)
+        self.assertGreater(retried.next_attempt_at, timezone.now())
+
+        # Бот заблокирован: повторять бессмысленно
+        failed = TelegramMessage.objects.get(status=TelegramMessage.FAILED)
+        self.assertEqual(failed.chat_id, '5')
+
+
+class ReminderTests(TestCase):
+    """Напоминания уходят один раз на каждое окно"""
+
+    def test_reminders_are_sent_once(self):
+        user = User.objects.create(username='patient')
+        patient = Patient.objects.create(user=user, phone='1', birth_date=date(1990, 1, 1), telegram_id='42')
+        doctor = Doctor.objects.create(user=User.objects.create(username='doctor'), specialization='Терапевт', room='1')
+        service = Service.objects.create(name='Прием', slug='priem', description='', price=1000, duration=30)
+        now = timezone.now()
+        Appointment.objects.bulk_create([
+            Appointment(patient=patient, doctor=doctor, service=service, date_time=now + timedelta(hours=20)),
+            Appointment(patient=patient, doctor=doctor, service=service, date_time=now + timedelta(hours=1)),
+            Appointment(patient=patient, doctor=doctor, service=service, date_time=now + timedelta(hours=30)),
+            Appointment(
+                patient=patient, doctor=doctor, service=service,
+                date_time=now + timedelta(hours=1, minutes=30), status='cancelled'
+            ),
+        ])
+
+        self.assertEqual(
+            send_reminders(batch_size=1),
+            {'reminder_24h_sent_at': 1, 'reminder_2h_sent_at': 1}
+        )
+        self.assertEqual(
+            send_reminders(),
+            {'reminder_24h_sent_at': 0, 'reminder_2h_sent_at': 0}
+        )
+        self.assertEqual(TelegramMessage.objects.filter(chat_id='42').count(), 2)
+
+    def test_failed_enqueue_keeps_reminder_due(self):
+        user = User.objects.create(username='patient')
+        patient = Patient.objects.create(user=user, phone='1', birth_date=date(1990, 1, 1), telegram_id='42')
+        doctor = Doctor.objects.create(user=User.objects.create(username='doctor'), specialization='Терапевт', room='1')
+        service = Service.objects.create(name='Прием', slug='priem', description='', price=1000, duration=30)
+        appointment = Appointment.objects.create(
+            patient=patient, doctor=doctor, service=service, date_time=timezone.now() + timedelta(hours=20)
+        )
+        with mock.patch.object(TelegramMessage.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                send_reminders()
+        appointment.refresh_from_db()
+        self.assertIsNone(appointment.reminder_24h_sent_at)
+
+        # Строка, помеченная другим запуском с той же отметкой времени, - не "своя"
+        Appointment.objects.filter(pk=appointment.pk).update(reminder_24h_sent_at=timezone.now(), reminder_claim='other')
+        self.assertEqual(list(claim('reminder_24h_sent_at', [appointment.pk], timezone.now())), [])
+        self.assertEqual(send_reminders()['reminder_24h_sent_at'], 0)
+
+
+class CatalogCacheTests(TestCase):
+    """Кэш каталога сбрасывается при изменении врачей, услуг и категорий"""
+
+    def setUp(self):
+        cache.clear()
+        self.category = ServiceCategory.objects.create(name='Диагностика', slug='diagnostics')
+        self.service = Service.objects.create(
+            name='УЗИ', slug='uzi', description='', price=2500, duration=60, category=self.category
+        )
+
+    def test_pages_cover_catalog(self):
+        # Порядок строк, который дала бы локаль БД, не совпадает с порядком Python
+        for i, specialization in enumerate(['терапевт', 'Хирург', 'Терапевт', 'ЛОР', 'Лор врач', 'лор']):
+            Doctor.objects.create(user=User.objects.create(username=f'doctor{i}'), specialization=specialization, room='1')
+        doctors = catalog.get_catalog()['doctors']
+        keys = [(doctor['specialization'], doctor['id']) for doctor in doctors]
+        self.assertEqual(keys, sorted(keys))
+
+        seen, cursor = [], None
+        while True:
+            rows, cursor = ListKeysetPaginator(doctors, catalog.DOCTOR_ORDERING, 2).page(cursor)
+            seen += [row['id'] for row in rows]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [doctor['id'] for doctor in doctors])
+
+    def test_hit_after_miss(self):
+        before = catalog.get_stats()
+        catalog.get_catalog()
+        catalog.get_catalog()
+        after = catalog.get_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_invalidation_by_signals(self):
+        self.assertEqual(catalog.get_catalog()['services'][0]['name'], 'УЗИ')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.name = 'УЗИ брюшной полости'
+            self.service.save()
+        self.assertEqual(catalog.get_catalog()['services'][0]['name'], 'УЗИ брюшной полости')
+
+        doctor = Doctor.objects.create(user=User.objects.create(username='doctor', role=User.DOCTOR), specialization='Хирург', room='1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.doctors.add(doctor)
+        self.assertEqual(len(catalog.get_catalog()['doctors']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertIsNone(catalog.get_catalog()['services'][0]['category'])
+
+    def test_doctor_login_keeps_catalog(self):
+        user = User.objects.create_user('doctor', password='pass', first_name='Мария', role=User.DOCTOR)
+        Doctor.objects.create(user=user, specialization='Хирург', room='1')
+        catalog.get_catalog()
+        version = cache.get(catalog.VERSION_KEY)
+        # Вход сохраняет только last_login
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.client.login(username='doctor', password='pass'))
+        self.assertEqual(cache.get(catalog.VERSION_KEY), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.last_name = 'Сидорова'
+            user.save(update_fields=['last_name'])
+        self.assertNotEqual(cache.get(catalog.VERSION_KEY), version)
+        self.assertEqual(catalog.get_catalog()['doctors'][0]['user']['last_name'], 'Сидорова')
+
+
+class ServiceFilterTests(TestCase):
+    """Фильтрация каталога услуг выполняется на сервере"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cardio = ServiceCategory.objects.create(name='Кардиология', slug='cardio')
+        lab = ServiceCategory.objects.create(name='Анализы', slug='lab')
+        Service.objects.bulk_create([
+            Service(name='ЭКГ', slug='ekg', description='Электрокардиограмма', price=1200, duration=30, category=cardio),
+            Service(name='Эхо-КГ', slug='echo', description='УЗИ сердца', price=3000, duration=45, category=cardio, is_popular=True),
+            Service(name='Общий анализ крови', slug='oak', description='Кровь', price=500, duration=15, category=lab),
+        ])
+        # bulk_create не вызывает сигналы индекса
+        search.rebuild()
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, **params):
+        data = self.client.get(reverse('service_list'), {'format': 'json', **params}).json()
+        return [item['name'] for item in data['results']]
+
+    def test_query_not_truncated(self):
+        # Фильтр каталога - все найденные услуги, а не первые ADMIN_LIMIT по релевантности
+        Service.objects.bulk_create([
+            Service(name=f'Анализ {i}', slug=f'analysis-{i}', description='', price=100, duration=15)
+            for i in range(search.ADMIN_LIMIT)
+        ])
+        search.rebuild()
+        found = Service.objects.filter(pk__in=search.ids_subquery(search.SERVICE, 'анализ'))
+        self.assertEqual(found.count(), search.ADMIN_LIMIT + 1)
+
+    def test_filters(self):
+        self.assertEqual(self.names(category='cardio'), ['ЭКГ', 'Эхо-КГ'])
+        self.assertEqual(self.names(min_price=1000, max_price=2000), ['ЭКГ'])
+        self.assertEqual(self.names(popular='1'), ['Эхо-КГ'])
+        self.assertEqual(self.names(q='кров'), ['Общий анализ крови'])
+        # Регистр запроса и данных не совпадает (LIKE в SQLite не сравнил бы кириллицу)
+        self.assertEqual(self.names(q='экг'), ['ЭКГ'])
+        self.assertEqual(self.names(q='УЗИ'), ['Эхо-КГ'])
+        self.assertEqual(self.names(q='!!!'), [])
+        self.assertEqual(self.names(sort='-price'), ['Эхо-КГ', 'ЭКГ', 'Общий анализ крови'])
+        # Некорректный параметр игнорируется
+        self.assertEqual(len(self.names(min_price='abc')), 3)
+
+    def test_fragment(self):
+        response = self.client.get(reverse('service_list'), {'category': 'lab', 'format': 'fragment'})
+        self.assertContains(response, 'Общий анализ крови')
+        self.assertNotContains(response, '<html')
+
+
+class SearchTests(TestCase):
+    """Поисковый индекс обновляется сигналами и учитывает словоформы"""
+
+    def setUp(self):
+        self.category = ServiceCategory.objects.create(name='Кардиология', slug='cardio')
+        self.doctor = Doctor.objects.create(
+            user=User.objects.create(username='doctor', first_name='Мария', last_name='Сидорова', role=User.DOCTOR),
+            specialization='Кардиолог', room='1'
+        )
+        self.service = Service.objects.create(
+            name='Консультация кардиолога', slug='cardio-consult', description='Первичный прием',
+            price=2000, duration=45, category=self.category
+        )
+        Service.objects.create(
+            name='ЭКГ', slug='ekg', description='Электрокардиограмма сердца', price=1200, duration=30,
+            category=self.category
+        )
+
+    def labels(self, query, **kwargs):
+        return [result['label'] for result in search.search(query, **kwargs)]
+
+    def test_stemming_and_ranking(self):
+        # "кардиологи", "кардиолога" и "кардиология" сводятся к одной основе;
+        # совпадение в названии выше совпадения в категории
+        self.assertEqual(self.labels('кардиологи'), ['Мария Сидорова', 'Консультация кардиолога', 'ЭКГ'])
+        self.assertEqual(self.labels('кардиологи', kind=search.SERVICE), ['Консультация кардиолога', 'ЭКГ'])
+        self.assertEqual(self.labels('сердце'), ['ЭКГ'])
+
+    def test_sync_with_models(self):
+        self.doctor.user.last_name = 'Петрова'
+        self.doctor.user.save()
+        self.assertEqual(self.labels('петровой'), ['Мария Петрова'])
+
+        self.service.is_active = False
+        self.service.save()
+        self.assertNotIn('Консультация кардиолога', self.labels('консультация'))
+        self.assertEqual(search.object_ids(search.SERVICE, 'консультация'), [self.service.pk])
+
+        self.doctor.delete()
+        self.assertEqual(self.labels('мария'), [])
+
+    def test_typeahead_api(self):
+        data = self.client.get(reverse('search_api'), {'q': 'конс'}).json()
+        self.assertEqual([r['id'] for r in data['results']], [self.service.pk])
+        self.assertEqual(data['results'][0]['url'], f"{reverse('appointment_create')}?service={self.service.pk}")
+
+        response = self.client.get(reverse('search'), {'q': 'Сидорова'})
+        self.assertContains(response, 'Мария Сидорова')
+
+
+class DoctorStatsTests(TestCase):
+    """Счетчики панели врача меняются вместе с записями"""
+
+    def setUp(self):
+        patient = Patient.objects.create(
+            user=User.objects.create(username='patient'), phone='1', birth_date=date(1990, 1, 1)
+        )
+        self.doctor = Doctor.objects.create(user=User.objects.create(username='doctor'), specialization='Терапевт', room='1')
+        service = Service.objects.create(name='Прием', slug='priem', description='', price=1000, duration=30)
+        # День в будущем: прошедшее время запись не пропустит
+        start = (timezone.localtime() + timedelta(days=7)).replace(hour=12, minute=0, second=0, microsecond=0)
+        self.today = start.date()
+        self.appointments = [
+            Appointment.objects.create(patient=patient, doctor=self.doctor, service=service, date_time=start),
+            Appointment.objects.create(
+                patient=patient, doctor=self.doctor, service=service, date_time=start + timedelta(days=1)
+            ),
+        ]
+
+    def counters(self):
+        result = stats.get_dashboard_stats(self.doctor.pk, self.today)
+        return result['today'].active, result['all_time'].total
+
+    def test_incremental_updates(self):
+        self.assertEqual(self.counters(), (1, 2))
+
+        today, tomorrow = self.appointments
+        today.status = 'cancelled'
+        today.save()
+        self.assertEqual(self.counters(), (0, 2))
+
+        tomorrow.date_time -= timedelta(days=1, minutes=30)
+        tomorrow.save()
+        self.assertEqual(self.counters(), (1, 2))
+
+        tomorrow.delete()
+        self.assertEqual(self.counters(), (0, 1))
+        self.assertEqual(stats.find_drift(), {})
+
+    def test_rebuild_fixes_drift(self):
+        Appointment.objects.filter(pk=self.appointments[0].pk).update(status='completed')
+        with self.assertRaises(CommandError):
+            call_command('rebuild_doctor_stats', '--check', stdout=StringIO())
+
+        call_command('rebuild_doctor_stats', stdout=StringIO())
+        call_command('rebuild_doctor_stats', '--check', stdout=StringIO())
+        self.assertEqual(self.counters(), (0, 2))
+
+
+class ReportTests(TestCase):
+    """Отчет агрегируется в БД и выгружается потоком"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='pass', role=User.ADMIN)
+        patient = Patient.objects.create(user=User.objects.create(username='patient'), phone='1', birth_date=date(1990, 1, 1))
+        doctor = Doctor.objects.create(
+            user=User.objects.create(username='doctor', first_name='Иван', last_name='Петров'),
+            specialization='Терапевт', room='1'
+        )
+        ekg = Service.objects.create(name='ЭКГ', slug='ekg', description='', price=1200, duration=30)
+        uzi = Service.objects.create(name='УЗИ', slug='uzi', description='', price=2500, duration=60)
+        start = timezone.make_aware(timezone.datetime(2024, 3, 4, 10))
+        Appointment.objects.bulk_create([
+            Appointment(patient=patient, doctor=doctor, service=ekg, date_time=start, status='completed'),
+            Appointment(patient=patient, doctor=doctor, service=ekg, date_time=start + timedelta(days=1), status='completed'),
+            Appointment(patient=patient, doctor=doctor, service=uzi, date_time=start + timedelta(days=2), status='cancelled'),
+            Appointment(patient=patient, doctor=doctor, service=uzi, date_time=start + timedelta(days=40), status='completed'),
+        ])
+
+    def get(self, **params):
+        self.client.login(username='admin', password='pass')
+        response = self.client.get(reverse('appointment_report'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv_by_service_and_month(self):
+        content = self.get(group_by='service', period='month').decode('utf-8-sig')
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], ['Период', 'ID услуги', 'Услуга', 'Записей', 'Завершено', 'Отменено', 'Выручка, руб.'])
+        self.assertEqual([row[2:] for row in rows[1:]], [
+            ['ЭКГ', '2', '2', '0', '2400.00'],
+            ['УЗИ', '1', '0', '1', '0.00'],
+            ['УЗИ', '1', '1', '0', '2500.00'],
+        ])
+
+    def test_xlsx(self):
+        content = self.get(group_by='status', format='xlsx', date_to='2024-04-01')
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 3)
+        self.assertIn('Отменен', sheet)
+
+    def test_access(self):
+        User.objects.create_user('client', password='pass', role=User.CLIENT)
+        self.client.login(username='client', password='pass')
+        self.assertRedirects(
+            self.client.get(reverse('appointment_report')), reverse('access_denied'), fetch_redirect_response=False
+        )
+
+
+class AppointmentTransferTests(TestCase):
+    """Импорт пачками находит пересечения и не вызывает save() на каждую строку"""
+
+    def setUp(self):
+        Patient.objects.create(user=User.objects.create(username='patient'), phone='1', birth_date=date(1990, 1, 1))
+        self.doctor = Doctor.objects.create(user=User.objects.create(username='doctor'), specialization='Терапевт', room='1')
+        Service.objects.create(name='УЗИ', slug='uzi', description='', price=2500, duration=60)
+        self.start = (timezone.localtime() + timedelta(days=3)).replace(hour=10, minute=0, second=0, microsecond=0)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, rows):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8', newline='') as stream:
+            write_rows(stream, name.rsplit('.', 1)[-1], rows)
+        return path
+
+    def test_import_detects_conflicts_in_batch(self):
+        def row(minutes, status='confirmed', doctor='doctor', patient='patient'):
+            return doctor, patient, 'uzi', (self.start + timedelta(minutes=minutes)).isoformat(), status, ''
+
+        path = self.write('appointments.csv', [
+            row(0),
+            row(30),                       # пересекается с предыдущей (УЗИ - 60 минут)
+            row(30, status='cancelled'),   # отмененная время не занимает
+            row(60),
+            row(120, doctor='nobody'),
+            row(180, patient=''),
+        ])
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('import_appointments', path, '--batch-size', 4, '--skip-stats', stdout=StringIO())
+        self.assertEqual(Appointment.objects.count(), 4)
+        # Справочники, а затем на каждую пачку: занятость врачей и вставка
+        self.assertLessEqual(len(ctx), 3 + 2 * 4)
+
+        # Повторный импорт того же файла: все активные записи уже заняты
+        out = StringIO()
+        call_command('import_appointments', path, stdout=out)
+        self.assertEqual(Appointment.objects.count(), 5)
+        self.assertIn('Строка 2: врач занят в это время', out.getvalue())
+        self.assertEqual(stats.find_drift(), {})
+
+    def test_slot_taken_after_check(self):
+        path = self.write('appointments.jsonl', [
+            ('doctor', 'patient', 'uzi', (self.start + timedelta(hours=hours)).isoformat(), 'confirmed', '')
+            for hours in range(3)
+        ])
+        existing = Appointment(doctor=self.doctor, service=Service.objects.get(), date_time=self.start + timedelta(hours=1))
+
+        # Запись с сайта появляется между проверкой пересечений и вставкой пачки
+        def find_conflicts(importer, batch):
+            Appointment.objects.bulk_create([existing])
+            return set()
+
+        out = StringIO()
+        with mock.patch.object(AppointmentImporter, 'find_conflicts', find_conflicts):
+            call_command('import_appointments', path, '--skip-stats', stdout=out)
+        self.assertEqual(Appointment.objects.count(), 3)
+        self.assertIn('Строка 2: врач занят в это время', out.getvalue())
+
+    def test_export_roundtrip(self):
+        Appointment.objects.create(
+            patient=Patient.objects.get(), doctor=self.doctor, service=Service.objects.get(),
+            date_time=self.start, notes='Первичный'
+        )
+        path = os.path.join(self.tmp.name, 'export.jsonl')
+        call_command('export_appointments', path, stdout=StringIO(), stderr=StringIO())
+        Appointment.objects.all().delete()
+
+        call_command('import_appointments', path, stdout=StringIO())
+        appointment = Appointment.objects.get()
+        self.assertEqual((appointment.date_time, appointment.notes), (self.start, 'Первичный'))
+
+
+class LoadDataTests(TestCase):
+    """Генератор нагрузочных данных воспроизводим и не создает пересечений"""
+
+    def test_tiny_tier(self):
+        call_command('generate_load_data', '--tier', 'tiny', '--appointments', 300, stdout=StringIO())
+        self.assertEqual(Doctor.objects.count(), 10)
+        self.assertEqual(Service.objects.count(), 30)
+        self.assertAlmostEqual(Appointment.objects.count(), 300, delta=60)
+        self.assertFalse(Service.objects.filter(doctors=None).exists())
+        self.assertEqual(stats.find_drift(), {})
+
+        first = list(Appointment.objects.order_by('id').values_list('doctor__user__username', 'date_time', 'status'))
+        call_command('generate_load_data', '--tier', 'tiny', '--appointments', 300, '--clear', stdout=StringIO())
+        second = list(Appointment.objects.order_by('id').values_list('doctor__user__username', 'date_time', 'status'))
+        self.assertEqual(first, second)
+        self.assertEqual(load_data.anchor_date(), timezone.localdate())
+
+    def test_anchor_date(self):
+        anchor = date(2025, 3, 3)
+        call_command(
+            'generate_load_data', '--tier', 'tiny', '--appointments', 100, '--anchor-date', '2025-03-03', stdout=StringIO()
+        )
+        self.assertEqual(load_data.anchor_date(), anchor)
+        # Месяц: 22 дня до дня привязки и 8 после
+        days = {timezone.localtime(d).date() for d in Appointment.objects.values_list('date_time', flat=True)}
+        self.assertGreaterEqual(min(days), anchor - timedelta(days=22))
+        self.assertLess(max(days), anchor + timedelta(days=8))
+        self.assertFalse(Appointment.objects.filter(date_time__date__gte=anchor, status='completed').exists())
+
+        call_command('generate_load_data', '--tier', 'tiny', '--appointments', 100, '--clear', stdout=StringIO())
+        self.assertEqual(load_data.anchor_date(), timezone.localdate())
+        # clear() удалил записи прежнего набора
+        self.assertFalse(Appointment.objects.filter(date_time__date__lt=anchor + timedelta(days=8)).exists())
+        self.assertEqual(stats.find_drift(), {})
+
+
+class BenchmarkTests(TestCase):
+    """Замер страниц сохраняет результат и находит регрессии"""
+
+    def test_run_and_compare(self):
+        call_command('generate_load_data', '--tier', 'tiny', '--appointments', 100, stdout=StringIO())
+        path = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+        call_command(
+            'run_benchmarks', '--iterations', 3, '--warmup', 0, '--output', path,
+            '--endpoint', 'service_list', '--endpoint', 'appointment_create_post', stdout=StringIO()
+        )
+        with open(path, encoding='utf-8') as f:
+            result = json.load(f)
+
+        self.assertEqual(set(result['endpoints']), {'service_list', 'appointment_create_post'})
+        self.assertEqual(result['meta']['data']['anchor_date'], timezone.localdate().isoformat())
+        post = result['endpoints']['appointment_create_post']
+        self.assertEqual(post['statuses'], {'302': 3})
+        self.assertGreater(post['queries_max'], 0)
+        # Созданные замером записи удалены
+        self.assertFalse(Appointment.objects.filter(notes=benchmark.BENCHMARK_NOTE).exists())
+
+        slower = json.loads(json.dumps(result))
+        for endpoint in slower['endpoints'].values():
+            endpoint['p95_ms'] *= 2
+        regressions = [row for row in benchmark.compare(result, slower) if row[-1]]
+        self.assertEqual({row[1] for row in regressions}, {'p95_ms'})
+
+    def test_booking_plan(self):
+        call_command('generate_load_data', '--tier', 'tiny', '--appointments', 100, stdout=StringIO())
+        plan = booking_benchmark.plan_slots(processes=3, bookings=4, doctors=2)
+        self.assertEqual([len(slots) for slots in plan], [4, 4, 4])
+        slots = [slot for slots in plan for slot in slots]
+        self.assertEqual(len({(doctor, start) for doctor, _, _, start in slots}), 12)
+        self.assertEqual(len({doctor for doctor, *_ in slots}), 2)
+        # Профиль SQLite применяется к каждому соединению
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        # Тестовая база в памяти: процессам-воркерам ее не видно
+        with self.assertRaises(CommandError):
+            call_command('benchmark_booking', stdout=StringIO())
+
+
+@override_settings(INSTRUMENTATION=True)
+class InstrumentationTests(TestCase):
+    """Замеры запроса попадают в Server-Timing и /metrics"""
+
+    def setUp(self):
+        cache.clear()
+        instrumentation.registry.reset()
+        Service.objects.create(name='ЭКГ', slug='ekg', description='', price=1200, duration=30)
+
+    def test_server_timing_and_metrics(self):
+        with self.assertLogs('clinic.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('service_list'))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries, \d+ duplicate", tpl;dur=[\d.]+$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['view'], record['status']), ('service_list', 200))
+        self.assertGreater(record['db_queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+
+        staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+        with self.assertLogs('clinic.instrumentation', 'INFO'):
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('clinic_requests_total{view="service_list",method="GET",status="200"} 1', content)
+        self.assertIn('clinic_request_duration_seconds_count{view="service_list"} 1', content)
+
+    def test_duplicate_queries(self):
+        metrics = instrumentation.RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            for service in Service.objects.all():
+                for _ in range(3):
+                    list(Service.objects.filter(pk=service.pk))
+        self.assertEqual((metrics.queries, metrics.duplicates), (4, 2))
+        self.assertEqual(metrics.most_repeated()[1], 3)
+
+    def test_metrics_access(self):
+        # Запрос через прокси на той же машине приходит с 127.0.0.1
+        with self.assertLogs('clinic.instrumentation', 'INFO'):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.5']), self.assertLogs('clinic.instrumentation', 'INFO'):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+    @override_settings(INSTRUMENTATION=False)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('service_list')))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRoutingTests(TestCase):
+    """Каталог читается с реплики, кроме транзакций и запросов после изменений"""
+
+    def outside_transaction(self):
+        # TestCase держит транзакцию, а в ней чтение всегда с основной базы
+        connection.in_atomic_block, in_atomic_block = False, connection.in_atomic_block
+        self.addCleanup(setattr, connection, 'in_atomic_block', in_atomic_block)
+
+    def test_routing(self):
+        self.assertEqual(router.db_for_read(Service), 'default')
+        self.outside_transaction()
+        self.assertEqual(router.db_for_read(Service), 'replica')
+        self.assertEqual(router.db_for_read(Service.doctors.through), 'replica')
+        self.assertEqual(router.db_for_read(Appointment), 'default')
+        self.assertEqual(router.db_for_write(Service), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'clinic'))
+        with routers.use_primary():
+            self.assertEqual(router.db_for_read(Doctor), 'default')
+
+    def test_read_your_writes(self):
+        seen = []
+
+        def view(request):
+            seen.append(router.db_for_read(Service))
+            return HttpResponse()
+
+        self.outside_transaction()
+        middleware = routers.PrimaryPinningMiddleware(view)
+        factory = RequestFactory()
+        middleware(factory.get('/'))
+        response = middleware(factory.post('/appointment/create/'))
+        request = factory.get('/')
+        request.COOKIES[routers.PIN_COOKIE] = response.cookies[routers.PIN_COOKIE].value
+        middleware(request)
+        self.assertEqual(seen, ['replica', 'default', 'default'])
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], 10)
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_disabled(self):
+        self.outside_transaction()
+        self.assertEqual(router.db_for_read(Service), 'default')
+
+
+@override_settings(REPLICA_DATABASE='replica', INSTRUMENTATION=True)
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Запросы уходят на реплику (зеркало тестовой базы) и на основную базу"""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor.objects.create(user=User.objects.create(username='doctor'), specialization='Терапевт', room='1')
+        self.service = Service.objects.create(name='ЭКГ', slug='ekg', description='', price=1200, duration=30)
+        self.service.doctors.add(self.doctor)
+        user = User.objects.create_user('patient', password='pass', role=User.CLIENT)
+        Patient.objects.create(user=user, phone='1', birth_date=date(1990, 1, 1))
+
+    def request(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica, \
+                self.assertLogs('clinic.instrumentation', 'INFO'):
+            response = getattr(self.client, method)(*args, **kwargs)
+        return response, [q['sql'] for q in primary], [q['sql'] for q in replica]
+
+    def test_catalog_from_replica(self):
+        # Кэшированный снимок каталога читается с основной базы, фильтр - с реплики
+        response, primary, replica = self.request('get', reverse('service_list'), {'q': 'экг'})
+        self.assertEqual([service['name'] for service in response.context['services']], ['ЭКГ'])
+        filtered = [sql for sql in primary + replica if 'FROM "clinic_service"' in sql and ' IN (' in sql]
+        self.assertTrue(filtered)
+        self.assertTrue(all(sql in replica for sql in filtered))
+        # Замеры учитывают запросы к обеим базам
+        self.assertIn(f'desc="{len(primary) + len(replica)} queries', response['Server-Timing'])
+
+    def test_booking_on_primary(self):
+        self.client.login(username='patient', password='pass')
+        day = timezone.localdate() + timedelta(days=7)
+        response, primary, replica = self.request('post', reverse('appointment_create'), {
+            'doctor': self.doctor.pk, 'service': self.service.pk, 'date_time': f'{day}T10:00',
+        })
+        self.assertRedirects(response, reverse('appointment_list'), fetch_redirect_response=False)
+        self.assertTrue(any(sql.startswith('INSERT INTO "clinic_appointment"') for sql in primary))
+        self.assertEqual(replica, [])
+
+
+class AvailabilityTests(SimpleTestCase):
+    """Интервалы занятости и сетка свободных слотов без БД"""
+
+    day = date(2030, 3, 4)
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(timezone.datetime.combine(self.day, time(hour, minute)))
+
+    def test_overlap(self):
+        # Прием 10:00-11:00 занимает 10:30, но не 9:30-10:00 и не 11:00
+        busy = BusyIntervals([(self.at(10), self.at(11))])
+        self.assertFalse(busy.is_free(self.at(10, 30), self.at(11)))
+        self.assertFalse(busy.is_free(self.at(9, 30), self.at(10, 30)))
+        self.assertFalse(busy.is_free(self.at(9), self.at(12)))
+        self.assertTrue(busy.is_free(self.at(9, 30), self.at(10)))
+        self.assertTrue(busy.is_free(self.at(11), self.at(11, 30)))
+
+        doctor_day = DoctorDay(1, self.day, busy)
+        self.assertFalse(doctor_day.is_free(self.at(10, 30), 30))
+        self.assertTrue(doctor_day.is_free(self.at(9), 60))
+
+    def test_back_to_back_merged(self):
+        busy = BusyIntervals([
+            (self.at(11), self.at(12)),
+            (self.at(10), self.at(11)),          # вплотную к следующему
+            (self.at(10, 30), self.at(10, 45)),  # внутри предыдущего
+            (self.at(14), self.at(14)),          # пустой
+        ])
+        self.assertEqual(list(busy), [(self.at(10), self.at(12))])
+        self.assertEqual(list(busy.gaps(self.at(8), self.at(20))), [(self.at(8), self.at(10)), (self.at(12), self.at(20))])
+
+    def test_free_slots_grid(self):
+        # Запись 9:10-9:40 не по сетке: следующий слот - с узла 10:00
+        busy = BusyIntervals([(self.at(9, 10), self.at(9, 40)), (self.at(11), self.at(12))])
+        slots = busy.free_slots(self.at(9), self.at(13), timedelta(minutes=30))
+        self.assertEqual(slots, [self.at(10), self.at(10, 30), self.at(12), self.at(12, 30)])
+        # 60 минут: в промежуток 9:40-11:00 по сетке умещается только 10:00
+        self.assertEqual(busy.free_slots(self.at(9), self.at(13), timedelta(minutes=60)), [self.at(10), self.at(12)])
+
+        doctor_day = DoctorDay(1, self.day, busy, working=[(self.at(9), self.at(13))])
+        self.assertEqual(doctor_day.free_slots(30), slots)
+        # not_before между узлами: сетка от начала смены, а не от not_before
+        self.assertEqual(doctor_day.free_slots(30, not_before=self.at(10, 5)), [self.at(10, 30), self.at(12), self.at(12, 30)])
+        self.assertEqual(doctor_day.free_slots(30, not_before=self.at(13)), [])
+
+
+class ScheduleTests(TestCase):
+    """Запись и сетка слотов следуют расписанию и отсутствиям врача"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = Doctor.objects.create(
+            user=User.objects.create(username='doctor', role=User.DOCTOR), specialization='Терапевт', room='1'
+        )
+        cls.service = Service.objects.create(name='УЗИ', slug='uzi', description='', price=2500, duration=60)
+        cls.patient_user = User.objects.create_user('patient', password='pass', role=User.CLIENT)
+        Patient.objects.create(user=cls.patient_user, phone='1', birth_date=date(1990, 1, 1))
+        today = timezone.localdate()
+        cls.monday = schedule.week_start(today) + timedelta(days=14)
+
+    def setUp(self):
+        cache.clear()
+
+    def at(self, day, hour, minute=0):
+        return timezone.make_aware(timezone.datetime.combine(day, time(hour, minute)))
+
+    def add_shifts(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            for start, end in [(9, 13), (14, 18)]:
+                DoctorSchedule.objects.create(
+                    doctor=self.doctor, weekday=0, start_time=time(start), end_time=time(end),
+                    valid_from=self.monday, **kwargs
+                )
+
+    def test_expand_week(self):
+        self.add_shifts(every_weeks=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            DoctorTimeOff.objects.create(doctor=self.doctor, start=self.at(self.monday, 10), end=self.at(self.monday, 11))
+
+        monday = self.monday
+        self.assertEqual(schedule.working_intervals(self.doctor.pk, monday), [
+            (self.at(monday, 9), self.at(monday, 10)),
+            (self.at(monday, 11), self.at(monday, 13)),
+            (self.at(monday, 14), self.at(monday, 18)),
+        ])
+        self.assertEqual(schedule.working_intervals(self.doctor.pk, monday + timedelta(days=1)), [])
+        # Через неделю - выходной, через две - снова прием
+        self.assertEqual(schedule.working_intervals(self.doctor.pk, monday + timedelta(days=7)), [])
+        self.assertEqual(len(schedule.working_intervals(self.doctor.pk, monday + timedelta(days=14))), 2)
+
+        # Неделя врача кэшируется: остается только запрос записей
+        with self.assertNumQueries(1):
+            DoctorDay.load(self.doctor.pk, monday)
+
+    def test_booking_follows_schedule(self):
+        self.add_shifts()
+        self.client.force_login(self.patient_user)
+
+        def post(day, hour, minute=0):
+            return self.client.post(reverse('appointment_create'), {
+                'doctor': self.doctor.pk, 'service': self.service.pk,
+                'date_time': f'{day.isoformat()}T{hour:02}:{minute:02}',
+            })
+
+        # Перерыв, конец после смены и день без приема
+        for day, hour, minute in [(self.monday, 13, 0), (self.monday, 17, 30), (self.monday + timedelta(days=1), 10, 0)]:
+            response = post(day, hour, minute)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['form'].non_field_errors(), [NOT_WORKING])
+        self.assertRedirects(post(self.monday, 14), reverse('appointment_list'), fetch_redirect_response=False)
+
+        # Сетка от начала первой смены: 9:00-12:00, перерыв, 15:00-17:00 (14:00 занято)
+        slots_path = reverse('doctor_slots_api', args=[self.doctor.pk]) + f'?date={self.monday}&service={self.service.pk}'
+        response = self.client.get(slots_path)
+        self.assertEqual((response.json()['start'], response.json()['grid']), ('09:00', '111111100000111110'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        # Удаление записи не оставляет ни одной более новой даты изменения,
+        # но освобождает время: ETag меняется, старая копия не годится
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.filter(doctor=self.doctor).delete()
+        self.assertEqual(self.client.get(slots_path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+        # Отпуск закрывает время
+        with self.captureOnCommitCallbacks(execute=True):
+            DoctorTimeOff.objects.create(
+                doctor=self.doctor, start=self.at(self.monday, 0), end=self.at(self.monday + timedelta(days=7), 0)
+            )
+        self.assertEqual(post(self.monday, 9).status_code, 200)
+        self.assertNotIn('1', self.client.get(slots_path).json()['grid'])
+
+    def test_default_hours(self):
+        # Без расписания - рабочее время клиники, и прием должен в него уложиться
+        day = self.monday + timedelta(days=2)
+        appointment = Appointment(doctor=self.doctor, service=self.service, date_time=self.at(day, 19, 30))
+        with self.assertRaisesMessage(ValidationError, NOT_WORKING):
+            appointment.save()
+        appointment.date_time = self.at(day, 19)
+        appointment.save()
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_form_constraints(self):
+        # Слот врача форма проверяет сама, остальные ограничения с врачом - модель
+        day = self.monday + timedelta(days=2)
+        Appointment.objects.create(doctor=self.doctor, service=self.service, date_time=self.at(day, 10))
+        self.client.force_login(self.patient_user)
+
+        def post(hour):
+            return self.client.post(reverse('appointment_create'), {
+                'doctor': self.doctor.pk, 'service': self.service.pk, 'date_time': f'{day.isoformat()}T{hour:02}:00',
+            })
+
+        once_a_day = models.UniqueConstraint(fields=['doctor', 'service'], name='test_doctor_service')
+        with mock.patch.object(Appointment._meta, 'constraints', [*Appointment._meta.constraints, once_a_day]):
+            response = post(12)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Услуга', response.context['form'].non_field_errors()[0])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(post(10).context['form'].non_field_errors(), [booking.SLOT_TAKEN])
+        self.assertEqual(sum('"clinic_appointment"."date_time" =' in q['sql'] for q in ctx.captured_queries), 0)
+
+
+def image_upload(name, size, mode='RGB'):
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 80, 40, 128)[:len(mode)]).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageVariantTests(TestCase):
+    """Загруженные изображения получают уменьшенные копии из очереди"""
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def create_service(self, **kwargs):
+        return Service.objects.create(name='УЗИ', slug='uzi', description='', price=2500, duration=60, **kwargs)
+
+    def test_upload_to_page(self):
+        service = self.create_service(image=image_upload('uzi.png', (1200, 800), 'RGBA'))
+        job = ImageJob.objects.get()
+        self.assertEqual((job.model, job.object_id, job.source), ('service', service.pk, service.image.name))
+        # Пока копий нет, выводится оригинал
+        self.assertEqual(catalog.get_catalog()['services'][0]['image'], {'url': service.image.url})
+
+        images.ImageWorker().run(once=True)
+        job.refresh_from_db()
+        service.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.DONE)
+        variants = service.image_variants
+        self.assertEqual(variants['source'], service.image.name)
+        self.assertEqual((variants['width'], variants['height']), (1200, 800))
+        self.assertEqual([width for width, _ in variants['formats']['image/webp']], [320, 640, 960])
+        for _, name in variants['formats']['image/jpeg']:
+            self.assertTrue(name.startswith(f"variants/{variants['digest'][:2]}/{variants['digest']}-"))
+            self.assertTrue(default_storage.exists(name))
+
+        response = self.client.get(reverse('service_list'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f"{default_storage.url(variants['formats']['image/jpeg'][-1][1])} 960w")
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, variants['placeholder'])
+
+        # Новое изображение: до обработки снова оригинал, старые копии не выводятся
+        with self.captureOnCommitCallbacks(execute=True):
+            service.image = image_upload('uzi-2.png', (300, 200))
+            service.save()
+        self.assertEqual(catalog.get_catalog()['services'][0]['image'], {'url': service.image.url})
+        images.ImageWorker().run(once=True)
+        service.refresh_from_db()
+        # Копий шире оригинала нет
+        self.assertEqual([width for width, _ in service.image_variants['formats']['image/jpeg']], [300])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            service.image = None
+            service.save()
+        self.assertEqual(Service.objects.get().image_variants, {})
+        self.assertIsNone(catalog.get_catalog()['services'][0]['image'])
+
+    def test_replaced_before_processing(self):
+        service = self.create_service(image=image_upload('uzi.png', (400, 300)))
+        service.image = image_upload('uzi-2.png', (400, 300))
+        service.save()
+        # Одна задача на объект, с последним файлом
+        self.assertEqual(list(ImageJob.objects.values_list('source', flat=True)), [service.image.name])
+
+        job = ImageJob.objects.get()
+        Service.objects.filter(pk=service.pk).update(image='services/other.png')
+        images.ImageWorker().run(once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.DONE)
+        self.assertEqual(Service.objects.get().image_variants, {})
+
+    def test_backfill_in_process_pool(self):
+        doctor = Doctor.objects.create(
+            user=User.objects.create(username='doctor', role=User.DOCTOR), specialization='Хирург', room='1',
+            photo=image_upload('doctor.png', (800, 1000)),
+        )
+        broken = self.create_service(image=SimpleUploadedFile('broken.png', b'not an image'))
+        # Изображения, загруженные до появления очереди
+        ImageJob.objects.all().delete()
+
+        out = StringIO()
+        call_command('backfill_images', processes=2, stdout=out)
+        self.assertIn('Поставлено в очередь: 2, обработано: 1', out.getvalue())
+        doctor.refresh_from_db()
+        self.assertEqual(doctor.photo_variants['source'], doctor.photo.name)
+        self.assertIn('srcset', catalog.get_catalog()['doctors'][0]['photo'])
+        failed = ImageJob.objects.get(status=ImageJob.FAILED)
+        self.assertEqual(failed.object_id, broken.pk)
+        self.assertIn('UnidentifiedImageError', failed.last_error)
+
+        # Актуальные копии повторно не делаются
+        self.assertEqual(len(images.stale_jobs()), 1)
+        self.assertEqual(len(images.stale_jobs(force=True)), 2)
+
+
+BUILD_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'clinic.assets.BuildStaticFilesStorage'},
+}
+
+
+class StaticBuildTests(TestCase):
+    """collectstatic собирает бандлы с хэшем в имени, middleware раздает их сжатыми"""
+
+    def test_minify_css(self):
+        css = """
+            /* комментарий */
+            a :hover , b > c {
+                color : red ;
+                content: "/* не комментарий */  ";
+                width: calc(100% - 10px);
+            }
+        """
+        self.assertEqual(
+            assets.minify_css(css),
+            'a :hover,b>c{color :red;content:"/* не комментарий */  ";width:calc(100% - 10px)}'
+        )
+
+    def test_sources_without_build(self):
+        html = self.client.get(reverse('doctor_list')).content.decode()
+        self.assertIn('/static/css/doctor_list.css', html)
+        self.assertIn('/static/css/style.css', html)
+        self.assertIn('/static/css/theme.css', html)
+
+    def test_build_and_serve(self):
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        build = override_settings(STATIC_BUILD=True, STATIC_ROOT=static_root.name, STORAGES=BUILD_STORAGES)
+        build.enable()
+        self.addCleanup(build.disable)
+        # Фоновые картинки из CSS в репозиторий не добавлены: сборка не падает
+        with self.assertLogs('clinic.assets', 'WARNING'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+        html = self.client.get(reverse('doctor_list')).content.decode()
+        self.assertNotIn('/static/css/style.css', html)
+        self.assertRegex(html, r'/static/images/favicon\.[0-9a-f]{12}\.ico')
+        # Ссылка на файл, которого нет в сборке, - ошибка, а не имя без хэша
+        with self.assertRaises(ValueError):
+            staticfiles_storage.url('css/missing.css')
+        path = re.search(r'href="(/static/bundles/doctor_list\.[0-9a-f]{12}\.css)"', html).group(1)
+        with open(os.path.join(static_root.name, path.removeprefix('/static/')), 'rb') as file:
+            content = file.read()
+        self.assertNotIn(b'\n    ', content)
+
+        response = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], assets.IMMUTABLE)
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), content)
+
+        response = self.client.get(path)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), content)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=f'"other", W/{etag}').status_code, 304)
+        # Сжатая копия - другие байты и другой ETag
+        gzip_response = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(gzip_response.status_code, 200)
+        self.assertNotEqual(gzip_response['ETag'], etag)
+
+        # Без хэша в имени - короткий кэш; неизвестный файл - дальше по цепочке (404)
+        self.assertEqual(self.client.get('/static/bundles/doctor_list.css')['Cache-Control'], assets.SHORT_CACHE)
+        self.assertEqual(self.client.get('/static/bundles/missing.css').status_code, 404)
+        self.assertEqual(self.client.post(path).status_code, 405)
+
+
+class EarliestSlotsTests(TestCase):
+    """Ближайшие слоты по услуге сливаются по всем врачам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(name='УЗИ', slug='uzi', description='', price=2500, duration=60)
+        cls.doctors = []
+        for i, specialization in enumerate(['Терапевт', 'Терапевт', 'Кардиолог']):
+            cls.doctors.append(Doctor.objects.create(
+                user=User.objects.create(username=f'doctor{i}', role=User.DOCTOR), specialization=specialization, room=str(i)
+            ))
+        cls.service.doctors.set(cls.doctors[:2])
+        cls.day = timezone.localdate() + timedelta(days=7)
+
+    def setUp(self):
+        cache.clear()
+
+    def at(self, day, hour, minute=0):
+        return timezone.make_aware(timezone.datetime.combine(day, time(hour, minute)))
+
+    def test_merge(self):
+        first, second, third = (doctor.pk for doctor in self.doctors)
+        # Первый врач занят с утра, второй принимает с 10:00
+        Appointment.objects.create(doctor=self.doctors[0], service=self.service, date_time=self.at(self.day, 8))
+        with self.captureOnCommitCallbacks(execute=True):
+            DoctorSchedule.objects.create(
+                doctor=self.doctors[1], weekday=self.day.weekday(), start_time=time(10), end_time=time(12),
+                valid_from=self.day,
+            )
+
+        slots = availability.earliest_slots([first, second], 60, limit=5, not_before=self.at(self.day, 0))
+        self.assertEqual(slots, [
+            (self.at(self.day, 9), first),
+            (self.at(self.day, 9, 30), first),
+            (self.at(self.day, 10), first),
+            (self.at(self.day, 10), second),
+            (self.at(self.day, 10, 30), first),
+        ])
+        # Второй врач принимает раз в неделю: после смены - только через неделю
+        next_week = self.day + timedelta(days=7)
+        slots = availability.earliest_slots([second], 60, limit=3, not_before=self.at(self.day, 11, 1))
+        self.assertEqual(slots, [
+            (self.at(next_week, 10), second), (self.at(next_week, 10, 30), second), (self.at(next_week, 11), second),
+        ])
+        self.assertEqual(availability.earliest_slots([second], 60, horizon=3, not_before=self.at(self.day, 11, 1)), [])
+
+    def test_api(self):
+        url = reverse('service_earliest_api', args=[self.service.pk])
+        data = self.client.get(url, {'limit': 4}).json()
+        self.assertEqual(len(data['slots']), 4)
+        starts = [slot['start'] for slot in data['slots']]
+        self.assertEqual(starts, sorted(starts))
+        self.assertEqual({slot['doctor'] for slot in data['slots']}, {self.doctors[0].pk, self.doctors[1].pk})
+
+        # Специализация добавляет врачей, не привязанных к услуге
+        data = self.client.get(url, {'limit': 50, 'specialization': 'Кардиолог'}).json()
+        self.assertIn(self.doctors[2].pk, {slot['doctor'] for slot in data['slots']})
+
+        self.assertEqual(self.client.get(url, {'limit': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('service_earliest_api', args=[0])).status_code, 404)
+
+
+class BookingTests(TestCase):
+    """book(): занятый слот - ValidationError, остальные ошибки базы - как есть"""
+
+    def setUp(self):
+        self.doctor = Doctor.objects.create(user=User.objects.create(username='doctor'), specialization='Терапевт', room='1')
+        self.service = Service.objects.create(name='ЭКГ', slug='ekg', description='', price=1200, duration=30)
+        self.start = timezone.make_aware(timezone.datetime.combine(timezone.localdate() + timedelta(days=7), time(10)))
+
+    def test_slot_taken(self):
+        booking.book(Appointment(doctor=self.doctor, service=self.service, date_time=self.start))
+        appointment = Appointment(doctor=self.doctor, service=self.service, date_time=self.start)
+        # Проверка занятости в save() пропущена, как при гонке двух записей
+        with mock.patch.object(Appointment, 'clean', lambda self: None), \
+                self.assertRaisesMessage(ValidationError, booking.SLOT_TAKEN):
+            booking.book(appointment)
+
+    def test_other_integrity_error(self):
+        appointment = Appointment(doctor=self.doctor, service=self.service, date_time=self.start)
+        with mock.patch.object(Appointment, 'save', side_effect=IntegrityError('NOT NULL constraint failed')), \
+                self.assertRaises(IntegrityError):
+            booking.book(appointment)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Из параллельных записей на одно время проходит ровно одна"""
+
+    THREADS = 200
+
+    def setUp(self):
+        self.doctor = Doctor.objects.create(user=User.objects.create(username='doctor'), specialization='Терапевт', room='1')
+        self.short = Service.objects.create(name='ЭКГ', slug='ekg', description='', price=1200, duration=30)
+        self.long = Service.objects.create(name='УЗИ', slug='uzi', description='', price=2500, duration=60)
+        self.start = timezone.make_aware(timezone.datetime.combine(timezone.localdate() + timedelta(days=7), time(10)))
+
+    def book_in_threads(self, make_appointment):
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def worker(i):
+            try:
+                appointment = make_appointment(i)
+                barrier.wait()
+                try:
+                    booking.book(appointment)
+                    outcomes.append('booked')
+                except ValidationError:
+                    outcomes.append('rejected')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_one_slot(self):
+        outcomes = self.book_in_threads(
+            lambda i: Appointment(doctor=self.doctor, service=self.short, date_time=self.start)
+        )
+        self.assertEqual(len(outcomes), self.THREADS)
+        self.assertEqual(outcomes.count('booked'), 1)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_overlapping_slots(self):
+        # Разное время начала: уникальное ограничение не помогает, спасает только блокировка
+        outcomes = self.book_in_threads(lambda i: Appointment(
+            doctor=self.doctor,
+            service=self.long,
+            date_time=self.start + timedelta(minutes=30 * (i % 2)),
+        ))
+        self.assertEqual(outcomes.count('booked'), 1)
+        self.assertEqual(stats.find_drift(), {})
+
+
+class AsyncUrlconf:
+    """URLconf с асинхронными версиями страниц, как при ASYNC_VIEWS=1"""
+    urlpatterns = urls.async_views + urls.common_views
+
+
+class AsyncViewTests(TestCase):
+    """Асинхронные версии страниц отдают то же, что синхронные"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = ServiceCategory.objects.create(name='Кардиология', slug='cardio')
+        cls.doctor = Doctor.objects.create(
+            user=User.objects.create(username='doctor', first_name='Мария', last_name='Сидорова', role=User.DOCTOR),
+            specialization='Кардиолог', room='1'
+        )
+        cls.service = Service.objects.create(
+            name='ЭКГ', slug='ekg', description='', price=1200, duration=60, category=category
+        )
+        Service.objects.create(name='УЗИ', slug='uzi', description='', price=2500, duration=30)
+        cls.patient_user = User.objects.create_user('patient', password='pass', role=User.CLIENT)
+        patient = Patient.objects.create(user=cls.patient_user, phone='1', birth_date=date(1990, 1, 1))
+        cls.day = timezone.localdate() + timedelta(days=7)
+        Appointment.objects.create(
+            patient=patient, doctor=cls.doctor, service=cls.service,
+            date_time=timezone.make_aware(timezone.datetime.combine(cls.day, time(10)))
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    async def async_get(self, path, user=None, **headers):
+        client = AsyncClient()
+        if user:
+            await client.aforce_login(user)
+        with override_settings(ROOT_URLCONF=AsyncUrlconf):
+            return await client.get(path, headers=headers)
+
+    def get_both(self, path, user=None):
+        if user:
+            self.client.force_login(user)
+        return self.client.get(path), async_to_sync(self.async_get)(path, user)
+
+    def test_lists_match_sync(self):
+        for path, user in [
+            (reverse('doctor_list') + '?format=json', None),
+            (reverse('service_list') + '?format=json', None),
+            (reverse('service_list') + '?format=json&category=cardio', None),
+            (reverse('service_list') + '?format=json&q=узи', None),
+            (reverse('appointment_list') + '?format=json', self.patient_user),
+        ]:
+            sync_response, async_response = self.get_both(path, user)
+            self.assertEqual(async_response.status_code, 200, path)
+            self.assertEqual(async_response.json(), sync_response.json(), path)
+            self.assertTrue(async_response.json()['results'], path)
+
+    def test_pages(self):
+        response = async_to_sync(self.async_get)(reverse('doctor_list'))
+        self.assertContains(response, 'Сидорова')
+        response = async_to_sync(self.async_get)(reverse('service_list'))
+        self.assertContains(response, 'УЗИ')
+        response = async_to_sync(self.async_get)(reverse('appointment_list'), self.patient_user)
+        self.assertContains(response, 'Сидорова')
+        self.assertEqual(async_to_sync(self.async_get)(reverse('home')).status_code, 200)
+        # Главная вошедшего пациента и список записей анонимного - перенаправления
+        response = async_to_sync(self.async_get)(reverse('home'), self.patient_user)
+        self.assertRedirects(response, reverse('patient_profile'), fetch_redirect_response=False)
+        response = async_to_sync(self.async_get)(reverse('appointment_list'))
+        self.assertEqual((response.status_code, response['Location']), (302, '/login/?next=/appointments/'))
+
+    def test_slots_match_sync(self):
+        path = reverse('doctor_slots_api', args=[self.doctor.pk]) + f'?date={self.day}&service={self.service.pk}'
+        sync_response, async_response = self.get_both(path)
+        self.assertEqual(async_response.json(), sync_response.json())
+        self.assertEqual(async_response['ETag'], sync_response['ETag'])
+        self.assertIn('0', async_response.json()['grid'])
+
+        response = async_to_sync(self.async_get)(path, if_none_match=async_response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = async_to_sync(self.async_get)(reverse('doctor_slots_api', args=[0]) + f'?date={self.day}')
+        self.assertEqual(response.status_code, 404)
@@ -1,24 +1,44 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from .views import CustomLoginView
 
-urlpatterns = [
+# Самые посещаемые страницы: синхронные версии для WSGI и асинхронные для ASGI
+sync_views = [
     path('', views.home, name='home'),
+    path('doctors/', views.DoctorListView.as_view(), name='doctor_list'),
+    path('services/', views.ServiceListView.as_view(), name='service_list'),
+    path('appointments/', views.AppointmentListView.as_view(), name='appointment_list'),
+    path('api/doctors/<int:doctor_id>/slots/', views.doctor_slots_api, name='doctor_slots_api'),
+]
 
+async_views = [
+    path('', views.async_home, name='home'),
+    path('doctors/', views.AsyncDoctorListView.as_view(), name='doctor_list'),
+    path('services/', views.AsyncServiceListView.as_view(), name='service_list'),
+    path('appointments/', views.AsyncAppointmentListView.as_view(), name='appointment_list'),
+    path('api/doctors/<int:doctor_id>/slots/', views.async_doctor_slots_api, name='doctor_slots_api'),
+]
+
+common_views = [
     path('login/', CustomLoginView.as_view(), name='custom_login'),
     path('register/', views.register_patient, name='register'),
     path('logout/', views.custom_logout, name='custom_logout'),
     path('telegram-auth/', views.telegram_auth, name='telegram_auth'),
 
-    path('doctors/', views.DoctorListView.as_view(), name='doctor_list'),
-    path('services/', views.ServiceListView.as_view(), name='service_list'),
-
     path('appointments/new/', views.AppointmentCreateView.as_view(), name='appointment_create'),
-    path('appointments/', views.AppointmentListView.as_view(), name='appointment_list'),
+
+    path('search/', views.search, name='search'),
+    path('api/search/', views.search_api, name='search_api'),
+    path('api/services/<int:service_id>/earliest/', views.service_earliest_api, name='service_earliest_api'),
 
     path('patient-profile/', views.patient_profile, name='patient_profile'),
     path('doctor-dashboard/', views.doctor_dashboard, name='doctor_dashboard'),
+    path('reports/appointments/', views.appointment_report, name='appointment_report'),
+    path('metrics', views.metrics, name='metrics'),
 
     path('login-failed/', views.login_failed, name='login_failed'),
     path('access-denied/', views.access_denied, name='access_denied'),
-]
\ No newline at end of file
+]
+
+urlpatterns = (async_views if settings.ASYNC_VIEWS else sync_views) + common_views
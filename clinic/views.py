@@ -1,12 +1,15 @@
 from .models import ServiceCategory
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-from .forms import PatientRegistrationForm, AppointmentForm
+from .forms import PatientRegistrationForm, AppointmentForm, ServiceFilterForm, ReportForm
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponse
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
@@ -14,23 +17,43 @@ from django.views import View
 from django.views.generic import ListView, CreateView, DetailView
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.db.models import Q
+from django.views.decorators.http import require_GET
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
+from datetime import datetime, time
+import hashlib
 import json
 import logging
+from asgiref.sync import sync_to_async
+from .availability import DEFAULT_DURATION, EARLIEST_HORIZON, SLOT_STEP, DoctorDay, earliest_slots
+from .pagination import AsyncKeysetListView, KeysetPaginationMixin
+from .catalog import DOCTOR_ORDERING, SERVICE_ORDERING, aget_catalog, get_catalog, serialize_service
+from .stats import get_dashboard_stats
+from . import booking, instrumentation, reports
+from . import search as search_index
 from .models import Patient, Doctor, Service, Appointment, MedicalRecord, User, TelegramAuthToken
 from .forms import AppointmentForm
 # from .services.telegram_service import telegram_service
 
 logger = logging.getLogger(__name__)
 
-def home(request):
-    """Главная страница"""
-    if request.user.is_authenticated:
-        if request.user.role == User.DOCTOR or request.user.role == User.ADMIN:
+def home_redirect(user):
+    """Куда отправить вошедшего пользователя с главной страницы"""
+    if user.is_authenticated:
+        if user.role == User.DOCTOR or user.role == User.ADMIN:
             return redirect('doctor_dashboard')
         else:
             return redirect('patient_profile')
-    
-    return render(request, 'clinic/home.html')
+
+def home(request):
+    """Главная страница"""
+    return home_redirect(request.user) or render(request, 'clinic/home.html')
+
+async def async_home(request):
+    """Главная страница (асинхронная версия для ASGI)"""
+    request.user = await request.auser()
+    return home_redirect(request.user) or render(request, 'clinic/home.html')
 
 class CustomLoginView(View):
     """Кастомная страница входа для клиентов и работников"""
@@ -130,12 +153,32 @@ def access_denied(request):
     """Страница "Доступ запрещен" """
     return render(request, 'clinic/access_denied.html')
 
-class DoctorListView(ListView):
-    """Список всех врачей"""
-    model = Doctor
+class DoctorListMixin:
+    """Общее для синхронной и асинхронной версий списка врачей"""
     template_name = 'clinic/doctor_list.html'
     context_object_name = 'doctors'
-    queryset = Doctor.objects.filter(is_active=True).order_by('specialization')
+    # Кэш каталога уже отсортирован в этом порядке
+    keyset_ordering = DOCTOR_ORDERING
+    
+    def serialize_object(self, doctor):
+        return {
+            'id': doctor['id'],
+            'full_name': doctor['full_name'],
+            'specialization': doctor['specialization'],
+            'room': doctor['room'],
+        }
+
+class DoctorListView(DoctorListMixin, KeysetPaginationMixin, ListView):
+    """Список всех врачей"""
+    
+    def get_queryset(self):
+        return get_catalog()['doctors']
+
+class AsyncDoctorListView(DoctorListMixin, AsyncKeysetListView):
+    """Список всех врачей (асинхронная версия для ASGI)"""
+    
+    async def get_queryset(self):
+        return (await aget_catalog())['doctors']
 
 class DoctorDetailView(DetailView):
     """Детальная информация о враче"""
@@ -143,17 +186,111 @@ class DoctorDetailView(DetailView):
     template_name = 'clinic/doctor_detail.html'
     context_object_name = 'doctor'
 
-class ServiceListView(ListView):
-    """Список всех услуг"""
-    model = Service
+class ServiceListMixin:
+    """Общее для синхронной и асинхронной версий каталога услуг"""
     template_name = 'clinic/service_list.html'
     context_object_name = 'services'
-    queryset = Service.objects.filter(is_active=True).order_by('order', 'name')
+    keyset_ordering = SERVICE_ORDERING
+    
+    # Сортировки каталога: ключ keyset-пагинации для каждой
+    SORTS = {
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        'popular': ('-is_popular', 'order', 'name', 'id'),
+    }
+    
+    def filter_services(self):
+        """Услуги по фильтрам из запроса: список из кэша или queryset"""
+        filters = ServiceFilterForm(self.request.GET).get_filters()
+        if not filters:
+            # Без фильтров - готовый кэш каталога, уже отсортированный по order, name, id
+            return self.catalog['services']
+        
+        # С фильтрами - выборка в БД (индексы service_category_active_idx и service_price_idx)
+        queryset = Service.objects.filter(is_active=True).select_related('category').only(
+            'name', 'slug', 'description', 'price', 'duration', 'icon', 'image', 'image_variants',
+            'is_popular', 'order', 'category__name', 'category__slug'
+        )
+        if 'category' in filters:
+            category_ids = [
+                c['id'] for c in self.catalog['categories']
+                if c['slug'].lower() == filters['category'].lower()
+            ]
+            queryset = queryset.filter(category_id__in=category_ids)
+        if 'min_price' in filters:
+            queryset = queryset.filter(price__gte=filters['min_price'])
+        if 'max_price' in filters:
+            queryset = queryset.filter(price__lte=filters['max_price'])
+        if 'popular' in filters:
+            queryset = queryset.filter(is_popular=True)
+        if 'q' in filters:
+            # Через поисковый индекс: LIKE в SQLite не различает регистр только для латиницы
+            ids = search_index.ids_subquery(search_index.SERVICE, filters['q'])
+            if ids is None:
+                queryset = queryset.filter(
+                    Q(name__icontains=filters['q']) | Q(description__icontains=filters['q'])
+                )
+            else:
+                queryset = queryset.filter(pk__in=ids)
+        if 'sort' in filters:
+            self.keyset_ordering = self.SORTS[filters['sort']]
+        return queryset
+    
+    def catalog_rows(self, rows):
+        # Карточки из выборки в БД - в том же виде, что и из кэша каталога
+        return [row if isinstance(row, dict) else serialize_service(row) for row in rows]
+    
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, rows, is_paginated = super().paginate_queryset(queryset, page_size)
+        return paginator, page, self.catalog_rows(rows), is_paginated
+    
+    async def paginate(self, queryset):
+        rows, next_cursor = await super().paginate(queryset)
+        return self.catalog_rows(rows), next_cursor
+    
+    def get_template_names(self):
+        # HTML-фрагмент с карточками для обновления страницы без перезагрузки
+        if self.request.GET.get('format') == 'fragment':
+            return ['clinic/service_cards.html']
+        return super().get_template_names()
+    
+    def serialize_object(self, service):
+        return {
+            'id': service['id'],
+            'name': service['name'],
+            'slug': service['slug'],
+            'price': str(service['price']),
+            'duration': service['duration'],
+            'is_popular': service['is_popular'],
+            'category': service['category']['slug'] if service['category'] else None,
+        }
+    
+class ServiceListView(ServiceListMixin, KeysetPaginationMixin, ListView):
+    """Список всех услуг"""
+    
+    def get_queryset(self):
+        self.catalog = get_catalog()
+        return self.filter_services()
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Добавляем категории в контекст
-        context['categories'] = ServiceCategory.objects.all().order_by('order', 'name')
+        context['categories'] = self.catalog['categories']
+        return context
+
+class AsyncServiceListView(ServiceListMixin, AsyncKeysetListView):
+    """Список всех услуг (асинхронная версия для ASGI)"""
+    
+    async def get_queryset(self):
+        self.catalog = await aget_catalog()
+        if self.request.GET.get('q'):
+            # Поисковый индекс читается синхронным курсором
+            return await sync_to_async(self.filter_services)()
+        return self.filter_services()
+    
+    async def get_context_data(self, object_list, next_cursor):
+        context = await super().get_context_data(object_list, next_cursor)
+        context['categories'] = self.catalog['categories']
         return context
 
 @method_decorator(login_required(login_url='/login/'), name='dispatch')
@@ -176,11 +313,13 @@ class AppointmentCreateView(CreateView):
             form.instance.patient = patient
             form.instance.status = 'pending'
             
-            if not form.instance.is_time_available():
-                messages.error(self.request, 'Врач занят в это время. Выберите другое время.')
+            # Проверка занятости и сохранение - под блокировкой расписания врача
+            try:
+                self.object = booking.book(form.instance)
+            except ValidationError as e:
+                messages.error(self.request, e.messages[0])
                 return self.form_invalid(form)
-            
-            response = super().form_valid(form)
+            response = redirect(self.get_success_url())
             
             if patient.telegram_id:
                 patient.send_telegram_reminder(form.instance)
@@ -192,20 +331,214 @@ class AppointmentCreateView(CreateView):
             messages.error(self.request, 'Профиль пациента не найден. Сначала заполните профиль.')
             return redirect('patient_profile')
 
-class AppointmentListView(LoginRequiredMixin, ListView):
-    """Список записей текущего пациента"""
-    model = Appointment
+class AppointmentListMixin:
+    """Общее для синхронной и асинхронной версий списка записей пациента"""
     template_name = 'clinic/appointment_list.html'
     context_object_name = 'appointments'
+    keyset_ordering = ('-date_time', '-id')
     
     def get_queryset(self):
-        try:
-            patient = Patient.objects.get(user=self.request.user)
-            return Appointment.objects.filter(
-                patient=patient
-            ).order_by('-date_time')
-        except Patient.DoesNotExist:
-            return Appointment.objects.none()
+        # Фильтр по пользователю через join: без профиля пациента список просто пуст
+        return Appointment.objects.filter(
+            patient__user=self.request.user
+        ).select_related('doctor__user', 'service')
+    
+    def serialize_object(self, appointment):
+        return {
+            'id': appointment.pk,
+            'doctor': appointment.doctor.user.get_full_name(),
+            'service': appointment.service.name,
+            'date_time': appointment.date_time.isoformat(),
+            'status': appointment.status,
+            'status_display': appointment.get_status_display(),
+        }
+
+class AppointmentListView(LoginRequiredMixin, AppointmentListMixin, KeysetPaginationMixin, ListView):
+    """Список записей текущего пациента"""
+    model = Appointment
+
+class AsyncAppointmentListView(AppointmentListMixin, AsyncKeysetListView):
+    """Список записей текущего пациента (асинхронная версия для ASGI)"""
+    
+    async def get(self, request, *args, **kwargs):
+        if not (await request.auser()).is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await super().get(request, *args, **kwargs)
+    
+    async def get_queryset(self):
+        return super().get_queryset()
+
+def parse_slots_request(request):
+    """День и услуга из запроса сетки слотов: (day, service_id, ответ с ошибкой)"""
+    try:
+        day = parse_date(request.GET.get('date', ''))
+    except ValueError:
+        day = None
+    if day is None:
+        return None, None, JsonResponse({'status': 'error', 'message': 'Укажите дату в формате ГГГГ-ММ-ДД'}, status=400)
+    
+    service_id = request.GET.get('service', '')
+    if service_id and not service_id.isdigit():
+        return None, None, service_not_found()
+    return day, service_id, None
+
+def doctor_not_found():
+    return JsonResponse({'status': 'error', 'message': 'Врач не найден'}, status=404)
+
+def service_not_found():
+    return JsonResponse({'status': 'error', 'message': 'Услуга не найдена'}, status=404)
+
+@require_GET
+def doctor_slots_api(request, doctor_id):
+    """Сетка свободных слотов врача на день (JSON)"""
+    day, service_id, error = parse_slots_request(request)
+    if error:
+        return error
+    
+    if not Doctor.objects.filter(pk=doctor_id, is_active=True).exists():
+        return doctor_not_found()
+    
+    duration = DEFAULT_DURATION
+    if service_id:
+        duration = Service.objects.filter(pk=service_id).values_list('duration', flat=True).first()
+        if duration is None:
+            return service_not_found()
+    
+    return slots_response(request, DoctorDay.load(doctor_id, day), duration)
+
+@require_GET
+async def async_doctor_slots_api(request, doctor_id):
+    """Сетка свободных слотов врача на день (асинхронная версия для ASGI)"""
+    day, service_id, error = parse_slots_request(request)
+    if error:
+        return error
+    
+    if not await Doctor.objects.filter(pk=doctor_id, is_active=True).aexists():
+        return doctor_not_found()
+    
+    duration = DEFAULT_DURATION
+    if service_id:
+        duration = await Service.objects.filter(pk=service_id).values_list('duration', flat=True).afirst()
+        if duration is None:
+            return service_not_found()
+    
+    return slots_response(request, await DoctorDay.aload(doctor_id, day), duration)
+
+def slots_response(request, doctor_day, duration):
+    """Ответ с сеткой слотов и заголовками для условных запросов"""
+    day = doctor_day.day
+    doctor_id = doctor_day.doctor_id
+    start, end = doctor_day.bounds()
+    slots = doctor_day.free_slots(duration, not_before=timezone.now())
+    
+    # Сетка: символ на каждый шаг рабочего дня, '1' - с этого времени можно записаться
+    grid = ['0'] * int((end - start) / SLOT_STEP)
+    for slot in slots:
+        grid[int((slot - start) / SLOT_STEP)] = '1'
+    
+    data = {
+        'doctor': doctor_id,
+        'date': day.isoformat(),
+        'start': timezone.localtime(start).strftime('%H:%M'),
+        'step': int(SLOT_STEP.total_seconds() // 60),
+        'duration': duration,
+        'grid': ''.join(grid),
+    }
+    
+    # Только ETag от содержимого: сетка меняется и без изменения записей
+    # (расписание, отпуск, удаление записи, прошедшее время), и дата
+    # последнего изменения записей для Last-Modified устаревает
+    etag = '"%s"' % hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(data)
+    
+    response['ETag'] = etag
+    # Кэшировать можно, но перед использованием нужно перепроверить
+    patch_cache_control(response, no_cache=True)
+    return response
+
+# Ограничения запроса ближайших слотов
+EARLIEST_MAX_LIMIT = 50
+EARLIEST_MAX_DAYS = 90
+
+@require_GET
+def service_earliest_api(request, service_id):
+    """Ближайшие свободные слоты по услуге у всех врачей, которые ее оказывают (JSON)
+
+    ?specialization= добавляет врачей этой специализации, ?limit= и ?days= -
+    число слотов и горизонт поиска в днях.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), EARLIEST_MAX_LIMIT)
+        days = min(max(int(request.GET.get('days', EARLIEST_HORIZON)), 1), EARLIEST_MAX_DAYS)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'limit и days должны быть числами'}, status=400)
+    
+    # Услуга и врачи - из кэша каталога, из БД только связи услуги с врачами
+    catalog = get_catalog()
+    service = next((s for s in catalog['services'] if s['id'] == service_id), None)
+    if service is None:
+        return service_not_found()
+    doctors = {d['id']: d for d in catalog['doctors']}
+    
+    linked = Service.doctors.through.objects.filter(service_id=service_id).values_list('doctor_id', flat=True)
+    doctor_ids = {doctor_id for doctor_id in linked if doctor_id in doctors}
+    specialization = request.GET.get('specialization', '').strip()
+    if specialization:
+        doctor_ids.update(d['id'] for d in doctors.values() if d['specialization'] == specialization)
+    
+    slots = earliest_slots(sorted(doctor_ids), service['duration'], limit=limit, horizon=days)
+    response = JsonResponse({
+        'service': service_id,
+        'duration': service['duration'],
+        'slots': [
+            {
+                'doctor': doctor_id,
+                'doctor_name': doctors[doctor_id]['full_name'],
+                'specialization': doctors[doctor_id]['specialization'],
+                'room': doctors[doctor_id]['room'],
+                'start': timezone.localtime(start).isoformat(),
+            }
+            for start, doctor_id in slots
+        ],
+    })
+    patch_cache_control(response, no_cache=True)
+    return response
+
+@require_GET
+def search(request):
+    """Поиск врачей и услуг"""
+    query = request.GET.get('q', '').strip()
+    results = search_index.search(query) if query else []
+    return render(request, 'clinic/search.html', {
+        'query': query,
+        'doctors': [r for r in results if r['kind'] == search_index.DOCTOR],
+        'services': [r for r in results if r['kind'] == search_index.SERVICE],
+    })
+
+@require_GET
+def search_api(request):
+    """Подсказки при вводе в строку поиска (JSON)"""
+    kind = request.GET.get('kind') or None
+    if kind and kind not in search_index.KIND_CODES:
+        return JsonResponse({'status': 'error', 'message': 'Неизвестный тип объекта'}, status=400)
+    
+    results = search_index.search(request.GET.get('q', ''), kind=kind, limit=search_index.TYPEAHEAD_LIMIT)
+    response = JsonResponse({'results': results})
+    # Подсказки по одному и тому же префиксу запрашиваются часто
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+@require_GET
+def metrics(request):
+    """Счетчики запросов процесса в формате Prometheus"""
+    if not settings.INSTRUMENTATION:
+        raise Http404
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS):
+        return HttpResponse(status=403)
+    return HttpResponse(instrumentation.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @login_required
 def patient_profile(request):
@@ -221,10 +554,10 @@ def patient_profile(request):
             return redirect('home')
     
     try:
-        patient = Patient.objects.get(user=request.user)
+        patient = Patient.objects.select_related('user').get(user=request.user)
         appointments = Appointment.objects.filter(
             patient=patient
-        ).order_by('-date_time')[:5]
+        ).select_related('doctor__user').order_by('-date_time')[:5]
         
         return render(request, 'clinic/patient_profile.html', {
             'patient': patient,
@@ -252,17 +585,13 @@ def doctor_dashboard(request):
     try:
         doctor = Doctor.objects.get(user=request.user)
         
-        today = timezone.now().date()
-        appointments_today = Appointment.objects.filter(
-            doctor=doctor,
-            date_time__date=today,
-            status__in=['confirmed', 'pending']
-        ).count()
-        
-        total_appointments = Appointment.objects.filter(doctor=doctor).count()
+        # Счетчики из DoctorDailyStats: две строки вместо COUNT по истории
+        doctor_stats = get_dashboard_stats(doctor.pk)
+        appointments_today = doctor_stats['today'].active
+        total_appointments = doctor_stats['all_time'].total
         recent_appointments = Appointment.objects.filter(
             doctor=doctor
-        ).order_by('-date_time')[:5]
+        ).select_related('patient__user', 'service').order_by('-date_time')[:5]
         
         return render(request, 'clinic/doctor_dashboard.html', {
             'doctor': doctor,
@@ -285,6 +614,41 @@ def doctor_dashboard(request):
         
         return redirect('access_denied')
 
+@login_required
+@require_GET
+def appointment_report(request):
+    """Выгрузка отчета по записям в CSV/XLSX (администратор - по всем врачам, врач - по себе)"""
+    doctor_id = None
+    if not (request.user.is_staff or request.user.role == User.ADMIN):
+        if request.user.role != User.DOCTOR:
+            return redirect('access_denied')
+        doctor_id = Doctor.objects.filter(user=request.user).values_list('pk', flat=True).first()
+        if doctor_id is None:
+            return redirect('access_denied')
+    
+    form = ReportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
+    
+    params = form.cleaned_data
+    group_by = params['group_by'] or ['doctor']
+    period = params['period'] or None
+    tz = timezone.get_current_timezone()
+    date_from = params['date_from'] and timezone.make_aware(datetime.combine(params['date_from'], time.min), tz)
+    date_to = params['date_to'] and timezone.make_aware(datetime.combine(params['date_to'], time.min), tz)
+    
+    queryset = reports.appointment_report(date_from, date_to, group_by, period, doctor_id=doctor_id)
+    columns = reports.report_columns(group_by, period)
+    content_type, stream = reports.FORMATS[params['format']]
+    
+    response = StreamingHttpResponse(
+        stream([label for field, label in columns], reports.report_rows(queryset, columns)),
+        content_type=content_type
+    )
+    filename = f"appointments-{timezone.localdate():%Y%m%d}.{params['format']}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @csrf_exempt
 def telegram_webhook(request):
     """Webhook для обработки сообщений от Telegram"""
@@ -475,7 +839,7 @@ def appointment_create(request):
                 patient = Patient.objects.get(user=request.user)
                 appointment.patient = patient
                 appointment.status = 'pending'
-                appointment.save()
+                booking.book(appointment)
                 
                 # Отправляем уведомление в Telegram
                 if patient.telegram_id:
@@ -487,6 +851,8 @@ def appointment_create(request):
             except Patient.DoesNotExist:
                 messages.error(request, 'Профиль пациента не найден. Сначала заполните профиль.')
                 return redirect('patient_profile')
+            except ValidationError as e:
+                messages.error(request, e.messages[0])
     else:
         form = AppointmentForm(user=request.user)
     